@@ -0,0 +1,198 @@
+import copy
+import numpy as np
+import pandas as pd
+from time_bins import NO_SELECTION, seconds_of_day
+
+# Precomputed count cubes for the sidebar tables and count based graphs.
+# Built once per data load from the store's integer codes:
+#   types[unit slot, month, hour, TYPE]          incident type totals
+#   locations[unit slot, month, hour, LOCATION]  location totals
+# Unit slot 0 counts every incident once, slot k+1 counts the incidents unit k
+# responded to. A dropdown selection is answered by slicing and summing these
+# arrays, so its cost does not grow with the number of incidents. A full
+# location x type x unit x month x hour cube would be (locations x types)
+# times larger than these marginals, which are all the graphs need.
+# Date ranges are answered from their rows instead (one contiguous slice of
+# the time ordered store), as a year x month axis would multiply the cube size
+# by the number of years.
+#
+# Appended incidents are not added to the cubes, which the cubes of the stores
+# before the append share. They are kept as recent rows and counted from the
+# rows on every query, until FOLD_ROWS of them have been appended and the
+# cubes are copied once with them added.
+
+FOLD_ROWS = 1 << 16
+
+
+# hours [start, end) covered by a whole-hour time selection plus the hour whose
+# HH:00:00 incidents are included by the inclusive end (between_time semantics),
+# or None if a time is not on the hour and the rows have to be scanned
+def hour_selection(time1, time2):
+    if time1 in NO_SELECTION and time2 in NO_SELECTION:
+        return np.ones(24, dtype=bool), None
+    start = 0 if time1 in NO_SELECTION else seconds_of_day(time1)
+    end = None if time2 in NO_SELECTION else seconds_of_day(time2)
+    if start % 3600 or (end is not None and end % 3600):
+        return None
+
+    hours = np.zeros(24, dtype=bool)
+    start_hour = start // 3600
+    end_hour = 24 if end is None else end // 3600
+    if start_hour <= end_hour:
+        hours[start_hour:end_hour] = True
+    else:
+        hours[start_hour:] = True
+        hours[:end_hour] = True
+    return hours, (None if end is None else end_hour)
+
+
+class IncidentCube:
+
+    def __init__(self, store):
+        self.store = store
+        n_slots = len(store.unit_names) + 1
+        self.types = np.zeros((n_slots, 12, 24, len(store.type_names)), dtype=np.int32)
+        self.locations = np.zeros((n_slots, 12, 24, len(store.location_names)), dtype=np.int32)
+        rows = np.arange(len(store))
+        self._add(self.types, self.locations, rows)
+        # rows appended after the cubes were built, which they do not count
+        self.recent = rows[:0]
+        # rows stamped exactly on each hour, for the inclusive end of a time range
+        self.on_hour = [rows[:0] for _ in range(24)]
+        self._add_on_hour(rows)
+
+    # count rows of the store into types and locations
+    def _add(self, types, locations, rows):
+        store = self.store
+        month = store.month_codes[rows].astype(np.intp)
+        hour = (store.sod[rows] // 3600).astype(np.intp)
+        type_codes = store.type_codes[rows]
+        location_codes = store.location_codes[rows]
+        for slot in range(len(store.unit_names) + 1):
+            keep = slice(None) if slot == 0 else store.unit_mask.has(store.unit_names[slot - 1], rows)
+            for cube, codes in ((types, type_codes), (locations, location_codes)):
+                flat = (month[keep]*24 + hour[keep])*cube.shape[3] + codes[keep]
+                cube[slot] += np.bincount(flat, minlength=cube[slot].size).reshape(cube.shape[1:]).astype(np.int32)
+
+    def _add_on_hour(self, rows):
+        sod = self.store.sod[rows]
+        exact = sod % 3600 == 0
+        hour = sod // 3600
+        for h in np.unique(hour[exact]):
+            self.on_hour[h] = np.concatenate([self.on_hour[h], rows[exact & (hour == h)]])
+
+    # a copy for store with its new rows added, this cube is left unchanged
+    def extended(self, store, rows):
+        cube = copy.copy(self)
+        cube.store = store
+        cube.recent = np.concatenate([self.recent, rows])
+        cube.on_hour = list(self.on_hour)
+        cube._add_on_hour(rows)
+        if len(cube.recent) >= FOLD_ROWS:
+            cube.types, cube.locations = cube.dense()
+            cube.recent = cube.recent[:0]
+        return cube
+
+    # the types and locations cubes with the recent rows added, for every unit,
+    # type and location of the store (copies when there are recent rows)
+    def dense(self):
+        if len(self.recent) == 0:
+            return self.types, self.locations
+        store = self.store
+        n_slots = len(store.unit_names) + 1
+        types = self._grown(self.types, n_slots, len(store.type_names))
+        locations = self._grown(self.locations, n_slots, len(store.location_names))
+        self._add(types, locations, self.recent)
+        return types, locations
+
+    @staticmethod
+    def _grown(cube, n_slots, n_codes):
+        grown = np.zeros((n_slots,) + cube.shape[1:3] + (n_codes,), dtype=cube.dtype)
+        grown[:cube.shape[0], ..., :cube.shape[3]] = cube
+        return grown
+
+    # the recent rows in a month (1-12, all months for no selection), for a
+    # unit and within an hours of the day mask
+    def _recent(self, month, unit, hours):
+        store = self.store
+        rows = self.recent
+        if len(rows) == 0:
+            return rows
+        if month not in NO_SELECTION:
+            rows = rows[store.month_codes[rows] == month - 1]
+        if unit is not None:
+            rows = store.unit_filter(rows, unit)
+        return rows[hours[store.sod[rows] // 3600]]
+
+    def _counts(self, cube, codes, n_codes, time1, time2, month, unit, dates=None):
+        store = self.store
+        selection = hour_selection(time1, time2)
+        if selection is None or dates is not None:
+            rows = store.select(time1, time2, month, unit, dates)
+            return np.bincount(codes[rows], minlength=n_codes)
+
+        hours, end_hour = selection
+        slot = 0 if unit is None else store.unit_names.index(unit) + 1
+        months = slice(None) if month in NO_SELECTION else slice(month - 1, month)
+        counts = np.zeros(n_codes, dtype=np.int64)
+        if slot < len(cube):
+            counts[:cube.shape[3]] = cube[slot, months][:, hours].sum(axis=(0, 1), dtype=np.int64)
+        counts += np.bincount(codes[self._recent(month, unit, hours)], minlength=n_codes)
+
+        if end_hour is not None and end_hour < 24:
+            rows = self.on_hour[end_hour]
+            if month not in NO_SELECTION:
+                rows = rows[store.month_codes[rows] == month - 1]
+            if unit is not None:
+                rows = store.unit_filter(rows, unit)
+            counts += np.bincount(codes[rows], minlength=n_codes)
+        return counts
+
+    # incidents per location, largest first, locations with no incidents dropped
+    def location_counts(self, time1='', time2='', month=0, unit=None, dates=None):
+        names = self.store.location_names
+        counts = self._counts(self.locations, self.store.location_codes, len(names), time1, time2, month, unit, dates)
+        return self._series(counts, names, 'LOCATION')
+
+    # incidents per type (null types left out like value_counts), largest
+    # first or, unsorted, in the order the types first appear in the data
+    def type_counts(self, time1='', time2='', month=0, unit=None, sort=True, dates=None):
+        names = self.store.type_names
+        counts = self._counts(self.types, self.store.type_codes, len(names), time1, time2, month, unit, dates)
+        return self._series(counts, names, 'TYPE', sort)
+
+    # incidents per hour of the day with a non-null TYPE
+    def hour_counts(self, time1='', time2='', month=0, unit=None, dates=None):
+        store = self.store
+        selection = hour_selection(time1, time2)
+        valid = store.type_names.notna()
+        if selection is None or dates is not None:
+            rows = store.select(time1, time2, month, unit, dates)
+            rows = rows[valid[store.type_codes[rows]]]
+            return np.bincount(store.sod[rows] // 3600, minlength=24)
+
+        hours, end_hour = selection
+        slot = 0 if unit is None else store.unit_names.index(unit) + 1
+        months = slice(None) if month in NO_SELECTION else slice(month - 1, month)
+        counts = np.zeros(24, dtype=np.int64)
+        if slot < len(self.types):
+            counts += self.types[slot, months][..., valid[:self.types.shape[3]]].sum(axis=(0, 2), dtype=np.int64)
+        rows = self._recent(month, unit, hours)
+        counts += np.bincount(store.sod[rows[valid[store.type_codes[rows]]]] // 3600, minlength=24)
+        counts[~hours] = 0
+        if end_hour is not None and end_hour < 24:
+            counts[end_hour] += self._counts(self.types, store.type_codes, len(valid), time2, time2,
+                                             month, unit)[valid].sum()
+        return counts
+
+    # total incidents each unit responded to
+    def unit_totals(self):
+        totals = self.store.unit_mask.totals(self.recent)
+        totals.iloc[:len(self.types) - 1] += self.types[1:].sum(axis=(1, 2, 3))
+        return totals
+
+    @staticmethod
+    def _series(counts, names, name, sort=True):
+        counts = pd.Series(counts, index=names, name=name)
+        counts = counts[counts.index.notna() & (counts > 0)]
+        return counts.sort_values(ascending=False, kind='stable') if sort else counts
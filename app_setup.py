@@ -1,4 +1,4 @@
-import os, pkg_resources, subprocess, sys
+import importlib.util, subprocess, sys
 
 # install the necessary modules and libraries to run python application
 # create set of needed libraries and modules for the app
@@ -6,13 +6,13 @@ apps = {'dash',
         'numpy',
         'pandas',
         'plotly',
-        'dash_bootstrap_components'
+        'dash_bootstrap_components',
+        'orjson'
        }
 
-# use pkg_resources module to verify modules that are already present
-# and if not, install them...
-installed = {pkg.key for pkg in pkg_resources.working_set}
-missing = apps - installed
+# look each module up on the import path (without importing it or scanning every
+# installed distribution like pkg_resources does) and install the missing ones...
+missing = {app for app in apps if importlib.util.find_spec(app) is None}
 
 if missing:
     python = sys.executable
@@ -0,0 +1,230 @@
+// Client side redraw of the hourly, type and location bar graphs from the
+// count cubes clientside.py sends to the 'aggregate' store (DFD_CLIENTSIDE=1).
+// The counts follow IncidentCube (aggregates.py) and the titles and location
+// cut-offs the figure builders of responses.py. Date ranges are left to the
+// server.
+
+(function () {
+    const ARRAYS = {u1: Uint8Array, u2: Uint16Array, i4: Int32Array, u4: Uint32Array};
+    const NO_SELECTION = ['', '--', 0, null, undefined];
+
+    // base64 typed array ({dtype, bdata}) or plain list
+    function decode(values) {
+        if (Array.isArray(values)) {
+            return values;
+        }
+        const bytes = Uint8Array.from(atob(values.bdata), c => c.charCodeAt(0));
+        return new ARRAYS[values.dtype](bytes.buffer);
+    }
+
+    // decoded cubes, kept per data version
+    let decoded = null;
+
+    function cubes(aggregate) {
+        if (!decoded || decoded.version !== aggregate.version) {
+            decoded = {version: aggregate.version};
+            for (const name of ['types', 'locations', 'types_on_hour', 'locations_on_hour']) {
+                const cube = aggregate[name];
+                // flat indexes from their gaps
+                const index = Float64Array.from(decode(cube.step));
+                for (let i = 1; i < index.length; i++) {
+                    index[i] += index[i - 1];
+                }
+                decoded[name] = {shape: cube.shape, index: index, count: decode(cube.count)};
+            }
+        }
+        return decoded;
+    }
+
+    function secondsOfDay(hms) {
+        const [h, m, s] = hms.split(':').map(Number);
+        return h * 3600 + m * 60 + s;
+    }
+
+    // [hours mask, hour of the inclusive end or null], null when a time is
+    // not on the hour (aggregates.hour_selection)
+    function hourSelection(time1, time2) {
+        const hours = new Array(24).fill(true);
+        if (NO_SELECTION.includes(time1) && NO_SELECTION.includes(time2)) {
+            return [hours, null];
+        }
+        const start = NO_SELECTION.includes(time1) ? 0 : secondsOfDay(time1);
+        const end = NO_SELECTION.includes(time2) ? null : secondsOfDay(time2);
+        if (start % 3600 || (end !== null && end % 3600)) {
+            return null;
+        }
+        hours.fill(false);
+        const startHour = start / 3600;
+        const endHour = end === null ? 24 : end / 3600;
+        for (let h = 0; h < 24; h++) {
+            hours[h] = startHour <= endHour ? h >= startHour && h < endHour : h >= startHour || h < endHour;
+        }
+        return [hours, end === null ? null : endHour];
+    }
+
+    // first position in a sorted index at or past value
+    function lowerBound(index, value) {
+        let low = 0, high = index.length;
+        while (low < high) {
+            const mid = (low + high) >> 1;
+            if (index[mid] < value) {
+                low = mid + 1;
+            } else {
+                high = mid;
+            }
+        }
+        return low;
+    }
+
+    // cells of one unit slot as (month, hour, code, count) to f
+    function eachCell(cube, slot, f) {
+        const n = cube.shape[3];
+        const size = 12 * 24 * n;
+        const first = lowerBound(cube.index, slot * size);
+        const last = lowerBound(cube.index, (slot + 1) * size);
+        for (let i = first; i < last; i++) {
+            const flat = cube.index[i] - slot * size;
+            const code = flat % n;
+            const rest = (flat - code) / n;
+            const hour = rest % 24;
+            f((rest - hour) / 24, hour, code, cube.count[i]);
+        }
+    }
+
+    // counts per code of a month (0 for all) and hour selection
+    // (IncidentCube._counts)
+    function codeCounts(cube, onHour, slot, month, hours, endHour) {
+        const counts = new Array(cube.shape[3]).fill(0);
+        eachCell(cube, slot, (m, hour, code, count) => {
+            if ((month === 0 || m === month - 1) && hours[hour]) {
+                counts[code] += count;
+            }
+        });
+        if (endHour !== null && endHour < 24) {
+            eachCell(onHour, slot, (m, hour, code, count) => {
+                if ((month === 0 || m === month - 1) && hour === endHour) {
+                    counts[code] += count;
+                }
+            });
+        }
+        return counts;
+    }
+
+    // incidents with a type per hour of the day (IncidentCube.hour_counts)
+    function hourCounts(aggregate, data, slot, month, hours, endHour) {
+        const counts = new Array(24).fill(0);
+        const valid = aggregate.type_names.map(name => name !== null);
+        eachCell(data.types, slot, (m, hour, code, count) => {
+            if ((month === 0 || m === month - 1) && hours[hour] && valid[code]) {
+                counts[hour] += count;
+            }
+        });
+        if (endHour !== null && endHour < 24) {
+            eachCell(data.types_on_hour, slot, (m, hour, code, count) => {
+                if ((month === 0 || m === month - 1) && hour === endHour && valid[code]) {
+                    counts[hour] += count;
+                }
+            });
+        }
+        return counts;
+    }
+
+    // styled figure of a graph with its bars and title
+    function figure(aggregate, graph, x, y, colors, title) {
+        const result = JSON.parse(JSON.stringify(aggregate.figures[graph]));
+        const trace = result.data[0];
+        trace.x = x;
+        trace.y = y;
+        if (colors) {
+            trace.marker = Object.assign(trace.marker || {}, {color: colors});
+        }
+        result.layout.title = Object.assign(result.layout.title || {}, {text: title});
+        return result;
+    }
+
+    // incident_type_total
+    function typeGraph(aggregate, counts, unit) {
+        const codes = counts.map((count, code) => code)
+            .filter(code => aggregate.type_names[code] !== null && counts[code] > 0);
+        return figure(aggregate, 'incidenttype',
+                      codes.map(code => aggregate.type_names[code]),
+                      codes.map(code => counts[code]),
+                      codes.map(code => aggregate.type_colors[code]),
+                      unit ? `${unit} Incident Count by Type` : 'Total Incidents for the Danbury Fire Department');
+    }
+
+    // incident_locations (no date range)
+    function locationGraph(aggregate, counts, unit, t1, t2, mon) {
+        const times = aggregate.times.slice(1);
+        let minimum = 1;
+        let title;
+        if (!times.includes(t1) && !times.includes(t2) && !aggregate.monthname.slice(1).includes(mon)) {
+            minimum = unit ? 5 : 20;
+            title = unit ? `Total Number of Responses per Location by ${unit} with 5 or more Responses`
+                         : 'Total Number of Incidents per Location with 20 or more Responses';
+        } else {
+            title = unit ? `Total Number of Responses per Location by ${unit}` : 'Total Number of Responses per Location';
+        }
+        // largest first, ties in code order like a stable sort_values
+        const codes = counts.map((count, code) => code)
+            .filter(code => aggregate.location_names[code] !== null && counts[code] >= minimum)
+            .sort((a, b) => counts[b] - counts[a]);
+        return figure(aggregate, 'incidentlocation',
+                      codes.map(code => aggregate.location_names[code]),
+                      codes.map(code => counts[code]),
+                      codes.map(code => aggregate.location_colors[code]),
+                      title);
+    }
+
+    // time_period_totals
+    function timeGraph(aggregate, counts, unit, t1, t2, mon) {
+        const times = aggregate.times.slice(1);
+        const month = aggregate.monthname.slice(1).includes(mon);
+        let title;
+        if (month && !times.includes(t1) && !times.includes(t2)) {
+            title = unit ? `Total Number of Incidents for ${unit} per Hourly Period for the Month of ${mon}`
+                         : `Total Number of Incidents per Hourly Period for the Month of ${mon}`;
+        } else if ((!month && !times.includes(t1)) || !times.includes(t2)) {
+            title = unit ? `Total Number of Incidents per Hourly Period for ${unit}`
+                         : 'Total Number of Incidents per Hourly Period';
+        } else {
+            title = unit ? `Total Number of Incidents per Hourly Period from ${t1} to ${t2} for ${unit}`
+                         : `Total Number of Incidents per Hourly Period from ${t1} to ${t2}`;
+        }
+        return figure(aggregate, 'timeperiod', aggregate.hourly_labels, counts, null, title);
+    }
+
+    window.dash_clientside = Object.assign({}, window.dash_clientside, {
+        dfd: {
+            // location, type and hourly bar graphs of a dropdown selection
+            dropdownGraphs: function (time1, time2, month, company, startDate, endDate, aggregate) {
+                const noUpdate = window.dash_clientside.no_update;
+                if (!aggregate || startDate || endDate) {
+                    return [noUpdate, noUpdate, noUpdate];
+                }
+                const selection = hourSelection(aggregate.hours[time1], aggregate.hours[time2]);
+                if (selection === null) {
+                    return [noUpdate, noUpdate, noUpdate];
+                }
+                const [hours, endHour] = selection;
+                const unit = aggregate.companies.slice(1).includes(company) ? company : null;
+                const slot = unit ? aggregate.units.indexOf(unit) + 1 : 0;
+                if (unit && slot === 0) {
+                    return [noUpdate, noUpdate, noUpdate];
+                }
+                const monthNumber = Math.max(aggregate.monthname.indexOf(month), 0);
+                const data = cubes(aggregate);
+                return [
+                    locationGraph(aggregate,
+                                  codeCounts(data.locations, data.locations_on_hour, slot, monthNumber, hours, endHour),
+                                  unit, time1, time2, month),
+                    typeGraph(aggregate,
+                              codeCounts(data.types, data.types_on_hour, slot, monthNumber, hours, endHour),
+                              unit),
+                    timeGraph(aggregate, hourCounts(aggregate, data, slot, monthNumber, hours, endHour),
+                              unit, time1, time2, month),
+                ];
+            },
+        },
+    });
+})();
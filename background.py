@@ -0,0 +1,59 @@
+import contextlib, fcntl, os, time
+
+# Background drawing of the slow dashboard figures.
+# With DFD_BACKGROUND=1 the heat map and the location graph, which can take
+# seconds on large selections, are drawn by a Dash background callback when
+# neither the figure cache nor the precomputed store has them. Dash's
+# DiskcacheManager runs each job in a process forked from the worker and the
+# browser polls for the result, so the request threads stay free for the
+# quick callbacks (the other graphs, the sidebar totals, the pie). It needs
+# the diskcache, multiprocess and psutil packages: pip install "dash[diskcache]".
+#
+# At most DFD_BACKGROUND_WORKERS jobs draw at the same time on the host: a job
+# holds one of the slot lock files in DFD_BACKGROUND_DIR while it draws and
+# waits for a free one before. The kernel drops the lock of a job that is
+# killed, e.g. canceled because the dropdowns changed again.
+#   DFD_BACKGROUND=1 DFD_BACKGROUND_WORKERS=2 DFD_BACKGROUND_DIR=.background_cache
+
+enabled = os.environ.get('DFD_BACKGROUND', '0') == '1'
+
+
+def cache_dir():
+    return os.environ.get('DFD_BACKGROUND_DIR', '.background_cache')
+
+
+def workers():
+    return max(int(os.environ.get('DFD_BACKGROUND_WORKERS', 2)), 1)
+
+
+# Dash background callback manager keeping job results in DFD_BACKGROUND_DIR
+def manager():
+    import diskcache
+    from dash import DiskcacheManager
+    return DiskcacheManager(diskcache.Cache(os.path.join(cache_dir(), 'results')))
+
+
+# holds one of the workers() slots, on_wait() is called once when all are taken
+@contextlib.contextmanager
+def slot(on_wait=None, poll_seconds=.05):
+    directory = os.path.join(cache_dir(), 'slots')
+    os.makedirs(directory, exist_ok=True)
+    waiting = False
+    while True:
+        for k in range(workers()):
+            lock_file = open(os.path.join(directory, f'slot-{k}.lock'), 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                continue
+            try:
+                yield k
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+            return
+        if not waiting and on_wait is not None:
+            on_wait()
+            waiting = True
+        time.sleep(poll_seconds)
@@ -0,0 +1,191 @@
+import argparse, json, os, platform, subprocess, sys, tempfile, time
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import synthetic_data
+
+# Benchmark of data loading, dropdown filtering and figure construction.
+# For every row count a synthetic data set (synthetic_data.py) is written to
+# CSV and timed through: CSV parsing, the columnar cache build and load, the
+# IncidentStore and spatial index builds, radius queries around the busiest
+# location, every dropdown filter combination, each figure builder
+# of responses.py and the JSON serialization of the figure it sends (bytes
+# and gzip'd bytes, per figure and per dropdown callback) and of the count
+# cubes of the client side mode. The response time summary of each selection
+# is timed uncached, its figures read the cached one. The store is installed with set_store() before responses is imported,
+# so the app never reads the real CSV. Results are written as JSON; --compare
+# prints the change against an earlier results file.
+#   python benchmarks/bench_dashboard.py --rows 10000 100000 1000000 10000000
+#   python benchmarks/bench_dashboard.py --rows 100000 --compare benchmarks/results/before.json
+
+# (time1, time2, month, company, date range) dropdown selections
+FILTERS = [('--', '--', '--', 'ALL', None),
+           ('--', '--', 'June', 'ALL', None),
+           ('--', '--', '--', 'E22', None),
+           ('08:00 hrs', '17:00 hrs', '--', 'ALL', None),
+           ('22:00 hrs', '03:00 hrs', 'June', 'E22', None),
+           ('--', '--', '--', 'ALL', ('2023-06-01', '2023-06-30')),
+           ('08:00 hrs', '17:00 hrs', '--', 'T1', ('2023-06-01', '2023-08-31'))]
+
+
+def measure(func, repeat):
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        seconds.append(time.perf_counter() - start)
+    return result, seconds
+
+
+class Results:
+
+    def __init__(self):
+        self.results = []
+
+    def add(self, rows, name, seconds, **extra):
+        self.results.append(dict(rows=rows, name=name, median=float(np.median(seconds)),
+                                 min=float(np.min(seconds)), repeat=len(seconds), **extra))
+        print(f'{rows:>10} {name:<72} {1000*np.median(seconds):>10.2f} ms')
+
+
+def environment():
+    import pandas, plotly, dash
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': commit,
+            'python': platform.python_version(), 'machine': platform.machine(), 'cpus': os.cpu_count(),
+            'numpy': np.__version__, 'pandas': pandas.__version__,
+            'plotly': plotly.__version__, 'dash': dash.__version__}
+
+
+def bench_rows(n, args, results, tmp):
+    from incident_store import IncidentStore, set_store
+    from spatial_grid import SpatialGrid
+    import columnar_cache
+
+    frame, units = synthetic_data.incidents(n, args.seed, days=args.days)
+    csv_path = os.path.join(tmp, f'incidents-{n}.csv')
+    if not args.skip_csv:
+        synthetic_data.write_csv(csv_path, frame, units)
+        (frame, units), seconds = measure(lambda: synthetic_data.read_csv(csv_path), 1)
+        results.add(n, 'load/csv', seconds, bytes=os.path.getsize(csv_path))
+
+        cache_dir = os.path.join(tmp, f'cache-{n}')
+        _, seconds = measure(lambda: columnar_cache.load_or_build(csv_path, cache_dir, lambda: (frame, units)), 1)
+        results.add(n, 'load/columnar_cache_build', seconds)
+        _, seconds = measure(lambda: columnar_cache.load_or_build(csv_path, cache_dir, None), args.repeat)
+        results.add(n, 'load/columnar_cache_load', seconds)
+
+    store, seconds = measure(lambda: IncidentStore(frame, units), 1)
+    results.add(n, 'load/incident_store', seconds)
+    set_store(store)
+    _, seconds = measure(lambda: SpatialGrid(frame['LATITUDE'], frame['LONGITUDE']).index(), 1)
+    results.add(n, 'load/spatial_index', seconds)
+
+    os.environ.setdefault('DFD_WARM_FIGURES', '0')
+    os.environ.setdefault('DFD_PRECOMPUTE', '0')
+    os.environ.setdefault('DFD_PRECOMPUTE_DB', os.path.join(tmp, 'figures.sqlite'))
+    import responses, figure_payload
+
+    for t1, t2, month, company, dates in FILTERS:
+        label = f'{t1}|{t2}|{month}|{company}|{dates[0] + ".." + dates[1] if dates else "--"}'
+        query = lambda: store.query(responses.hours_dict[t1], responses.hours_dict[t2],
+                                    responses.months[month], dates)
+        view, seconds = measure(query, args.repeat)
+        results.add(n, f'filter/{label}', seconds, selected=len(view))
+        if company != 'ALL':
+            _, seconds = measure(lambda: view.unit_rows(company), args.repeat)
+            results.add(n, f'filter_unit/{label}', seconds)
+
+        # uncached response time summary of the selection
+        unit = None if company == 'ALL' else company
+        _, seconds = measure(lambda: store.response_times._summary(
+                                 store.select(responses.hours_dict[t1], responses.hours_dict[t2],
+                                              responses.months[month], unit, dates)),
+                             args.repeat)
+        results.add(n, f'response_summary/{label}', seconds)
+
+        figures = []
+        builders = {'incident_heat_map': lambda: responses.incident_heat_map(view, company),
+                    'incident_locations': lambda: responses.incident_locations(view, company, t1, t2, month),
+                    'incident_type_total': lambda: responses.incident_type_total(view, company),
+                    'time_period_totals': lambda: responses.time_period_totals(view, company, t1, t2, month),
+                    'district_totals': lambda: responses.district_totals(view, company),
+                    'response_hourly': lambda: responses.response_hourly(view, company),
+                    'response_districts': lambda: responses.response_districts(view, company),
+                    'response_histogram': lambda: responses.response_histogram(view, company)}
+        for name, build in builders.items():
+            figure, seconds = measure(lambda: figure_payload.compact(build()), args.repeat)
+            results.add(n, f'figure/{name}/{label}', seconds)
+            _, seconds = measure(lambda: figure_payload.to_json(figure), args.repeat)
+            size, gzip_size = figure_payload.payload_bytes(figure)
+            results.add(n, f'serialize/{name}/{label}', seconds, bytes=size, gzip_bytes=gzip_size)
+            figures.append(figure)
+        _, seconds = measure(lambda: figure_payload.to_json(figures), args.repeat)
+        size, gzip_size = figure_payload.payload_bytes(figures)
+        results.add(n, f'serialize/dropdown_graphs/{label}', seconds, bytes=size, gzip_bytes=gzip_size)
+
+    busiest = store.locations.label_counts().index[0]
+    codes = store.locations.lookup(busiest)
+    row = store.locations.rows(codes)[0]
+    for meters in (100, 250, 1000):
+        nearby, seconds = measure(lambda: store.rows_within(store.grid.latitude[row], store.grid.longitude[row], meters),
+                                  args.repeat)
+        results.add(n, f'spatial/within_{meters}m', seconds, selected=len(nearby))
+    figure, seconds = measure(lambda: figure_payload.compact(responses.pie_location(codes)), args.repeat)
+    results.add(n, 'figure/pie_location', seconds)
+    _, seconds = measure(lambda: figure_payload.to_json(figure), args.repeat)
+    size, gzip_size = figure_payload.payload_bytes(figure)
+    results.add(n, 'serialize/pie_location', seconds, bytes=size, gzip_bytes=gzip_size)
+
+    # count cubes sent once per page in the client side mode
+    aggregate, seconds = measure(lambda: responses.client_aggregate_data(store), 1)
+    results.add(n, 'figure/client_aggregate', seconds)
+    _, seconds = measure(lambda: figure_payload.to_json(aggregate), args.repeat)
+    size, gzip_size = figure_payload.payload_bytes(aggregate)
+    results.add(n, 'serialize/client_aggregate', seconds, bytes=size, gzip_bytes=gzip_size)
+
+
+def compare(results, path):
+    with open(path) as f:
+        before = {(r['rows'], r['name']): r for r in json.load(f)['results']}
+    print(f"\n{'rows':>10} {'benchmark':<72} {'before':>10} {'after':>10} {'change':>8} {'bytes':>8}")
+    for r in results:
+        old = before.get((r['rows'], r['name']))
+        if old:
+            size = f"{r['bytes']/max(old['bytes'], 1):.2f}x" if 'bytes' in r and 'bytes' in old else ''
+            print(f"{r['rows']:>10} {r['name']:<72} {1000*old['median']:>10.2f} {1000*r['median']:>10.2f} "
+                  f"{r['median']/max(old['median'], 1e-12):>7.2f}x {size:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 1000000])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--days', type=int, default=270)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--skip-csv', action='store_true', help='generate in memory, skip the load benchmarks')
+    parser.add_argument('--output', default=os.path.join(ROOT, 'benchmarks', 'results',
+                                                         time.strftime('%Y%m%d-%H%M%S') + '.json'))
+    parser.add_argument('--compare', help='earlier results file')
+    args = parser.parse_args()
+
+    results = Results()
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.rows:
+            bench_rows(n, args, results, tmp)
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment(), 'args': vars(args), 'results': results.results}, f, indent=1)
+    print(f'\nresults written to {args.output}')
+    if args.compare:
+        compare(results.results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
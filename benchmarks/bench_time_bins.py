@@ -0,0 +1,49 @@
+import argparse, os, sys, timeit
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import synthetic_data
+from aggregates import IncidentCube
+from incident_store import IncidentStore
+from time_bins import hourly_labels
+
+# Benchmark the hourly histogram used by time_period_totals:
+# the previous 24 indexer_between_time scans against the hour axis of the
+# count cube (IncidentCube.hour_counts), with the time to build the cube once
+# per data load.
+#   python benchmarks/bench_time_bins.py --rows 10000 100000 1000000 10000000
+
+
+def between_time_scans(df):
+    daytimes = [f'{x:02d}:00' for x in range(24)]
+    totals = []
+    for x in range(24):
+        end = daytimes[x+1] if x != 23 else '00:00:00'
+        totals.append(df.iloc[df.index.indexer_between_time(daytimes[x], end, include_end=False)].TYPE.count())
+    return pd.Series(totals, index=hourly_labels(), name='Total')
+
+
+def cube_hours(store):
+    return pd.Series(store.cube.hour_counts(), index=hourly_labels(), name='Total')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000, 10_000_000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'rows':>10} {'24 scans (s)':>14} {'cube build (s)':>15} {'cube (s)':>10} {'speedup':>8}")
+    for n in args.rows:
+        frame, units = synthetic_data.incidents(n)
+        store = IncidentStore(frame, units)
+        assert between_time_scans(frame).equals(cube_hours(store))
+        scans = min(timeit.repeat(lambda: between_time_scans(frame), number=1, repeat=args.repeat))
+        build = min(timeit.repeat(lambda: IncidentCube(store), number=1, repeat=args.repeat))
+        cube = min(timeit.repeat(lambda: cube_hours(store), number=1, repeat=args.repeat))
+        print(f'{n:>10} {scans:>14.4f} {build:>15.4f} {cube:>10.6f} {scans/cube:>7.1f}x')
+
+
+if __name__ == '__main__':
+    main()
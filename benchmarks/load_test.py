@@ -0,0 +1,131 @@
+import argparse, json, os, random, signal, socket, subprocess, sys, time
+import urllib.error, urllib.request
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+# Load test for the dashboard under gunicorn.
+# For every worker count the app is started with gunicorn.conf.py, the
+# dropdown options are read from /_dash-layout and every server side callback
+# from /_dash-dependencies is fired with random dropdown selections by a pool
+# of concurrent clients. Reports requests/sec and p50/p99 callback latency.
+#   python benchmarks/load_test.py --workers 1 2 4 --clients 16 --requests 2000
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def fetch(url, payload=None):
+    data = None if payload is None else json.dumps(payload).encode()
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request, timeout=120) as response:
+        return response.read()
+
+
+# id -> list of option values for every dropdown in the layout
+def dropdown_options(layout):
+    options = {}
+
+    def walk(node):
+        if isinstance(node, dict):
+            props = node.get('props', {})
+            if node.get('type') == 'Dropdown' and 'id' in props:
+                values = [o['value'] if isinstance(o, dict) else o for o in props.get('options', [])]
+                options[props['id']] = values
+            for value in props.values():
+                walk(value)
+        elif isinstance(node, list):
+            for value in node:
+                walk(value)
+    walk(layout)
+    return options
+
+
+def callback_requests(dependencies, options):
+    requests = []
+    for dependency in dependencies:
+        if dependency.get('clientside_function') or dependency.get('long'):
+            continue
+        if not any(i['id'] in options for i in dependency['inputs']):
+            continue
+        output = dependency['output']
+        if output.startswith('..'):
+            outputs = [dict(zip(('id', 'property'), o.rsplit('.', 1))) for o in output.strip('.').split('...')]
+        else:
+            outputs = dict(zip(('id', 'property'), output.rsplit('.', 1)))
+        requests.append((output, outputs, dependency['inputs'], dependency.get('state', [])))
+    return requests
+
+
+def payload(request, options):
+    output, outputs, inputs, state = request
+    values = [dict(i, value=random.choice(options[i['id']]) if i['id'] in options else None) for i in inputs]
+    return {'output': output, 'outputs': outputs, 'inputs': values,
+            'changedPropIds': [f"{values[0]['id']}.{values[0]['property']}"],
+            'state': [dict(s, value=None) for s in state]}
+
+
+def wait_for(port, timeout=300):
+    start = time.time()
+    while time.time() - start < timeout:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return
+        except OSError:
+            time.sleep(.25)
+    raise RuntimeError(f'server did not start on port {port}')
+
+
+def run(workers, args):
+    env = dict(os.environ, DFD_WORKERS=str(workers), DFD_BIND=f'127.0.0.1:{args.port}')
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'responses:server'],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for(args.port)
+        base = f'http://127.0.0.1:{args.port}'
+        options = dropdown_options(json.loads(fetch(f'{base}/_dash-layout')))
+        requests = callback_requests(json.loads(fetch(f'{base}/_dash-dependencies')), options)
+        url = f'{base}/_dash-update-component'
+
+        def timed(_):
+            body = payload(random.choice(requests), options)
+            start = time.perf_counter()
+            try:
+                fetch(url, body)
+            except urllib.error.HTTPError:
+                return np.nan
+            return time.perf_counter() - start
+
+        with ThreadPoolExecutor(args.clients) as pool:
+            list(pool.map(timed, range(args.clients)))
+            start = time.perf_counter()
+            latencies = np.array(list(pool.map(timed, range(args.requests))))
+            elapsed = time.perf_counter() - start
+        failed = np.isnan(latencies)
+        return {'workers': workers,
+                'requests_per_sec': args.requests / elapsed,
+                'p50_ms': 1000*np.percentile(latencies[~failed], 50),
+                'p99_ms': 1000*np.percentile(latencies[~failed], 99),
+                'errors': int(failed.sum())}
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    print(f"{'workers':>8} {'req/s':>10} {'p50 ms':>10} {'p99 ms':>10} {'errors':>7}")
+    for workers in args.workers:
+        result = run(workers, args)
+        print(f"{result['workers']:>8} {result['requests_per_sec']:>10.1f} "
+              f"{result['p50_ms']:>10.1f} {result['p99_ms']:>10.1f} {result['errors']:>7}")
+
+
+if __name__ == '__main__':
+    main()
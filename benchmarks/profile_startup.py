@@ -0,0 +1,103 @@
+import argparse, json, os, re, signal, subprocess, sys, time
+import urllib.error, urllib.request
+from collections import Counter
+
+# Start up profile of the dashboard.
+# 1. Import time of responses.py, eagerly (data loaded at import) and with
+#    DFD_LAZY=1, broken down by top level package from `python -X importtime`.
+# 2. Time from starting the server to the first /healthz answer, to /healthz
+#    reporting the app ready and to the data being loaded, for gunicorn with
+#    responses:server (preloaded) and with DFD_LAZY=1 wsgi:application.
+# The app loads its incident data the usual way (IncidentData or
+# DFD_INCIDENT_CSV). Figure warming and precomputing are turned off so they do
+# not compete with the start up being measured.
+#   python benchmarks/profile_startup.py
+#   python benchmarks/profile_startup.py --top 20 --skip-server
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def environment(lazy, **extra):
+    return dict(os.environ, DFD_LAZY='1' if lazy else '0', DFD_WARM_FIGURES='0', DFD_PRECOMPUTE='0', **extra)
+
+
+# (seconds, {top level package: seconds of its own import time}); responses
+# itself is left out, with DFD_LAZY=1 its warm-up thread imports while the
+# module finishes and importtime books that wait as the module's own time
+def import_profile(lazy):
+    code = 'import time; start = time.perf_counter(); import responses; print(time.perf_counter() - start)'
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT, env=environment(lazy),
+                            capture_output=True, text=True, check=True)
+    packages = Counter()
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match and match.group(4) != 'responses':
+            packages[match.group(4).split('.')[0]] += int(match.group(1)) / 1e6
+    return float(result.stdout.split()[-1]), packages
+
+
+# (status, body) of /healthz, (None, {}) while nothing listens on the port
+def healthz(port):
+    try:
+        with urllib.request.urlopen(f'http://127.0.0.1:{port}/healthz', timeout=1) as response:
+            status, text = response.status, response.read()
+    except urllib.error.HTTPError as error:
+        status, text = error.code, error.read()
+    except OSError:
+        return None, {}
+    try:
+        return status, json.loads(text)
+    except ValueError:
+        return status, {}
+
+
+# seconds to the first /healthz answer, to the app being ready and to the data being loaded
+def server_profile(lazy, port, timeout=300):
+    app = 'wsgi:application' if lazy else 'responses:server'
+    env = environment(lazy, DFD_WORKERS='1', DFD_BIND=f'127.0.0.1:{port}')
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', app],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    times = {}
+    try:
+        while 'data' not in times and time.perf_counter() - start < timeout:
+            status, body = healthz(port)
+            now = time.perf_counter() - start
+            if status is not None:
+                times.setdefault('first_answer', now)
+            if status == 200:
+                times.setdefault('app_ready', now)
+                if body.get('data') == 'ready':
+                    times['data'] = now
+            time.sleep(.01)
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait()
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--top', type=int, default=12, help='packages listed in the import breakdown')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--skip-server', action='store_true', help='only profile the imports')
+    args = parser.parse_args()
+
+    for lazy in (False, True):
+        seconds, packages = import_profile(lazy)
+        print(f"\nimport responses ({'DFD_LAZY=1' if lazy else 'eager'}): {seconds:.3f} s")
+        for package, package_seconds in packages.most_common(args.top):
+            print(f'  {package:<32} {1000*package_seconds:>8.1f} ms')
+
+    if not args.skip_server:
+        print(f"\n{'server':<28} {'first answer':>13} {'app ready':>10} {'data':>10}")
+        for lazy in (False, True):
+            times = server_profile(lazy, args.port)
+            print(f"{'wsgi (DFD_LAZY=1)' if lazy else 'responses (preload)':<28} "
+                  + ' '.join(f"{times[k]:>{w}.3f}" if k in times else f"{'-':>{w}}"
+                             for k, w in (('first_answer', 13), ('app_ready', 10), ('data', 10))))
+
+
+if __name__ == '__main__':
+    main()
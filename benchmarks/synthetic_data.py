@@ -0,0 +1,110 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+# Synthetic Danbury incidents with the schema IncidentData returns: a
+# DatetimeIndex, INCIDENT, LOCATION ('<number> <street> Danbury, CT'),
+# ADDRESS, TYPE, LATITUDE and LONGITUDE inside the Danbury bounding box, plus
+# the 0/1 incident x unit frame. Location popularity is Zipf distributed,
+# calls peak in the afternoon and most incidents get one to three units.
+# DISPATCHED, EN_ROUTE and ON_SCENE are the unit times response_times.py
+# reads, with turnout around a minute and travel a few minutes; a few
+# incidents have no en route time.
+#   python benchmarks/synthetic_data.py 100000 incidents.csv
+
+BBOX = {'lat': (41.33, 41.46), 'lon': (-73.53, -73.39)}
+UNITS = ['C30','T1','TAC1','SQ21','E22','E23','E24','E25','E26']
+UNIT_WEIGHTS = [.06, .12, .04, .10, .16, .15, .12, .13, .12]
+STREETS = ['MAIN ST','WHITE ST','LAKE AVE','MILL PLAIN RD','PADANARAM RD','NEWTOWN RD','FEDERAL RD',
+           'PEMBROKE RD','BACKUS AVE','KENOSIA AVE','WEST ST','DEER HILL AVE','HOSPITAL AVE','ELM ST',
+           'LIBERTY ST','GRAND ST','NORTH ST','CRAIGMOOR RD','STADLEY ROUGH RD','EAGLE RD',
+           'SUGAR HOLLOW RD','OLD RIDGEBURY RD','TAMARACK AVE','FRANKLIN ST','BALMFORTH AVE']
+TYPES = ['EMS CALL','FIRE ALARM ACTIVATION','MOTOR VEHICLE ACCIDENT WITH INJURIES','SERVICE CALL',
+         'LIFT ASSIST','CARBON MONOXIDE ALARM','GAS LEAK','ODOR INVESTIGATION','WIRES DOWN',
+         'STRUCTURE FIRE','VEHICLE FIRE','BRUSH FIRE','WATER PROBLEM','ELEVATOR RESCUE',
+         'HAZARDOUS MATERIALS','SMOKE INVESTIGATION','MUTUAL AID','ALARM MALFUNCTION',
+         'DUMPSTER FIRE','RESCUE']
+# relative calls per hour of the day
+HOUR_WEIGHTS = np.array([3, 2.5, 2, 2, 2, 2.5, 3.5, 5, 6, 6.5, 7, 7, 7, 7, 7, 7, 7, 6.5, 6, 5.5, 5, 4.5, 4, 3.5])
+
+
+def incidents(n, seed=0, start='2023-04-01', days=270, n_locations=None):
+    rng = np.random.default_rng(seed)
+
+    # timestamps: uniform days, afternoon-weighted hours, uniform seconds
+    day = rng.integers(0, days, n)
+    hour = rng.choice(24, n, p=HOUR_WEIGHTS/HOUR_WEIGHTS.sum())
+    second = rng.integers(0, 3600, n)
+    stamps = pd.Timestamp(start).value + ((day*24 + hour)*3600 + second).astype(np.int64)*10**9
+    index = pd.DatetimeIndex(np.sort(stamps))
+
+    # locations with fixed coordinates, a few very busy ones
+    n_locations = n_locations or int(np.clip(n // 40, 200, 50000))
+    numbers = rng.integers(1, 400, n_locations)
+    streets = rng.choice(STREETS, n_locations)
+    addresses = np.array([f'{num} {street}' for num, street in zip(numbers, streets)], dtype=object)
+    names = np.array([f'{a} Danbury, CT' for a in addresses], dtype=object)
+    latitude = rng.uniform(*BBOX['lat'], n_locations)
+    longitude = rng.uniform(*BBOX['lon'], n_locations)
+    location = (rng.zipf(1.3, n) - 1) % n_locations
+
+    type_weights = 1/np.arange(1, len(TYPES) + 1)
+    types = np.array(TYPES, dtype=object)[rng.choice(len(TYPES), n, p=type_weights/type_weights.sum())]
+    types[rng.random(n) < .002] = None
+
+    frame = pd.DataFrame({'INCIDENT': [f'{index[0].year % 100}-{k:07d}' for k in range(n)],
+                          'LOCATION': names[location],
+                          'ADDRESS': addresses[location],
+                          'TYPE': types,
+                          'LATITUDE': latitude[location].round(6),
+                          'LONGITUDE': longitude[location].round(6)},
+                         index=index)
+
+    # dispatch seconds after the call, then turnout and travel, slower at night
+    night = np.isin(index.hour, [0, 1, 2, 3, 4, 5, 23])
+    dispatched = index + pd.to_timedelta(rng.gamma(2, 15, n).round(), unit='s')
+    turnout = rng.lognormal(np.where(night, 4.5, 4.1), .35, n).round()
+    travel = rng.lognormal(5.4, .45, n).round()
+    en_route = dispatched + pd.to_timedelta(turnout, unit='s')
+    frame['DISPATCHED'] = dispatched
+    frame['EN_ROUTE'] = en_route.where(rng.random(n) >= .02)
+    frame['ON_SCENE'] = en_route + pd.to_timedelta(travel, unit='s')
+
+    # one to three distinct units per incident
+    n_units = rng.choice([1, 2, 3], n, p=[.55, .3, .15])
+    assigned = np.zeros((n, len(UNITS)), dtype=np.uint8)
+    for k in range(3):
+        pick = rng.choice(len(UNITS), n, p=UNIT_WEIGHTS)
+        assigned[np.flatnonzero(n_units > k), pick[n_units > k]] = 1
+    units = pd.DataFrame(assigned, index=index, columns=UNITS)
+    return frame, units
+
+
+# one CSV with the unit assignments as a comma separated UNITS column
+def write_csv(path, frame, units):
+    unit_names = np.array(units.columns, dtype=object)
+    lists = [','.join(unit_names[row]) for row in units.to_numpy() > 0]
+    frame.assign(UNITS=lists).to_csv(path, index_label='TIME')
+
+
+def read_csv(path):
+    frame = pd.read_csv(path, index_col='TIME', parse_dates=['TIME'])
+    for column in ('DISPATCHED', 'EN_ROUTE', 'ON_SCENE'):
+        if column in frame.columns:
+            frame[column] = pd.to_datetime(frame[column])
+    units = frame.pop('UNITS').fillna('').str.get_dummies(sep=',')
+    return frame, units
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('rows', type=int)
+    parser.add_argument('csv')
+    parser.add_argument('--days', type=int, default=270)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    write_csv(args.csv, *incidents(args.rows, args.seed, days=args.days))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import os
+import numpy as np
+import pandas as pd
+import figure_payload
+
+# Client side filtering of the count based graphs.
+# With DFD_CLIENTSIDE=1 the hourly, type and location bar graphs are redrawn
+# in the browser (assets/clientside.js) from the store's count cubes
+# (aggregates.py), sent once per page and data version to a dcc.Store:
+#   types[unit slot, month, hour, TYPE], locations[unit slot, month, hour, LOCATION]
+# and the same cubes of the incidents stamped exactly on an hour, which the
+# inclusive end of a time range adds. The cubes go as their non-zero cells
+# (gaps between their flat indexes and counts) in base64 typed arrays, with the type and location
+# names and bar colors and the styled figure of each graph without its data.
+# A dropdown change then needs no server round trip for these graphs; the
+# server still draws them for date ranges, which the cubes have no axis for.
+#   DFD_CLIENTSIDE=1
+
+enabled = os.environ.get('DFD_CLIENTSIDE', '0') == '1'
+
+
+# non-zero cells of a cube as {'shape', 'step', 'count'}, step the gaps
+# between the C order flat indexes, which fit a smaller type than the indexes
+def sparse(cube):
+    index = np.flatnonzero(cube)
+    return {'shape': list(cube.shape),
+            'step': figure_payload.typed_array(np.diff(index, prepend=0)),
+            'count': figure_payload.typed_array(cube.ravel()[index])}
+
+
+# (unit slots, month, hour, code) counts of the incidents stamped exactly on an hour
+def on_hour_cube(store, shape, codes):
+    counts = np.zeros(shape, dtype=np.int64)
+    for hour, rows in enumerate(store.cube.on_hour):
+        if len(rows) == 0:
+            continue
+        months = store.month_codes[rows]
+        for slot in range(len(store.unit_names) + 1):
+            keep = slice(None) if slot == 0 else store.unit_mask.has(store.unit_names[slot - 1], rows)
+            np.add.at(counts[slot], (months[keep], hour, codes[rows][keep]), 1)
+    return counts
+
+
+def names(index):
+    return [None if pd.isna(name) else name for name in index]
+
+
+# the aggregate the browser draws the graphs from; colors are the dashboard's
+# bar colors (palettes.CategoryColors) and figures the graphs' figures with
+# their data left out, dicts keyed by 'type' / 'location' and graph id
+def aggregate(store, colors, figures, **dropdowns):
+    types, locations = store.cube.dense()
+    return dict(version=store.version,
+                units=list(store.unit_names),
+                types=sparse(types),
+                locations=sparse(locations),
+                types_on_hour=sparse(on_hour_cube(store, types.shape, store.type_codes)),
+                locations_on_hour=sparse(on_hour_cube(store, locations.shape, store.location_codes)),
+                type_names=names(store.type_names),
+                type_colors=list(colors['type'](store.type_names)),
+                location_names=names(store.location_names),
+                location_colors=list(colors['location'](store.location_names)),
+                figures={graph: skeleton(figure) for graph, figure in figures.items()},
+                **dropdowns)
+
+
+# figure dict without its bar data (a single bar color is kept)
+def skeleton(figure):
+    figure = figure_payload.compact(figure, typed=False)
+    for trace in figure['data']:
+        for key in ('x', 'y'):
+            trace[key] = []
+        marker = trace.get('marker', {})
+        if not isinstance(marker.get('color'), str):
+            marker.pop('color', None)
+    return figure
@@ -0,0 +1,167 @@
+import argparse, hashlib, json, os, shutil
+import numpy as np
+import pandas as pd
+from unit_mask import UnitMask
+
+# Columnar binary cache of the cleaned incident data.
+# Parsing the First Due CSV (and its dates) is most of the start up time, and
+# every server worker repeats it. The frame IncidentData returns is saved once
+# as typed NumPy arrays: int64 timestamps, float32 coordinates, codes +
+# category lists for the text columns (TYPE, LOCATION, ADDRESS, ...) and the
+# incident x unit bitmask (unit_mask.py). Codes are saved in the integer type
+# pandas keeps for their number of categories (int8, int16 ...), as
+# Categorical.from_codes copies codes of any other type out of the map. The
+# arrays are opened memory-mapped, so the operating system shares their pages
+# between worker processes. Rows are saved in time order, so every year/month
+# partition the store finds (incident_store.py) is one contiguous range of
+# each file and a date range only reads its own pages.
+#
+# The cache remembers the size, mtime and SHA-1 of the source CSV. When the
+# size or mtime changes the CSV is hashed again, and only a different hash
+# rebuilds the cache from the CSV.
+#
+#   python columnar_cache.py path/to/incidents.csv --cache-dir .incident_cache
+
+MANIFEST = 'manifest.json'
+FLOAT32_COLUMNS = ('LATITUDE', 'LONGITUDE')
+
+
+# the integer type pandas keeps the codes of n categories in
+def code_dtype(n):
+    for dtype in (np.int8, np.int16, np.int32):
+        if n < np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def source_fingerprint(path, previous=None):
+    stat = os.stat(path)
+    fingerprint = {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if previous and previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns:
+        fingerprint['sha1'] = previous['sha1']
+    else:
+        fingerprint['sha1'] = file_hash(path)
+    return fingerprint
+
+
+def read_manifest(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_manifest(cache_dir, manifest):
+    tmp = os.path.join(cache_dir, f'{MANIFEST}.{os.getpid()}')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, os.path.join(cache_dir, MANIFEST))
+
+
+# write the frame and unit matrix into a new data directory and point the
+# manifest at it; readers still mapping the previous directory keep working
+def save(frame, units, cache_dir, fingerprint):
+    os.makedirs(cache_dir, exist_ok=True)
+    data_dir = f"{fingerprint['sha1'][:16]}-{os.getpid()}"
+    path = os.path.join(cache_dir, data_dir)
+    os.makedirs(path, exist_ok=True)
+    if not frame.index.is_monotonic_increasing:
+        order = np.argsort(frame.index.values, kind='stable')
+        frame, units = frame.iloc[order], units.iloc[order]
+    columns = []
+    np.save(os.path.join(path, 'index.npy'), frame.index.values.astype('datetime64[ns]').view(np.int64))
+    for n, (name, values) in enumerate(frame.items()):
+        column = {'name': name, 'file': f'col{n}'}
+        if name in FLOAT32_COLUMNS:
+            column['kind'] = 'float32'
+            np.save(os.path.join(path, f'col{n}.npy'), values.to_numpy(np.float32))
+        elif pd.api.types.is_datetime64_dtype(values):
+            column['kind'] = 'datetime'
+            np.save(os.path.join(path, f'col{n}.npy'), values.values.astype('datetime64[ns]').view(np.int64))
+        elif pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+            column['kind'] = 'numeric'
+            np.save(os.path.join(path, f'col{n}.npy'), values.to_numpy())
+        else:
+            column['kind'] = 'category'
+            codes, categories = pd.factorize(values)
+            np.save(os.path.join(path, f'col{n}.npy'), codes.astype(code_dtype(len(categories))))
+            column['categories'] = [None if pd.isna(c) else str(c) for c in categories]
+        columns.append(column)
+    np.save(os.path.join(path, 'unit_bits.npy'), UnitMask.from_frame(units).bits)
+
+    previous = read_manifest(cache_dir)
+    _write_manifest(cache_dir, {'source': fingerprint,
+                                'data': data_dir,
+                                'rows': len(frame),
+                                'index_name': frame.index.name,
+                                'columns': columns,
+                                'units': [str(u) for u in units.columns]})
+    if previous and previous.get('data') != data_dir:
+        shutil.rmtree(os.path.join(cache_dir, previous['data']), ignore_errors=True)
+
+
+# rebuild the frame and unit bitmask from the memory-mapped arrays
+def load(cache_dir, manifest=None):
+    manifest = manifest or read_manifest(cache_dir)
+    path = os.path.join(cache_dir, manifest['data'])
+
+    def array(name):
+        return np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r')
+
+    index = pd.DatetimeIndex(array('index').view('datetime64[ns]'), name=manifest['index_name'])
+    data = {}
+    for column in manifest['columns']:
+        values = array(column['file'])
+        if column['kind'] == 'category':
+            data[column['name']] = pd.Categorical.from_codes(values, categories=pd.Index(column['categories']).dropna())
+        elif column['kind'] == 'datetime':
+            data[column['name']] = values.view('datetime64[ns]')
+        else:
+            data[column['name']] = values
+    frame = pd.DataFrame(data, index=index, copy=False)
+    return frame, UnitMask(array('unit_bits'), manifest['units'])
+
+
+# cached frame and unit bitmask for the CSV, (re)building the cache with build()
+# when it is missing or the CSV's contents changed
+def load_or_build(csv_path, cache_dir, build):
+    manifest = read_manifest(cache_dir)
+    previous = manifest['source'] if manifest else None
+    fingerprint = source_fingerprint(csv_path, previous)
+    if manifest and previous['sha1'] == fingerprint['sha1']:
+        if previous['mtime_ns'] != fingerprint['mtime_ns']:
+            # touched but unchanged, remember the new mtime so it is not hashed again
+            manifest['source'] = fingerprint
+            _write_manifest(cache_dir, manifest)
+        try:
+            return load(cache_dir, manifest)
+        except (OSError, ValueError, KeyError):
+            pass
+
+    frame, units = build()
+    save(frame, units, cache_dir, fingerprint)
+    return load(cache_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('csv', help='incident CSV read by IncidentData')
+    parser.add_argument('--cache-dir', default='.incident_cache')
+    args = parser.parse_args()
+
+    from incident_store import read_incident_data
+    frame, units = load_or_build(args.csv, args.cache_dir, read_incident_data)
+    print(f'{len(frame)} incidents cached in {args.cache_dir}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+import gzip, os
+import flask
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# gzip / brotli compression of the server's responses.
+# Callback responses are figure JSON, which compresses several times over;
+# Dash's own compress=True needs flask-compress, this hook only needs the
+# standard library (and the brotli package for 'br'). Responses smaller than
+# min_size, already encoded or streamed are sent as they are.
+#   DFD_COMPRESS=0 turns it off, DFD_COMPRESS_LEVEL sets the gzip level (1-9)
+
+COMPRESSIBLE = ('application/json', 'application/javascript', 'text/')
+
+
+def _accepted(name):
+    return flask.request.accept_encodings[name] > 0
+
+
+def init_app(server, min_size=1024, level=None):
+    if os.environ.get('DFD_COMPRESS', '1') == '0':
+        return
+    level = level or int(os.environ.get('DFD_COMPRESS_LEVEL', 6))
+
+    @server.after_request
+    def _compress(response):
+        if (response.direct_passthrough or response.status_code < 200 or response.status_code >= 300
+                or 'Content-Encoding' in response.headers
+                or not response.mimetype.startswith(COMPRESSIBLE)):
+            return response
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        if len(data) < min_size:
+            return response
+        if brotli is not None and _accepted('br'):
+            response.set_data(brotli.compress(data, quality=5))
+            response.headers['Content-Encoding'] = 'br'
+        elif _accepted('gzip'):
+            response.set_data(gzip.compress(data, level))
+            response.headers['Content-Encoding'] = 'gzip'
+        return response
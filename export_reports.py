@@ -0,0 +1,228 @@
+import argparse, importlib.util, json, logging, multiprocessing, os, sys, time
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+from plotly.offline import get_plotlyjs
+import precompute
+
+# Batch export of the dashboard charts as reports.
+# Every (unit, month) of the dropdowns gets a report with the charts the
+# dashboard shows for it: the heat map, the location, type, hourly and
+# district graphs, the response time graphs and the type pie of the
+# selection's busiest location, drawn by the figure builders of responses.py.
+# The reports are rendered by a pool of forked worker processes sharing the
+# incident store the parent loaded; a job filters its selection once and
+# draws every chart and data extract from it.
+#
+# Formats:
+#   html     one page per report, plotly.min.js is written once next to them
+#   png pdf  one file per chart, need the kaleido package
+#   csv      the selection's incidents with a 0/1 column per unit
+#   parquet  the same, needs pyarrow or fastparquet
+#
+# Runs are resumable. manifest.json in the output directory lists every
+# finished report with the fingerprint of its month's data and bar colors
+# (precompute.py) and its formats. A rerun skips the reports whose
+# fingerprint, formats and files are unchanged, so an interrupted run picks up
+# where it stopped and new incidents only redo the reports of their month,
+# unless they change the color order of the locations or types.
+#
+#   python export_reports.py --out reports --formats html png csv --processes 4
+#   python export_reports.py --units E23 E24 --months all June July
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ('html', 'png', 'pdf', 'csv', 'parquet')
+MANIFEST = 'manifest.json'
+PAGE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>{title}</title><script src="../../plotly.min.js"></script></head>
+<body style="background-color:#0f2537;color:#ffffff;font-family:sans-serif">
+<h1>{title}</h1>
+{charts}
+</body>
+</html>
+"""
+
+
+def missing_packages(formats):
+    missing = []
+    if {'png', 'pdf'} & set(formats) and importlib.util.find_spec('kaleido') is None:
+        missing.append('kaleido (png, pdf)')
+    if 'parquet' in formats and not any(importlib.util.find_spec(p) for p in ('pyarrow', 'fastparquet')):
+        missing.append('pyarrow or fastparquet (parquet)')
+    return missing
+
+
+# directory of a report below the output directory: <month>/<unit>
+def report_dir(unit, month, months):
+    number = months[month]
+    return os.path.join(f'{number:02d}-{month}' if number else 'all-months', unit)
+
+
+def read_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'reports': {}}
+
+
+def write_manifest(out_dir, manifest):
+    tmp = os.path.join(out_dir, f'{MANIFEST}.{os.getpid()}')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST))
+
+
+def job_name(unit, month):
+    return f'{unit}|{month}'
+
+
+# True when the manifest entry covers the formats for the current data
+def finished(entry, fingerprint, formats, out_dir):
+    return (entry is not None and entry['fingerprint'] == fingerprint and set(formats) <= set(entry['formats'])
+            and all(os.path.exists(os.path.join(out_dir, f)) for f in entry['files']))
+
+
+# {chart name: figure} and the incident extract of one unit and month
+def report(unit, month):
+    import responses
+    from incident_store import get_store
+    store = get_store()
+    selection = store.query(month=responses.months[month])
+    figures = {graph: responses.build_figure(graph, selection, '--', '--', month, unit)
+               for graph in responses.dropdown_graphs + responses.response_graphs}
+
+    rows = selection.rows if unit not in responses.companies[1:] else selection.unit_rows(unit)
+    if len(rows):
+        busiest = np.bincount(store.location_codes[rows]).argmax()
+        figures['pie_freq_loc_type'] = responses.pie_location([busiest], store.locations.labels[busiest], rows)
+
+    extract = pd.concat([store.take(rows), store.unit_mask.frame(rows, store.times(rows))], axis=1)
+    return figures, extract
+
+
+# set in the parent before the pool forks: (output directory, formats)
+_settings = None
+
+
+def _export(job):
+    out_dir, formats = _settings
+    unit, month, path = job
+    start = time.perf_counter()
+    try:
+        figures, extract = report(unit, month)
+        os.makedirs(os.path.join(out_dir, path), exist_ok=True)
+        files = []
+        for fmt in ('png', 'pdf'):
+            if fmt in formats:
+                for name, figure in figures.items():
+                    files.append(os.path.join(path, f'{name}.{fmt}'))
+                    pio.write_image(figure, os.path.join(out_dir, files[-1]), format=fmt)
+        if 'html' in formats:
+            title = f"{'All Units' if unit == 'ALL' else unit}, {'All Months' if month == '--' else month}"
+            charts = '\n'.join(pio.to_html(figure, full_html=False, include_plotlyjs=False)
+                               for figure in figures.values())
+            files.append(os.path.join(path, 'report.html'))
+            with open(os.path.join(out_dir, files[-1]), 'w') as f:
+                f.write(PAGE.format(title=title, charts=charts))
+        if 'csv' in formats:
+            files.append(os.path.join(path, 'incidents.csv'))
+            extract.to_csv(os.path.join(out_dir, files[-1]))
+        if 'parquet' in formats:
+            files.append(os.path.join(path, 'incidents.parquet'))
+            extract.to_parquet(os.path.join(out_dir, files[-1]))
+    except Exception as error:
+        logger.exception('report %s %s failed', unit, month)
+        return job, None, repr(error), time.perf_counter() - start
+    return job, files, None, time.perf_counter() - start
+
+
+# export the reports (unit, month) that are not finished for the current data;
+# returns the number of failed reports
+def export(out_dir, units, months, formats, processes=None):
+    global _settings
+    import responses
+    from incident_store import get_store
+    store = get_store()
+    salt = responses.figure_salt + precompute.code_salt(__file__)
+    fingerprints = precompute.month_fingerprints(store, salt)
+    # every report has the location and type graphs, colored by their rank over every month
+    responses.load_data()
+    colors = responses.graph_salt('incidentlocation') + responses.graph_salt('incidenttype')
+    fingerprints = {month: precompute.graph_fingerprint(fingerprint, colors) for month, fingerprint in fingerprints.items()}
+
+    os.makedirs(out_dir, exist_ok=True)
+    if 'html' in formats:
+        with open(os.path.join(out_dir, 'plotly.min.js'), 'w') as f:
+            f.write(get_plotlyjs())
+    manifest = read_manifest(out_dir)
+    reports = manifest.setdefault('reports', {})
+    jobs = [(unit, month, report_dir(unit, month, responses.months)) for month in months for unit in units]
+    todo = [job for job in jobs
+            if not finished(reports.get(job_name(*job[:2])), fingerprints[responses.months[job[1]]], formats, out_dir)]
+    total = len(todo)
+    logger.info('exporting %d of %d reports to %s', total, len(jobs), out_dir)
+
+    _settings = (out_dir, formats)
+    processes = min(processes or os.cpu_count(), max(total, 1))
+    if processes > 1:
+        pool = multiprocessing.get_context('fork').Pool(processes)
+        results = pool.imap_unordered(_export, todo)
+    else:
+        pool = None
+        results = map(_export, todo)
+    start = time.time()
+    done = failed = 0
+    reported = 0
+    try:
+        for (unit, month, path), files, error, seconds in results:
+            done += 1
+            if error is None:
+                reports[job_name(unit, month)] = {'fingerprint': fingerprints[responses.months[month]],
+                                                  'formats': sorted(formats), 'files': files,
+                                                  'seconds': round(seconds, 3)}
+                write_manifest(out_dir, manifest)
+            else:
+                failed += 1
+            if done == total or time.time() - reported > 5:
+                reported = time.time()
+                elapsed = reported - start
+                logger.info('exported %d/%d reports (%.0f%%), %d failed, %.0fs left', done, total,
+                            100*done/max(total, 1), failed, elapsed/done*(total - done))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    logger.info('exported %d reports in %.1fs, %d failed', done - failed, time.time() - start, failed)
+    return failed
+
+
+def main():
+    # the app itself must not warm figures, start a precompute or load lazily
+    os.environ['DFD_WARM_FIGURES'] = '0'
+    os.environ['DFD_PRECOMPUTE'] = '0'
+    os.environ['DFD_LAZY'] = '0'
+    import responses
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--out', default='reports', help='output directory')
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=['html', 'csv'])
+    parser.add_argument('--units', nargs='+', choices=responses.companies, default=responses.companies)
+    # 'all' stands for the dropdown's '--', which argparse would take for the end of options
+    parser.add_argument('--months', nargs='+', choices=['all'] + responses.monthname[1:],
+                        default=['all'] + responses.monthname[1:], help="month names, 'all' for all months")
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+    missing = missing_packages(args.formats)
+    if missing:
+        parser.error(f"missing packages: {', '.join(missing)}")
+    months = ['--' if month == 'all' else month for month in args.months]
+    sys.exit(1 if export(args.out, args.units, months, args.formats, args.processes) else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import functools
+import threading, time
+from collections import Counter, OrderedDict
+
+# Memoized figure cache for the dashboard callbacks.
+# The dropdowns only allow a few tens of thousands of input combinations, so a
+# finished Plotly figure is kept per (figure name, normalized inputs) with LRU
+# eviction. Hit/miss counts are kept per figure and the whole cache is dropped
+# when the incident store reloads.
+
+
+class FigureCache:
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self.hits = Counter()
+        self.misses = Counter()
+        self.builds = Counter()
+        self.build_seconds = Counter()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, name, key):
+        with self._lock:
+            try:
+                figure = self._entries[(name, key)]
+            except KeyError:
+                self.misses[name] += 1
+                return None
+            self._entries.move_to_end((name, key))
+            self.hits[name] += 1
+            return figure
+
+    # store a figure, with the time it took to build for the stats
+    def put(self, name, key, figure, seconds=None):
+        with self._lock:
+            if seconds is not None:
+                self.builds[name] += 1
+                self.build_seconds[name] += seconds
+            self._entries[(name, key)] = figure
+            self._entries.move_to_end((name, key))
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self, *args):
+        with self._lock:
+            self._entries.clear()
+
+    # decorator for callbacks, key_func maps the raw callback inputs to the
+    # normalized cache key so equivalent selections share one entry
+    def cached(self, name, key_func):
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args):
+                key = key_func(*args)
+                figure = self.get(name, key)
+                if figure is None:
+                    start = time.perf_counter()
+                    figure = func(*args)
+                    self.put(name, key, figure, time.perf_counter() - start)
+                return figure
+            return wrapper
+        return decorator
+
+    # render the given input combinations ahead of the first request,
+    # render(*args) is expected to put its figures in this cache
+    def warm(self, render, inputs):
+        for args in inputs:
+            render(*args)
+
+    def stats(self):
+        with self._lock:
+            names = set(self.hits) | set(self.misses) | set(self.builds)
+            return {name: {'hits': self.hits[name],
+                           'misses': self.misses[name],
+                           'builds': self.builds[name],
+                           'mean_build_ms': 1000*self.build_seconds[name]/max(self.builds[name], 1)}
+                    for name in sorted(names)}
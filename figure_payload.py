@@ -0,0 +1,146 @@
+import base64, functools, gzip, os, re
+import numpy as np
+import plotly
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.io.json import to_json_plotly
+
+# Lean figure construction and serialization for the dashboard callbacks.
+# px.bar(color=...) draws one trace per category, each with its own
+# hovertemplate, legend group and marker settings, and repeats the category
+# list in the axis categoryarray, so a bar graph of a few hundred locations
+# is mostly trace metadata. The bar graphs here are one trace with a color
+# per bar. Every figure also carries its template; lean_template() keeps just
+# the parts of the default 'plotly' template these figures use.
+#
+# Callback figures are kept as plain dicts (compact()), so cache hits skip
+# the figure validation, with the integer arrays as base64 typed arrays when
+# the plotly.js Dash serves to the browser can decode them (2.28 and later).
+# Dash serializes the callback responses with plotly's JSON encoder, which
+# uses orjson when it is installed, and compression.py compresses them.
+
+# the plotly.min.js Dash serves to the browser: older dash_core_components
+# ship their own, newer Dash serves the bundle of plotly.py
+def served_plotlyjs_path():
+    from dash import dcc
+    path = os.path.join(os.path.dirname(dcc.__file__), 'plotly.min.js')
+    if os.path.exists(path):
+        return path
+    return os.path.join(os.path.dirname(plotly.__file__), 'package_data', 'plotly.min.js')
+
+
+# (major, minor) from the license header of a plotly.js bundle, (0, 0) when
+# it has none
+def plotlyjs_version(path):
+    try:
+        with open(path) as f:
+            match = re.search(r'plotly\.js v(\d+)\.(\d+)', f.read(500))
+    except OSError:
+        return 0, 0
+    return (int(match[1]), int(match[2])) if match else (0, 0)
+
+
+# plotly.js decodes {'dtype': ..., 'bdata': ...} typed arrays from 2.28 on
+TYPED_ARRAYS = plotlyjs_version(served_plotlyjs_path()) >= (2, 28)
+
+# template parts used by the dashboard's bar, pie and density map figures
+TEMPLATE_LAYOUT = ('autotypenumbers', 'colorway', 'font', 'hovermode', 'hoverlabel', 'paper_bgcolor',
+                   'plot_bgcolor', 'coloraxis', 'xaxis', 'yaxis', 'shapedefaults', 'annotationdefaults',
+                   'title', 'mapbox')
+TEMPLATE_DATA = ('bar', 'pie', 'densitymapbox')
+
+
+# built on first use, loading the templates is a noticeable part of start up
+@functools.lru_cache(maxsize=None)
+def lean_template(name='plotly'):
+    template = pio.templates[name].to_plotly_json()
+    return go.layout.Template(layout={k: v for k, v in template['layout'].items() if k in TEMPLATE_LAYOUT},
+                              data={k: v for k, v in template['data'].items() if k in TEMPLATE_DATA})
+
+
+# one bar trace for a count series in place of px.bar(color=x), colors is a
+# single color or one per bar
+def bar(counts, colors, x, y, title, height=600, width=800):
+    figure = go.Figure(go.Bar(x=counts.index.to_numpy(),
+                              y=counts.to_numpy(),
+                              marker_color=colors,
+                              hovertemplate=f'{x}=%{{x}}<br>{y}=%{{y}}<extra></extra>'),
+                       layout=dict(template=lean_template(), title=title, height=height, width=width,
+                                   margin={'t': 60}))
+    figure.update_xaxes(title_text=x)
+    figure.update_yaxes(title_text=y)
+    return figure
+
+
+# one bar trace per column of a table (e.g. the p50 and p90 of each group)
+# side by side, colors one per column
+def grouped_bar(table, colors, x, y, title, height=600, width=800):
+    figure = go.Figure([go.Bar(x=table.index.to_numpy(),
+                               y=table[column].to_numpy(),
+                               name=str(column),
+                               marker_color=color,
+                               hovertemplate=f'{column}<br>{x}=%{{x}}<br>{y}=%{{y}}<extra></extra>')
+                        for column, color in zip(table.columns, colors)],
+                       layout=dict(template=lean_template(), title=title, height=height, width=width,
+                                   margin={'t': 60}, barmode='group'))
+    figure.update_xaxes(title_text=x)
+    figure.update_yaxes(title_text=y)
+    return figure
+
+
+# pie of pre-counted labels in place of px.pie over one row per incident,
+# colors are assigned in label order like px does by first appearance
+def pie(counts, color_sequence, name, title, height=600, width=800):
+    colors = [color_sequence[k % len(color_sequence)] for k in range(len(counts))]
+    return go.Figure(go.Pie(labels=counts.index.to_numpy(),
+                            values=counts.to_numpy(),
+                            marker_colors=colors,
+                            hovertemplate=f'{name}=%{{label}}<br>count=%{{value}}<extra></extra>'),
+                     layout=dict(template=lean_template(), title=title, height=height, width=width,
+                                 margin={'t': 60}))
+
+
+_INT_TYPES = [('u1', np.uint8), ('u2', np.uint16), ('i4', np.int32), ('u4', np.uint32)]
+
+
+# base64 typed array of an integer array in the smallest dtype that holds it
+def typed_array(values):
+    low, high = (int(values.min()), int(values.max())) if len(values) else (0, 0)
+    for dtype, numpy_type in _INT_TYPES:
+        info = np.iinfo(numpy_type)
+        if info.min <= low and high <= info.max:
+            data = np.ascontiguousarray(values, dtype=np.dtype(numpy_type).newbyteorder('<'))
+            return {'dtype': dtype, 'bdata': base64.b64encode(data.tobytes()).decode()}
+    return values
+
+
+def _encode(node):
+    for key, value in node.items():
+        if isinstance(value, np.ndarray) and value.ndim == 1 and value.dtype.kind in 'iu':
+            node[key] = typed_array(value)
+        elif isinstance(value, dict):
+            _encode(value)
+
+
+# figure as a plain dict ready for Dash, integer data arrays (counts, grid
+# cell weights) as typed arrays; float arrays stay JSON numbers, their
+# rounded decimal text is shorter than 8 bytes of base64
+def compact(figure, typed=TYPED_ARRAYS):
+    if isinstance(figure, go.Figure):
+        figure = figure.to_plotly_json()
+    if typed:
+        for trace in figure.get('data', []):
+            _encode(trace)
+    return figure
+
+
+# JSON text of a figure, or of the list of figures a callback returns, the
+# way Dash serializes it
+def to_json(figures):
+    return to_json_plotly(figures)
+
+
+# JSON bytes and gzip'd JSON bytes, for the benchmarks
+def payload_bytes(figures):
+    text = to_json(figures).encode()
+    return len(text), len(gzip.compress(text, 6))
@@ -0,0 +1,494 @@
+import copy, itertools, os, threading
+import numpy as np
+import pandas as pd
+import columnar_cache
+from aggregates import FOLD_ROWS, IncidentCube
+from response_times import ResponseTimes
+from spatial_grid import DISTRICTS, SpatialGrid, assign_districts
+from time_bins import NO_SELECTION, seconds_of_day
+from unit_mask import UnitMask
+
+# Shared in-memory incident store for the response dashboard.
+# The First Due CSV is parsed once per process through IncidentData and kept
+# sorted on its DatetimeIndex. Months and locations get a categorical index
+# (CategoryIndex, LocationIndex: code -> row positions) and the units of every
+# incident a bitmask (UnitMask), so a dropdown selection only touches the rows
+# it returns instead of re-reading and re-filtering the data.
+#
+# With DFD_INCIDENT_CSV set to the CSV IncidentData reads, the cleaned frame is
+# loaded from a memory-mapped columnar cache (DFD_CACHE_DIR, default
+# .incident_cache) that is rebuilt whenever the CSV changes.
+#
+# The rows are partitioned by year and month. As they are time ordered every
+# partition is a contiguous row range, so a date range is found by searching
+# only the partitions its ends fall in and selects one slice of the columns.
+#
+# New incidents are added with append_incidents(): the codes, indexes, count
+# cubes and grid are extended with the new rows only, into a new store that
+# replaces the old one, so callbacks still reading the old store are not
+# affected. The new rows are kept in a tail frame next to the frame the store
+# was loaded with, which (memory-mapped from the columnar cache) is shared with
+# the old store, until FOLD_ROWS of them have been appended and the two are
+# joined once. Rows taken across both keep the loaded categorical columns,
+# with the loaded categories followed by the values only appended rows have.
+
+
+# every incident and its unit assignments, parsed from the CSV by IncidentData
+def read_incident_data():
+    from Incident_Data import IncidentData
+    data = IncidentData('', '', '')
+    return data.all(), data.unit_df()
+
+
+# integer codes (first appearance order, nulls get a code too) and names
+def _factorize(values):
+    codes, names = pd.factorize(values, use_na_sentinel=False)
+    return codes, pd.Index(np.asarray(names, dtype=object))
+
+
+# codes for new values against existing names, unseen values get new codes
+def _extend_codes(names, values):
+    codes = names.get_indexer(pd.Index(np.asarray(values, dtype=object)))
+    unseen = codes < 0
+    if unseen.any():
+        new_codes, new_names = _factorize(np.asarray(values, dtype=object)[unseen])
+        codes[unseen] = len(names) + new_codes
+        names = names.append(new_names)
+    return codes, names
+
+
+# columns with a categorical dtype, the text columns of the columnar cache
+def _categorical(frame):
+    return [name for name in frame.columns if isinstance(frame[name].dtype, pd.CategoricalDtype)]
+
+
+# new rows with the columns of like, its float columns (float32 coordinates
+# of the columnar cache) cast to like's type and categorical ones left plain
+def _conform(frame, like):
+    frame = frame.reindex(columns=like.columns)
+    for name in like.columns:
+        if pd.api.types.is_float_dtype(like[name].dtype):
+            frame[name] = frame[name].astype(like[name].dtype)
+    return frame.astype({name: object for name in _categorical(like)})
+
+
+# year/month partitions of time ordered rows: the period (year*12 + month-1)
+# and the first row of each partition
+def _partitions(index, start=0):
+    periods = (index.year*12 + index.month - 1).to_numpy(np.int64)
+    if len(periods) == 0:
+        return periods, np.empty(0, dtype=np.int64)
+    first = np.concatenate([[0], np.flatnonzero(periods[1:] != periods[:-1]) + 1])
+    return periods[first], start + first
+
+
+_versions = itertools.count()
+
+
+# Categorical index: one stable argsort of the codes plus offsets, so the
+# rows for a code are a contiguous (and still time ordered) slice.
+class CategoryIndex:
+
+    def __init__(self, codes, n_codes):
+        codes = np.asarray(codes, dtype=np.int64)
+        self.order = np.argsort(codes, kind='stable')
+        self.offsets = np.zeros(n_codes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=n_codes), out=self.offsets[1:])
+
+    def rows(self, code):
+        return self.order[self.offsets[code]:self.offsets[code+1]]
+
+    # a copy with the rows start, start+1, ... (codes) added; they come after
+    # every existing row, so they go at the end of their code's slice
+    def extended(self, codes, start, n_codes):
+        codes = np.asarray(codes, dtype=np.int64)
+        old_counts = np.zeros(n_codes, dtype=np.int64)
+        old_counts[:len(self.offsets) - 1] = np.diff(self.offsets)
+        new_counts = np.bincount(codes, minlength=n_codes)
+
+        index = copy.copy(self)
+        index.offsets = np.zeros(n_codes + 1, dtype=np.int64)
+        np.cumsum(old_counts + new_counts, out=index.offsets[1:])
+        index.order = np.empty(len(self.order) + len(codes), dtype=np.int64)
+        old = np.repeat(np.arange(n_codes), old_counts)
+        index.order[index.offsets[old] + np.arange(len(old)) - self.offsets[old]] = self.order
+        new = np.repeat(np.arange(n_codes), new_counts)
+        new_offsets = np.concatenate([[0], np.cumsum(new_counts)])
+        index.order[index.offsets[new] + old_counts[new] + np.arange(len(new)) - new_offsets[new]] = \
+            start + np.argsort(codes, kind='stable')
+        return index
+
+    def count(self, code):
+        return int(self.offsets[code+1] - self.offsets[code])
+
+
+# Location dictionary encoding: an integer code for every LOCATION, the rows
+# for each code as one contiguous slice of the index, and exact lookups by the
+# full location name or the dropdown label (the name without its last 11
+# characters, city and state). Label lookups can resolve to several codes when
+# two full names only differ in the trimmed part.
+class LocationIndex(CategoryIndex):
+
+    def __init__(self, codes, names):
+        super().__init__(codes, len(names))
+        self.names = names
+        self.labels = names.str[:-11]
+        self._codes = {}
+        self._add_names(0)
+
+    def _add_names(self, start):
+        for code in range(start, len(self.names)):
+            name, label = self.names[code], self.labels[code]
+            self._codes.setdefault(name, []).append(code)
+            if label != name:
+                self._codes.setdefault(label, []).append(code)
+
+    def extended(self, codes, start, names):
+        index = super().extended(codes, start, len(names))
+        index.names = names
+        index.labels = names.str[:-11]
+        index._codes = {key: list(value) for key, value in self._codes.items()}
+        index._add_names(len(self.names))
+        return index
+
+    def lookup(self, name):
+        return self._codes.get(name, [])
+
+    def rows(self, codes):
+        if np.ndim(codes) == 0:
+            return super().rows(codes)
+        return np.sort(np.concatenate([super(LocationIndex, self).rows(c) for c in codes]))
+
+    def count(self, codes):
+        if np.ndim(codes) == 0:
+            return super().count(codes)
+        return sum(super(LocationIndex, self).count(c) for c in codes)
+
+    # incidents per dropdown label, largest first
+    def label_counts(self):
+        counts = pd.Series(np.diff(self.offsets), index=self.labels)
+        counts = counts[counts.index.notna()]
+        return counts.groupby(level=0, sort=False).sum().sort_values(ascending=False, kind='stable')
+
+
+# Row selection over the store with the same interface as IncidentData
+# (all, company, unit_df) so the figure builders can take either one.
+class IncidentView:
+
+    def __init__(self, store, rows, time1='', time2='', month=0, dates=None):
+        self.store = store
+        self.rows = rows
+        self.time1 = time1
+        self.time2 = time2
+        self.month = month
+        self.dates = dates
+
+    def __len__(self):
+        return len(self.rows)
+
+    def all(self):
+        return self.store.take(self.rows)
+
+    def unit_rows(self, unit):
+        return self.store.unit_filter(self.rows, unit)
+
+    def company(self, unit):
+        return self.store.take(self.store.unit_filter(self.rows, unit))
+
+    def unit_df(self):
+        return self.store.unit_mask.frame(self.rows, self.store.times(self.rows))
+
+    # counts for the same selection answered from the store's count cube
+    def location_counts(self, unit=None):
+        return self.store.cube.location_counts(self.time1, self.time2, self.month, unit, self.dates)
+
+    def type_counts(self, unit=None, sort=True):
+        return self.store.cube.type_counts(self.time1, self.time2, self.month, unit, sort, self.dates)
+
+    def hour_counts(self, unit=None):
+        return self.store.cube.hour_counts(self.time1, self.time2, self.month, unit, self.dates)
+
+    def district_counts(self, unit=None):
+        return self.store.district_counts(self.rows if unit is None else self.unit_rows(unit))
+
+    # response time percentiles and histograms, from the store's summary cache
+    # or counted from the rows of this selection
+    def response_summary(self, unit=None):
+        rows = self.rows if unit is None else self.unit_rows(unit)
+        return self.store.response_times.summary(self.time1, self.time2, self.month, unit, self.dates, rows)
+
+
+class IncidentStore:
+
+    # units: the 0/1 incident x unit frame of IncidentData or a UnitMask
+    def __init__(self, frame, units):
+        if not isinstance(units, UnitMask):
+            units = UnitMask.from_frame(units)
+        # keep incidents and their unit assignments in time order
+        if not frame.index.is_monotonic_increasing:
+            order = np.argsort(frame.index.values, kind='stable')
+            frame = frame.iloc[order]
+            units = units.take(order)
+        self.base_frame = frame
+        # incidents appended after base_frame, and both joined when asked for
+        self.tail_frame = _conform(frame.iloc[:0], frame)
+        self._frame = None
+        self._joined = {}
+        self.unit_mask = units
+        self.unit_names = units.names
+
+        idx = frame.index
+        self.timestamps = idx.asi8
+        self.partition_periods, starts = _partitions(idx)
+        self.partition_bounds = np.append(starts, len(idx))
+        self.sod = (idx.hour*3600 + idx.minute*60 + idx.second).to_numpy(np.int32)
+        self.month_codes = (idx.month.to_numpy() - 1).astype(np.int8)
+        self.month_index = CategoryIndex(self.month_codes, 12)
+
+        self.type_codes, self.type_names = _factorize(frame['TYPE'])
+        self.location_codes, self.location_names = _factorize(frame['LOCATION'])
+        self.locations = LocationIndex(self.location_codes, self.location_names)
+
+        self.version = next(_versions)
+
+        # location/type/unit/month/hour counts for the tables and bar graphs
+        self.cube = IncidentCube(self)
+        # grid cell of every incident for the heat map
+        self.grid = SpatialGrid(frame['LATITUDE'], frame['LONGITUDE'])
+        # response district (district polygon or nearest station) of every incident
+        self.district_codes = assign_districts(self.grid.latitude, self.grid.longitude)
+        # turnout / travel / response seconds, when the data has the unit times
+        self.response_times = ResponseTimes(self)
+
+    @classmethod
+    def load(cls):
+        csv_path = os.environ.get('DFD_INCIDENT_CSV')
+        if csv_path and os.path.exists(csv_path):
+            cache_dir = os.environ.get('DFD_CACHE_DIR', '.incident_cache')
+            return cls(*columnar_cache.load_or_build(csv_path, cache_dir, read_incident_data))
+        return cls(*read_incident_data())
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    # every incident as one frame, joined once per store when there are appended ones
+    @property
+    def frame(self):
+        if len(self.tail_frame) == 0:
+            return self.base_frame
+        if self._frame is None:
+            self._frame = self.take(np.arange(len(self.base_frame) + len(self.tail_frame)))
+        return self._frame
+
+    # dtype of a categorical column over every incident, the loaded categories
+    # followed by the values only appended rows have, and the codes of the
+    # appended rows in it; built once per store
+    def _joined_column(self, name):
+        joined = self._joined.get(name)
+        if joined is None:
+            dtype = self.base_frame[name].dtype
+            values = self.tail_frame[name].to_numpy(object)
+            codes = dtype.categories.get_indexer(values)
+            new = (codes < 0) & pd.notna(values)
+            if new.any():
+                new_codes, new_names = pd.factorize(values[new])
+                codes[new] = len(dtype.categories) + new_codes
+                dtype = pd.CategoricalDtype(dtype.categories.append(pd.Index(new_names, dtype=object)), dtype.ordered)
+            joined = self._joined[name] = (dtype, codes)
+        return joined
+
+    # incidents at row positions, the appended ones read from the tail frame
+    def take(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        start = len(self.base_frame)
+        tail = rows >= start
+        if not tail.any():
+            return self.base_frame.iloc[rows]
+        base = self.base_frame.iloc[rows[~tail]]
+        categorical = _categorical(base)
+        frame = pd.concat([base.drop(columns=categorical),
+                           self.tail_frame.iloc[rows[tail] - start].drop(columns=categorical)])
+        for name in categorical:
+            dtype, codes = self._joined_column(name)
+            codes = np.concatenate([base[name].cat.codes.to_numpy(np.int64), codes[rows[tail] - start]])
+            frame[name] = pd.Categorical.from_codes(codes, dtype=dtype)
+        frame = frame[self.base_frame.columns]
+        # back from loaded rows then appended rows to the order of rows
+        return frame.iloc[np.argsort(np.argsort(tail, kind='stable'), kind='stable')]
+
+    # time index of row positions (the Timestamp of a single row)
+    def times(self, rows):
+        index = self.base_frame.index
+        if np.ndim(rows) == 0:
+            return pd.Timestamp(self.timestamps[rows], tz=index.tz)
+        return pd.DatetimeIndex(self.timestamps[rows], tz=index.tz, name=index.name)
+
+    # a new store with the incidents in frame and their unit assignments added.
+    # Only the new rows are coded and counted; this store is left unchanged.
+    # Units not seen before get their own column, and a batch older than the
+    # newest stored incident (which would break the time order) rebuilds.
+    def append(self, frame, units):
+        if len(frame) == 0:
+            return self
+        order = np.argsort(frame.index.values, kind='stable')
+        frame = _conform(frame.iloc[order], self.base_frame)
+        unit_mask = self.unit_mask.extended(units.iloc[order])
+        if len(self) and frame.index[0].value < self.timestamps[-1]:
+            categorical = _categorical(self.base_frame)
+            frame = pd.concat([_conform(self.frame, self.base_frame), frame])
+            return IncidentStore(frame.astype({name: 'category' for name in categorical}), unit_mask)
+
+        start = len(self)
+        store = copy.copy(self)
+        store.tail_frame = pd.concat([self.tail_frame, frame])
+        store._frame = None
+        store._joined = {}
+        if len(store.tail_frame) >= FOLD_ROWS:
+            store.base_frame = store.frame
+            store.tail_frame = _conform(store.base_frame.iloc[:0], store.base_frame)
+            store._frame = None
+            store._joined = {}
+        store.unit_mask = unit_mask
+        store.unit_names = unit_mask.names
+
+        idx = frame.index
+        store.timestamps = np.concatenate([self.timestamps, idx.asi8])
+        periods, starts = _partitions(idx, start)
+        if len(self.partition_periods) and periods[0] == self.partition_periods[-1]:
+            periods, starts = periods[1:], starts[1:]
+        store.partition_periods = np.concatenate([self.partition_periods, periods])
+        store.partition_bounds = np.concatenate([self.partition_bounds[:-1], starts, [start + len(frame)]])
+        sod = (idx.hour*3600 + idx.minute*60 + idx.second).to_numpy(np.int32)
+        month_codes = (idx.month.to_numpy() - 1).astype(np.int8)
+        store.sod = np.concatenate([self.sod, sod])
+        store.month_codes = np.concatenate([self.month_codes, month_codes])
+        store.month_index = self.month_index.extended(month_codes, start, 12)
+
+        type_codes, store.type_names = _extend_codes(self.type_names, frame['TYPE'])
+        store.type_codes = np.concatenate([self.type_codes, type_codes])
+        location_codes, store.location_names = _extend_codes(self.location_names, frame['LOCATION'])
+        store.location_codes = np.concatenate([self.location_codes, location_codes])
+        store.locations = self.locations.extended(location_codes, start, store.location_names)
+
+        store.version = next(_versions)
+
+        store.cube = self.cube.extended(store, np.arange(start, len(store)))
+        store.grid = copy.copy(self.grid)
+        store.grid.extend(frame['LATITUDE'], frame['LONGITUDE'])
+        store.district_codes = np.concatenate([self.district_codes,
+                                               assign_districts(frame['LATITUDE'], frame['LONGITUDE'])])
+        store.response_times = self.response_times.extended(store, frame)
+        return store
+
+    # first row at or after a timestamp, searching only the partition of its month
+    def _partition_search(self, timestamp):
+        period = timestamp.year*12 + timestamp.month - 1
+        p = np.searchsorted(self.partition_periods, period)
+        if p == len(self.partition_periods):
+            return len(self)
+        first, last = self.partition_bounds[p], self.partition_bounds[p+1]
+        if self.partition_periods[p] != period:
+            return int(first)
+        return int(first + np.searchsorted(self.timestamps[first:last], timestamp.value))
+
+    # row range [lo, hi) for a (start date, end date) range, both inclusive
+    # and either one open
+    def date_range(self, dates=None):
+        if dates is None:
+            return 0, len(self)
+        start, end = dates
+        lo = 0 if start is None else self._partition_search(pd.Timestamp(start).normalize())
+        hi = len(self) if end is None else \
+            self._partition_search(pd.Timestamp(end).normalize() + pd.Timedelta(days=1))
+        return lo, max(lo, hi)
+
+    # row positions for a start/end time, month number (1-12), unit and date range
+    def select(self, time1='', time2='', month=0, unit=None, dates=None):
+        lo, hi = self.date_range(dates)
+        if month in NO_SELECTION:
+            rows = np.arange(lo, hi)
+        else:
+            rows = self.month_index.rows(month - 1)
+            if dates is not None:
+                rows = rows[np.searchsorted(rows, lo):np.searchsorted(rows, hi)]
+        return self.filter_rows(rows, time1, time2, unit)
+
+    # the rows of a selection within a start/end time and unit
+    def filter_rows(self, rows, time1='', time2='', unit=None):
+        if unit is not None:
+            rows = self.unit_filter(rows, unit)
+
+        if time1 not in NO_SELECTION or time2 not in NO_SELECTION:
+            start = 0 if time1 in NO_SELECTION else seconds_of_day(time1)
+            end = 86399 if time2 in NO_SELECTION else seconds_of_day(time2)
+            sod = self.sod[rows]
+            # same semantics as DatetimeIndex.indexer_between_time, wrapping midnight
+            if start <= end:
+                rows = rows[(sod >= start) & (sod <= end)]
+            else:
+                rows = rows[(sod >= start) | (sod <= end)]
+        return rows
+
+    # rows a unit responded to
+    def unit_filter(self, rows, unit):
+        return self.unit_mask.filter(rows, unit)
+
+    # rows of the incidents within meters of a point
+    def rows_within(self, latitude, longitude, meters):
+        return self.grid.within(latitude, longitude, meters)
+
+    # rows of the incidents inside a polygon of (lat, lon) rings
+    def rows_in_polygon(self, rings):
+        return self.grid.in_polygon(rings)
+
+    # incidents per district for a row selection
+    def district_counts(self, rows):
+        codes = self.district_codes[rows]
+        return pd.Series(np.bincount(codes[codes >= 0], minlength=len(DISTRICTS)), index=list(DISTRICTS))
+
+    def query(self, time1='', time2='', month=0, dates=None):
+        return IncidentView(self, self.select(time1, time2, month, dates=dates), time1, time2, month, dates)
+
+
+_store = None
+_store_lock = threading.Lock()
+_append_lock = threading.Lock()
+_reload_listeners = []
+
+
+# process wide store, loaded on first use
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = IncidentStore.load()
+    return _store
+
+
+# swap in a new store and tell anything holding derived data (caches) about it
+def set_store(store):
+    global _store
+    with _store_lock:
+        _store = store
+    for listener in list(_reload_listeners):
+        listener(store)
+
+
+# add new incidents to the process wide store
+def append_incidents(frame, units):
+    with _append_lock:
+        store = get_store().append(frame, units)
+        if store is not _store:
+            set_store(store)
+    return store
+
+
+def reload_store():
+    set_store(IncidentStore.load())
+    return _store
+
+
+def on_reload(listener):
+    _reload_listeners.append(listener)
+    return listener
@@ -0,0 +1,176 @@
+import hmac, io, json, logging, os, threading, time
+import pandas as pd
+import flask
+from incident_store import append_incidents, get_store
+
+# Append-only ingest of new incidents.
+# New incidents are POSTed to /ingest, as a JSON list of records or as CSV
+# text, or dropped as .json / .csv files into DFD_INGEST_DIR. A record has the
+# incident columns (INCIDENT, TYPE, LOCATION, ADDRESS, LATITUDE, LONGITUDE),
+# its date and time under the name of the incident index ('TIME' if the index
+# is unnamed) and UNITS, the responding units separated by commas:
+#
+#   curl -X POST localhost:8050/ingest -H 'Content-Type: application/json' \
+#        -d '[{"TIME": "2024-01-02 03:04:05", "INCIDENT": "24-000001", "TYPE": "...",
+#              "LOCATION": "...", "LATITUDE": 41.39, "LONGITUDE": -73.45, "UNITS": "E22,T1"}]'
+#
+# The drop directory is an append log. Every worker process polls it and
+# appends the files it has not seen yet, so all gunicorn workers pick up a
+# batch, and after a restart the logged batches are appended again on top of
+# the CSV. A POST is written to the directory when one is configured.
+# Batches have to appear in the directory whole: write them under a name
+# starting with '.', which is ignored, and rename them (as write() does).
+# A batch is only marked seen once it is parsed. One that cannot be read is
+# tried again on the next poll, one that does not parse once the file changes.
+# Only local clients may POST unless DFD_INGEST_TOKEN is set, then the
+# request needs an 'Authorization: Bearer <token>' header.
+
+logger = logging.getLogger(__name__)
+
+BATCH_SUFFIXES = ('.json', '.csv')
+
+
+def time_field(store):
+    return store.base_frame.index.name or 'TIME'
+
+
+# incident frame and unit matrix for a list of records
+def parse_records(records, store):
+    frame = pd.DataFrame.from_records(records)
+    field = time_field(store)
+    if field not in frame:
+        raise ValueError(f'incidents need a {field} column')
+    index = pd.DatetimeIndex(pd.to_datetime(frame.pop(field)), name=store.base_frame.index.name)
+    if index.isna().any():
+        raise ValueError(f'missing {field} values')
+
+    unit_lists = frame.pop('UNITS') if 'UNITS' in frame else pd.Series('', index=frame.index)
+    unit_lists = unit_lists.map(lambda u: ','.join(u) if isinstance(u, (list, tuple)) else u)
+    units = unit_lists.fillna('').astype(str).str.replace(' ', '').str.get_dummies(sep=',')
+    units.index = index
+
+    for column in ('LATITUDE', 'LONGITUDE'):
+        if column in frame:
+            frame[column] = pd.to_numeric(frame[column], errors='coerce')
+    frame.index = index
+    return frame, units
+
+
+def read_batch(data, suffix, store):
+    if suffix == '.csv':
+        records = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False, na_values=['']).to_dict('records')
+    else:
+        records = json.loads(data)
+        if isinstance(records, dict):
+            records = [records]
+    return parse_records(records, store)
+
+
+class DropDirectory:
+
+    def __init__(self, path, interval=10):
+        self.path = path
+        self.interval = interval
+        self.seen = set()
+        # batches that did not parse: name -> (size, mtime) of the file then
+        self.failed = {}
+        self._lock = threading.Lock()
+        self._pid = None
+        os.makedirs(path, exist_ok=True)
+
+    # write a batch into the log, under a name that sorts after earlier batches
+    def write(self, data, suffix):
+        name = f'{time.time_ns()}-{os.getpid()}{suffix}'
+        tmp = os.path.join(self.path, f'.{name}')
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, os.path.join(self.path, name))
+
+    # append every batch not seen by this process yet, returns the incident count
+    def poll(self):
+        with self._lock:
+            names = sorted(n for n in os.listdir(self.path)
+                           if n.endswith(BATCH_SUFFIXES) and not n.startswith('.') and n not in self.seen)
+            store = get_store()
+            parsed, frames, units = [], [], []
+            for name in names:
+                path = os.path.join(self.path, name)
+                try:
+                    stat = os.stat(path)
+                    if self.failed.get(name) == (stat.st_size, stat.st_mtime_ns):
+                        continue
+                    with open(path, 'rb') as f:
+                        frame, unit_matrix = read_batch(f.read(), os.path.splitext(name)[1], store)
+                except OSError as error:
+                    logger.warning('could not read incident batch %s: %s', name, error)
+                    continue
+                except (ValueError, KeyError, TypeError) as error:
+                    logger.warning('skipping incident batch %s until it changes: %s', name, error)
+                    self.failed[name] = (stat.st_size, stat.st_mtime_ns)
+                    continue
+                self.failed.pop(name, None)
+                parsed.append(name)
+                frames.append(frame)
+                units.append(unit_matrix)
+            if not frames:
+                return 0
+            append_incidents(pd.concat(frames), pd.concat(units).fillna(0).astype(int))
+            self.seen.update(parsed)
+            return sum(len(frame) for frame in frames)
+
+    def _watch(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.poll()
+            except Exception:
+                logger.exception('incident drop directory poll failed')
+
+    # one polling thread per process (threads do not survive a fork, so each
+    # gunicorn worker starts its own on its first request)
+    def start(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            threading.Thread(target=self._watch, daemon=True).start()
+
+
+def _authorized(token):
+    if token:
+        header = flask.request.headers.get('Authorization', '')
+        return hmac.compare_digest(header, f'Bearer {token}')
+    return flask.request.remote_addr in ('127.0.0.1', '::1')
+
+
+# poll=False leaves the first read of the drop directory to the caller
+def init_app(server, drop_dir=None, interval=None, token=None, poll=True):
+    drop_dir = drop_dir or os.environ.get('DFD_INGEST_DIR')
+    interval = interval or float(os.environ.get('DFD_INGEST_POLL_SECONDS', 10))
+    token = token or os.environ.get('DFD_INGEST_TOKEN')
+    watcher = None
+    if drop_dir:
+        watcher = DropDirectory(drop_dir, interval)
+        if poll:
+            watcher.poll()
+
+        @server.before_request
+        def _start_watcher():
+            watcher.start()
+
+    @server.route('/ingest', methods=['POST'])
+    def _ingest():
+        if not _authorized(token):
+            flask.abort(403)
+        suffix = '.csv' if flask.request.mimetype == 'text/csv' else '.json'
+        data = flask.request.get_data()
+        try:
+            frame, units = read_batch(data, suffix, get_store())
+        except (ValueError, KeyError, TypeError) as error:
+            return flask.jsonify(error=str(error)), 400
+        if watcher:
+            watcher.write(data, suffix)
+            watcher.poll()
+        else:
+            append_incidents(frame, units)
+        return flask.jsonify(incidents=len(frame), total=len(get_store()))
+
+    return watcher
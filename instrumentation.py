@@ -0,0 +1,150 @@
+import bisect, cProfile, os, threading, time
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+import flask
+
+# Callback latency instrumentation for the dashboard.
+# Callbacks time their data filtering and figure construction phases. The
+# Flask hooks time the whole /_dash-update-component request and record the
+# response size; the part of the request outside the callback phases is
+# recorded as the 'serialize' phase (Dash serializing the figures to JSON).
+# Everything is kept as cumulative histograms plus a rolling window of the
+# most recent observations, and served in the Prometheus text format on
+# /metrics. With DFD_PROFILE=1 every callback request is run under cProfile
+# and its stats are written to DFD_PROFILE_DIR (default 'profiles').
+
+SECONDS_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+BYTES_BUCKETS = (1e3, 1e4, 5e4, 1e5, 5e5, 1e6, 5e6, 1e7)
+QUANTILES = (.5, .9, .99)
+
+
+class Histogram:
+
+    def __init__(self, buckets, window=1024):
+        self.buckets = buckets
+        self.counts = [0]*(len(buckets) + 1)
+        self.sum = 0.0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def quantiles(self):
+        if not self.recent:
+            return {}
+        return dict(zip(QUANTILES, np.quantile(np.fromiter(self.recent, float), QUANTILES)))
+
+
+def _labels(labels):
+    return ','.join(f'{k}="{v}"' for k, v in labels)
+
+
+class Metrics:
+
+    def __init__(self):
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self.collectors = []
+        self.profile_dir = None
+
+    def observe(self, name, value, buckets=SECONDS_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    # name the callback the current request runs, for the request metrics
+    def callback(self, callback):
+        if flask.has_request_context():
+            flask.g.dfd_callback = callback
+
+    # callback phase timing; the seconds are also added to the request so the
+    # after_request hook can split off the serialization time
+    def phase(self, callback, phase, seconds, **labels):
+        self.observe('dfd_callback_seconds', seconds, callback=callback, phase=phase, **labels)
+        if flask.has_request_context():
+            flask.g.dfd_callback = callback
+            flask.g.dfd_callback_seconds = flask.g.get('dfd_callback_seconds', 0) + seconds
+
+    @contextmanager
+    def time(self, callback, phase, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phase(callback, phase, time.perf_counter() - start, **labels)
+
+    # extra metric lines, e.g. the figure cache counters
+    def collector(self, func):
+        self.collectors.append(func)
+        return func
+
+    def render(self):
+        lines = []
+        with self._lock:
+            items = sorted(self.histograms.items())
+        seen = set()
+        for (name, labels), histogram in items:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f'# TYPE {name} histogram')
+            cumulative = 0
+            for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{_labels(labels + (("le", bound),))}}} {cumulative}')
+            lines.append(f'{name}_sum{{{_labels(labels)}}} {histogram.sum}')
+            lines.append(f'{name}_count{{{_labels(labels)}}} {cumulative}')
+        seen = set()
+        for (name, labels), histogram in items:
+            if name not in seen:
+                seen.add(name)
+                lines.append(f'# TYPE {name}_recent gauge')
+            for q, value in histogram.quantiles().items():
+                lines.append(f'{name}_recent{{{_labels(labels + (("quantile", q),))}}} {value}')
+        for func in self.collectors:
+            lines.extend(func())
+        return '\n'.join(lines) + '\n'
+
+    def init_app(self, server, profile=None, profile_dir=None):
+        profile = os.environ.get('DFD_PROFILE') == '1' if profile is None else profile
+        if profile:
+            self.profile_dir = profile_dir or os.environ.get('DFD_PROFILE_DIR', 'profiles')
+            os.makedirs(self.profile_dir, exist_ok=True)
+
+        @server.before_request
+        def _start_request():
+            if flask.request.path.endswith('/_dash-update-component'):
+                flask.g.dfd_start = time.perf_counter()
+                if self.profile_dir:
+                    flask.g.dfd_profile = cProfile.Profile()
+                    flask.g.dfd_profile.enable()
+
+        @server.after_request
+        def _end_request(response):
+            start = flask.g.get('dfd_start')
+            if start is None:
+                return response
+            total = time.perf_counter() - start
+            callback = flask.g.get('dfd_callback') or (flask.request.get_json(silent=True) or {}).get('output', 'other')
+            profile = flask.g.get('dfd_profile')
+            if profile is not None:
+                profile.disable()
+                profile.dump_stats(os.path.join(self.profile_dir, f'{time.time():.3f}-{callback}.prof'))
+            self.observe('dfd_request_seconds', total, callback=callback)
+            self.observe('dfd_callback_seconds', max(total - flask.g.get('dfd_callback_seconds', 0), 0),
+                         callback=callback, phase='serialize')
+            if response.content_length is not None:
+                self.observe('dfd_response_bytes', response.content_length, BYTES_BUCKETS, callback=callback)
+            return response
+
+        @server.route('/metrics')
+        def _metrics():
+            return flask.Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+
+metrics = Metrics()
@@ -0,0 +1,54 @@
+import functools, hashlib
+import numpy as np
+import pandas as pd
+
+# Color ramps for the bar graphs.
+# A ramp is the linear interpolation between a palette's two end colors (like
+# px.colors.n_colors), computed once per (palette, n) with NumPy and kept in
+# an LRU cache, so a render only looks colors up. CategoryColors gives every
+# category the color of its position in a fixed order, e.g. its overall rank,
+# so a location or response type keeps its color whichever filter is applied.
+
+# (low, high) rgb of each palette, the names graph_colors takes
+PALETTES = {'red': ((165, 0, 0), (255, 0, 0)),
+            'blue': ((0, 0.001, 150), (0, 150, 150)),
+            'green': ((0, 150, 0.001), (0, 125, 125)),
+            'yellow': ((255, 255, 0), (255, 125, 0)),
+            'dark_blue': ((0.001, 0.001, 75), (50, 50, 200)),
+            'rd_bl': ((255, 0.001, 0.001), (0.001, 0.001, 255)),
+            'gr_bl': ((0, 255, 0.001), (0, 0.001, 255))}
+
+
+_HEX = np.array([f'{k:02x}' for k in range(256)], dtype=object)
+
+
+# n '#rrggbb' colors from the palette's low to its high color
+@functools.lru_cache(maxsize=256)
+def ramp(palette, n):
+    low, high = np.array(PALETTES[palette], dtype=np.float64)
+    rgb = np.rint(low + np.linspace(0, 1, n)[:, None]*(high - low)).astype(np.int64)
+    return tuple('#' + _HEX[rgb[:, 0]] + _HEX[rgb[:, 1]] + _HEX[rgb[:, 2]])
+
+
+class CategoryColors:
+
+    # categories in the order the ramp runs; the ramp spans the first n of
+    # them (all by default), the ones after get the palette's high color
+    def __init__(self, palette, categories, n=None):
+        self.palette = palette
+        self.categories = pd.Index(categories)
+        n = len(self.categories) if n is None else min(n, len(self.categories))
+        colors = ramp(palette, max(n, 1))
+        # the extra last color is the one get_indexer's -1 picks for unknown labels
+        self.colors = np.array(colors[:n] + colors[-1:]*(len(self.categories) - n + 1), dtype=object)
+
+    # hash of the color of every category, which changes with their order
+    def fingerprint(self):
+        digest = hashlib.sha1(self.palette.encode())
+        for category, color in zip(self.categories, self.colors):
+            digest.update(f'{category}\0{color}\0'.encode())
+        return digest.hexdigest()[:16]
+
+    # colors for a list of categories, ones not in the order get the high color
+    def __call__(self, labels):
+        return self.colors[self.categories.get_indexer(pd.Index(labels))]
@@ -0,0 +1,326 @@
+import argparse, fcntl, hashlib, json, logging, multiprocessing, os, sqlite3, subprocess, sys, threading, time, zlib
+import numpy as np
+import pandas as pd
+import columnar_cache, figure_payload
+
+# Background precomputation of the dashboard figures.
+# The dropdown graphs only depend on (time1, time2, month, company) and the
+# location pie on the selected location, so their figure JSON can be rendered
+# ahead of time by a pool of worker processes and kept in a SQLite file
+# (DFD_PRECOMPUTE_DB, default .figure_store.sqlite), zlib compressed.
+# The callbacks then look figures up instead of building them.
+#
+# Every stored figure carries the fingerprint of the data it was built from:
+# a hash of the incidents in its month (month '--': all months) and of the
+# figure code, plus a graph salt for what else its graph is drawn from (the
+# bar colors, ranked over every month). Lookups only return figures whose
+# fingerprint matches the data the process serves. A rebuild renders just the
+# figures whose fingerprint changed, so new incidents in one month rebuild
+# that month plus the '--' figures, and every figure whose colors changed.
+#
+#   python precompute.py --scope all --processes 4
+#
+# With DFD_PRECOMPUTE=popular (no time selection, every month and unit, and
+# every location pie) or =all (every dropdown combination) the app starts this
+# script in the background after each data load. Only one build runs at a time.
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS figures (
+    graph TEXT, key TEXT, fingerprint TEXT, figure BLOB,
+    PRIMARY KEY (graph, key));
+CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+def default_path():
+    return os.environ.get('DFD_PRECOMPUTE_DB', '.figure_store.sqlite')
+
+
+def key_text(key):
+    return json.dumps(list(key))
+
+
+# figures table row of a figure (dict or JSON text)
+def figure_row(graph, key, fingerprint, figure):
+    text = figure if isinstance(figure, str) else figure_payload.to_json(figure)
+    return graph, key_text(key), fingerprint, zlib.compress(text.encode(), 6)
+
+
+# hash of the source files that draw the figures, so code changes rebuild them
+def code_salt(*paths):
+    digest = hashlib.sha1()
+    for path in paths:
+        digest.update(columnar_cache.file_hash(path).encode())
+    return digest.hexdigest()[:16]
+
+
+# per incident hash of everything the precomputed figures are drawn from
+def _row_hashes(store):
+    hash_array = pd.util.hash_array
+    prime = np.uint64(1099511628211)
+    hashes = hash_array(store.timestamps)
+    for names, codes in ((store.type_names, store.type_codes), (store.location_names, store.location_codes)):
+        hashes = hashes*prime + hash_array(names.astype(str).to_numpy(object))[codes]
+    for coordinates in (store.grid.latitude, store.grid.longitude):
+        hashes = hashes*prime + hash_array(coordinates)
+    for byte in np.asarray(store.unit_mask.bits).T:
+        hashes = hashes*prime + hash_array(byte.astype(np.uint64))
+    return hashes
+
+
+_fingerprints = {}
+
+
+# fingerprint of the data for month 1-12, and for all months under 0
+def month_fingerprints(store, salt=''):
+    cached = _fingerprints.get(salt)
+    if cached and cached[0] == store.version:
+        return cached[1]
+    hashes = _row_hashes(store)
+    parts = [f'{salt}|{",".join(map(str, store.unit_names))}']
+    for month in range(12):
+        rows = store.month_index.rows(month)
+        parts.append(f'{len(rows)}:{int(hashes[rows].sum(dtype=np.uint64)):x}')
+    fingerprints = {month + 1: hashlib.sha1(f'{parts[0]}|{part}'.encode()).hexdigest()[:16]
+                    for month, part in enumerate(parts[1:])}
+    fingerprints[0] = hashlib.sha1('|'.join(parts).encode()).hexdigest()[:16]
+    _fingerprints[salt] = (store.version, fingerprints)
+    return fingerprints
+
+
+# fingerprint of a graph's figures in a month, from the month's fingerprint
+# and the graph's salt
+def graph_fingerprint(month_fingerprint, graph_salt=''):
+    if not graph_salt:
+        return month_fingerprint
+    return hashlib.sha1(f'{month_fingerprint}|{graph_salt}'.encode()).hexdigest()[:16]
+
+
+class FigureStore:
+
+    def __init__(self, path=None):
+        self.path = path or default_path()
+        self._local = threading.local()
+
+    # one connection per thread (and per forked process)
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript(SCHEMA)
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def get(self, graph, key, fingerprint):
+        if not self.exists():
+            return None
+        row = self._db().execute('SELECT figure FROM figures WHERE graph=? AND key=? AND fingerprint=?',
+                                 (graph, key_text(key), fingerprint)).fetchone()
+        return None if row is None else json.loads(zlib.decompress(row[0]))
+
+    def fingerprints(self):
+        return {(graph, key): fingerprint for graph, key, fingerprint in
+                self._db().execute('SELECT graph, key, fingerprint FROM figures')}
+
+    def put_many(self, rows):
+        with self._db() as db:
+            db.executemany('INSERT OR REPLACE INTO figures VALUES (?, ?, ?, ?)', rows)
+
+    def set_status(self, **status):
+        with self._db() as db:
+            db.execute('INSERT OR REPLACE INTO meta VALUES (?, ?)', ('status', json.dumps(status)))
+
+    def status(self):
+        if not self.exists():
+            return {}
+        row = self._db().execute("SELECT value FROM meta WHERE name='status'").fetchone()
+        return json.loads(row[0]) if row else {}
+
+    def size(self):
+        return sum(os.path.getsize(self.path + suffix) for suffix in ('', '-wal')
+                   if os.path.exists(self.path + suffix))
+
+
+# Dropdown and pie figures backed by the precomputed store, for the fingerprint
+# of the data the process currently serves. Without a figure store file there
+# is nothing to look up, and the incidents are not fingerprinted.
+# graph_salt(graph) is the salt of a graph's figures (graph_fingerprint).
+class Precomputed:
+
+    def __init__(self, figure_store, salt, get_store, graph_salt=None):
+        self.figure_store = figure_store
+        self.salt = salt
+        self.get_store = get_store
+        self.graph_salt = graph_salt or (lambda graph: '')
+
+    # store: the store the caller draws from, the process wide one by default
+    def fingerprint(self, graph, month, store=None):
+        fingerprints = month_fingerprints(store or self.get_store(), self.salt)
+        return graph_fingerprint(fingerprints[month], self.graph_salt(graph))
+
+    def get(self, graph, key, month, store=None):
+        if not self.figure_store.exists():
+            return None
+        fingerprint = self.fingerprint(graph, month, store)
+        try:
+            return self.figure_store.get(graph, key, fingerprint)
+        except sqlite3.Error:
+            return None
+
+    # fingerprint a store as it replaces the previous one, in the thread that
+    # loaded or appended it, so the lookups after an ingest do not hash every incident
+    def refresh(self, store):
+        if self.figure_store.exists():
+            month_fingerprints(store, self.salt)
+
+    # keep a figure drawn elsewhere (a background callback) for every process
+    def put(self, graph, key, month, figure, store=None):
+        fingerprint = self.fingerprint(graph, month, store)
+        try:
+            self.figure_store.put_many([figure_row(graph, key, fingerprint, figure)])
+        except sqlite3.Error:
+            logger.exception('could not store the %s figure', graph)
+
+
+# ~~~~~ Build ~~~~~
+
+# set in the parent before the pool forks: render(key) -> {graph: figure}
+_render = None
+
+
+def _render_jobs(jobs):
+    rows = []
+    for key, fingerprints in jobs:
+        figures = _render(key)
+        for graph, fingerprint in fingerprints.items():
+            rows.append(figure_row(graph, key, fingerprint, figures[graph]))
+    return len(jobs), rows
+
+
+# render every job (graphs, key, month) with a stored figure out of date;
+# fingerprint(graph, month) is the fingerprint its figures should have
+def build(figure_store, jobs, render, fingerprint, processes=None, chunksize=8):
+    global _render
+    start = time.time()
+    current = figure_store.fingerprints()
+    todo = []
+    for graphs, key, month in jobs:
+        fingerprints = {graph: fingerprint(graph, month) for graph in graphs}
+        if any(current.get((graph, key_text(key))) != fingerprints[graph] for graph in graphs):
+            todo.append((key, fingerprints))
+    total = len(todo)
+    logger.info('precomputing %d of %d figure sets', total, len(jobs))
+    figure_store.set_status(state='running', done=0, total=total, started=start)
+
+    _render = render
+    chunks = [todo[i:i + chunksize] for i in range(0, total, chunksize)]
+    done = 0
+    reported = 0
+    processes = processes or os.cpu_count()
+    if processes > 1 and len(chunks) > 1:
+        pool = multiprocessing.get_context('fork').Pool(processes)
+        results = pool.imap_unordered(_render_jobs, chunks)
+    else:
+        pool = None
+        results = map(_render_jobs, chunks)
+    try:
+        for n_jobs, rows in results:
+            figure_store.put_many(rows)
+            done += n_jobs
+            if done == total or time.time() - reported > 5:
+                reported = time.time()
+                figure_store.set_status(state='running', done=done, total=total, started=start)
+                logger.info('precomputed %d/%d figure sets (%.0f%%)', done, total, 100*done/max(total, 1))
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    seconds = time.time() - start
+    figure_store.set_status(state='done', done=done, total=total, started=start,
+                            seconds=seconds, bytes=figure_store.size())
+    logger.info('precomputed %d figure sets in %.1fs, store is %.1f MB',
+                total, seconds, figure_store.size()/1e6)
+    return total
+
+
+# ~~~~~ Background runs from the app ~~~~~
+
+def _locked(lock_file):
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return False
+    except OSError:
+        return True
+
+
+# Starts `python precompute.py` after every data load; loads arriving while a
+# build runs (in this or another process) start one more build after it.
+class Precomputer:
+
+    def __init__(self, scope, path=None, processes=None, poll_seconds=5):
+        self.scope = scope
+        self.path = path or default_path()
+        self.processes = processes
+        self.poll_seconds = poll_seconds
+        self._lock = threading.Lock()
+        self._running = False
+        self._pending = False
+
+    def trigger(self, *args):
+        with self._lock:
+            if self._running:
+                self._pending = True
+                return
+            self._running = True
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def _run(self):
+        command = [sys.executable, os.path.abspath(__file__), '--scope', self.scope, '--db', self.path]
+        if self.processes:
+            command += ['--processes', str(self.processes)]
+        while True:
+            with open(f'{self.path}.lock', 'a') as lock_file:
+                while _locked(lock_file):
+                    time.sleep(self.poll_seconds)
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            subprocess.run(command, cwd=os.path.dirname(os.path.abspath(__file__)))
+            with self._lock:
+                if not self._pending:
+                    self._running = False
+                    return
+                self._pending = False
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scope', choices=['popular', 'all'], default='popular')
+    parser.add_argument('--db', default=default_path())
+    parser.add_argument('--processes', type=int, default=int(os.environ.get('DFD_PRECOMPUTE_PROCESSES', 0)) or None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+    with open(f'{args.db}.lock', 'a') as lock_file:
+        if _locked(lock_file):
+            logger.info('another precompute is running')
+            return
+        # the app itself must not warm figures or start another precompute
+        os.environ['DFD_WARM_FIGURES'] = '0'
+        os.environ['DFD_PRECOMPUTE'] = '0'
+        import responses
+        from incident_store import get_store
+        figure_store = FigureStore(args.db)
+        jobs = responses.precompute_jobs(args.scope)
+        store = get_store()
+        build(figure_store, jobs, responses.precompute_figures,
+              lambda graph, month: responses.precomputed.fingerprint(graph, month, store), args.processes)
+
+
+if __name__ == '__main__':
+    main()
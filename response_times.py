@@ -0,0 +1,167 @@
+import copy, os, threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from spatial_grid import DISTRICTS
+from time_bins import hourly_labels
+
+# Response time analytics for the dashboard.
+# When the incident data has the times the units were dispatched, went en
+# route and arrived on scene (the columns named in DFD_RESPONSE_COLUMNS), the
+# turnout (dispatch to en route), travel (en route to on scene) and response
+# (dispatch to on scene) interval of every incident is kept as whole seconds.
+# Missing or out of order times give -1 (left out), and intervals of an hour
+# or more are counted as MAX_SECONDS.
+#
+# A selection's percentiles and histograms come from one bincount over
+# (group, second) per interval instead of sorting its rows. The percentiles
+# are exact to the second: the smallest time that at least q% of the
+# incidents are at or under, i.e. np.percentile(method='inverted_cdf'). The
+# groups are the hour of the day and the district (the store's district
+# codes: the district polygon an incident is in, else the nearest station's,
+# spatial_grid.assign_districts). Summaries are kept per filter key in an
+# LRU cache that is dropped with the store. Data without the columns has no
+# summaries, the graphs say so.
+#   DFD_RESPONSE_COLUMNS=DISPATCHED,EN_ROUTE,ON_SCENE (the default)
+
+MAX_SECONDS = 3600
+# histogram bins of 30 seconds up to 20 minutes, the last bin holds the rest
+BIN_SECONDS = 30
+HISTOGRAM_SECONDS = 1200
+PERCENTILES = (50, 90)
+
+# (name, from, to) positions in the dispatch, en route, on scene columns
+INTERVALS = (('Turnout', 0, 1), ('Travel', 1, 2), ('Response', 0, 2))
+
+
+# dispatch, en route and on scene column names
+def response_columns():
+    names = os.environ.get('DFD_RESPONSE_COLUMNS', 'DISPATCHED,EN_ROUTE,ON_SCENE')
+    columns = tuple(c.strip() for c in names.split(','))
+    if len(columns) != 3:
+        raise ValueError(f'DFD_RESPONSE_COLUMNS needs 3 columns, got {columns}')
+    return columns
+
+
+# whole seconds of every interval (n intervals x n rows), -1 where unknown;
+# int16 holds MAX_SECONDS, 6 bytes per incident
+def interval_seconds(frame, columns=None):
+    columns = columns or response_columns()
+    times = [pd.to_datetime(frame[c], errors='coerce') if c in frame.columns else None for c in columns]
+    seconds = np.full((len(INTERVALS), len(frame)), -1, dtype=np.int16)
+    for k, (name, start, end) in enumerate(INTERVALS):
+        if times[start] is None or times[end] is None:
+            continue
+        interval = (times[end] - times[start]).dt.total_seconds().to_numpy()
+        known = np.isfinite(interval) & (interval >= 0)
+        seconds[k, known] = np.minimum(interval[known], MAX_SECONDS).astype(np.int16)
+    return seconds
+
+
+def histogram_labels():
+    edges = range(0, HISTOGRAM_SECONDS, BIN_SECONDS)
+    labels = [f'{s // 60}:{s % 60:02d}-{(s + BIN_SECONDS) // 60}:{(s + BIN_SECONDS) % 60:02d}' for s in edges]
+    return labels + [f'{HISTOGRAM_SECONDS // 60}:00+']
+
+
+# smallest second at or under which q% of each group's incidents are, from
+# per group counts of every second (groups x MAX_SECONDS+1); NaN for empty groups
+def grouped_percentiles(counts, q=PERCENTILES):
+    cumulative = counts.cumsum(axis=1)
+    total = cumulative[:, -1:]
+    result = np.full((len(counts), len(q)), np.nan)
+    for j, p in enumerate(q):
+        # integer test, p/100*total can round past the rank it should hit
+        seconds = (100*cumulative < p*total).sum(axis=1)
+        result[:, j] = np.where(total[:, 0] > 0, seconds, np.nan)
+    return result
+
+
+class ResponseSummary:
+
+    # counts: (intervals, groups, seconds) for the hour and district groupings
+    def __init__(self, hour_counts, district_counts):
+        names = [name for name, _, _ in INTERVALS]
+        columns = pd.MultiIndex.from_product([names, [f'p{p}' for p in PERCENTILES]])
+        totals = hour_counts.sum(axis=1)
+        self.incidents = pd.Series(totals.sum(axis=1), index=names)
+        self.overall = pd.DataFrame(grouped_percentiles(totals), index=names,
+                                    columns=[f'p{p}' for p in PERCENTILES])
+        self.hour = self._table(hour_counts, hourly_labels(), columns)
+        self.district = self._table(district_counts, list(DISTRICTS), columns)
+        # incidents per histogram bin, the bins past HISTOGRAM_SECONDS folded into the last one
+        bins = np.minimum(np.arange(MAX_SECONDS + 1) // BIN_SECONDS, HISTOGRAM_SECONDS // BIN_SECONDS)
+        histogram = np.stack([np.bincount(bins, weights=t, minlength=bins[-1] + 1) for t in totals], axis=1)
+        self.histogram = pd.DataFrame(histogram.astype(np.int64), index=histogram_labels(), columns=names)
+
+    @staticmethod
+    def _table(counts, labels, columns):
+        table = np.concatenate([grouped_percentiles(c) for c in counts], axis=1)
+        return pd.DataFrame(table, index=labels, columns=columns)
+
+
+class ResponseTimes:
+
+    def __init__(self, store, columns=None):
+        self.store = store
+        self.columns = columns or response_columns()
+        self.seconds = interval_seconds(store.frame, self.columns)
+        self.cells = self._cells(store, 0)
+        self._reset_cache()
+
+    # first bin of every row's (hour, district) group in the flat counts, so
+    # a selection is counted by both groupings in one bincount per interval;
+    # rows without a district go to an extra district slot
+    @staticmethod
+    def _cells(store, start):
+        districts = store.district_codes[start:].astype(np.int32)
+        districts[districts < 0] = len(DISTRICTS)
+        hours = store.sod[start:] // 3600
+        return (hours*(len(DISTRICTS) + 1) + districts)*(MAX_SECONDS + 1)
+
+    def _reset_cache(self):
+        # True when any interval can be measured in the data
+        self.available = bool((self.seconds >= 0).any())
+        self.cache_size = int(os.environ.get('DFD_RESPONSE_CACHE_SIZE', 256))
+        self._summaries = OrderedDict()
+        self._lock = threading.Lock()
+
+    # a copy for store with its new rows added, this one is left unchanged
+    def extended(self, store, frame):
+        times = copy.copy(self)
+        times.store = store
+        times.seconds = np.concatenate([self.seconds, interval_seconds(frame, self.columns)], axis=1)
+        times.cells = np.concatenate([self.cells, self._cells(store, len(self.cells))])
+        times._reset_cache()
+        return times
+
+    # (intervals x hours x districts + 1 x seconds) counts of the rows
+    def counts(self, rows):
+        shape = (24, len(DISTRICTS) + 1, MAX_SECONDS + 1)
+        counts = np.zeros((len(INTERVALS),) + shape, dtype=np.int64)
+        cells = self.cells[rows]
+        for k, seconds in enumerate(self.seconds):
+            seconds = seconds[rows]
+            keep = seconds >= 0
+            counts[k] = np.bincount(cells[keep] + seconds[keep], minlength=np.prod(shape)).reshape(shape)
+        return counts
+
+    # percentiles and histograms of a dropdown selection, cached per selection
+    # in an LRU; rows are the selection's rows when the caller has filtered them
+    def summary(self, time1='', time2='', month=0, unit=None, dates=None, rows=None):
+        key = (time1, time2, month, unit, dates)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is not None:
+                self._summaries.move_to_end(key)
+                return summary
+        summary = self._summary(self.store.select(*key) if rows is None else rows)
+        with self._lock:
+            self._summaries[key] = summary
+            while len(self._summaries) > self.cache_size:
+                self._summaries.popitem(last=False)
+        return summary
+
+    def _summary(self, rows):
+        counts = self.counts(rows)
+        return ResponseSummary(counts.sum(axis=2), counts[:, :, :len(DISTRICTS)].sum(axis=1))
@@ -1,9 +1,17 @@
+import numpy as np
 import pandas as pd
-import plotly.express as px
 import dash_bootstrap_components as dbc
 import dash    
-from Incident_Data import IncidentData
-from dash import  html, dcc, Output, Input
+import flask
+import logging, os, threading, time
+from plotly.colors import sequential
+from incident_store import get_store, on_reload
+from figure_cache import FigureCache
+import aggregates, background, clientside, compression, figure_payload, incident_store, ingest, palettes, precompute
+import response_times, spatial_grid, time_bins, unit_mask
+from instrumentation import metrics
+from time_bins import hourly_labels
+from dash import  html, dcc, Output, Input, State, ClientsideFunction
 
 # Create a dataframe which includes Call Types, Units, Call Locations, Call Date and Time,
 # and includes latitude and longitude with the associated incident addresses.
@@ -24,22 +32,9 @@ app = dash.Dash(__name__,
            external_stylesheets=[dbc.themes.SUPERHERO])
 
 
-# Mapper for graph colors
+# Mapper for graph colors, read from the cached ramp of the one palette asked for
 def graph_colors(df_graph_category,len_df_category,color='red'):
-    
-    red = px.colors.n_colors('rgb(165,0,0)','rgb(255,0,0)',len_df_category,colortype='rgb')
-    blue = px.colors.n_colors('rgb(0,0.001,150)','rgb(0,150,150)',len_df_category,colortype='rgb')
-    green = px.colors.n_colors('rgb(0,150,.001)','rgb(0,125,125)',len_df_category,colortype='rgb')
-    yellow = px.colors.n_colors('rgb(255,255,0)','rgb(255,125,0)',len_df_category,colortype='rgb')
-    dark_blue = px.colors.n_colors('rgb(.001,.001,75)','rgb(50,50,200)',len_df_category,colortype='rgb')
-    red_blue = px.colors.n_colors('rgb(255,.001,.001)','rgb(.001,.001,255)',len_df_category,colortype='rgb')
-    green_blue = px.colors.n_colors('rgb(0,255,.001)','rgb(0,.001,255)',len_df_category,colortype='rgb')
-    
-    color_list = {'red':red,'blue':blue,'green':green,'yellow':yellow,'dark_blue':dark_blue,
-                 'rd_bl':red_blue,'gr_bl':green_blue}
-
-    mapper = {x:y for x,y in zip(df_graph_category,color_list[color])}
-    return mapper
+    return dict(zip(df_graph_category,palettes.ramp(color,len_df_category)))
 # DFD list of Career Division fire companies
 companies = ['ALL','C30','T1','TAC1','SQ21','E22','E23','E24','E25','E26']
 
@@ -55,29 +50,128 @@ hours_dict = {x:y for x,y in zip(hours,times)}
 # list of month's to use in dictionary for dropdown menus
 monthname = ['--','January','February','March','April','May','June','July','August',
                   'September','October','November','December']
-# dicitonary to pair month name with month number to use in IncidentData() values
+# dicitonary to pair month name with month number to use in store.query() values
 months = {m:int(i) for m,i in zip(monthname,list(range(0,13)))}
 
 #  Data for sidebar tables and pie charts
-df1 = IncidentData('','','').all()  
-df1['LOCATION'] = df1.LOCATION.apply([lambda x: x[:-11]]) 
+# the incident data is loaded and indexed once, every callback takes views of it,
+# and the tables are read from the store's precomputed count cube.
+# With DFD_LAZY=1 nothing is loaded at import, so the server starts at once:
+# the page is served with an empty sidebar, a warm-up thread loads the data
+# (callbacks wait for it) and the sidebar refresh callback fills the tables in.
+lazy = os.environ.get('DFD_LAZY','0') == '1'
+
+def sidebar_counts(store):
+    total_calls = store.cube.unit_totals()
+    total_calls.index.name = 'Unit'
+
+    # locations are listed without their last 11 characters (city and state),
+    # each label resolves to its location codes in the store's location index
+    loc_count = store.locations.label_counts()
+    loc_count = loc_count[loc_count>14]
+    loc_count.index.name = 'Location'
+    type_count = store.cube.type_counts()
+    type_count = type_count[type_count>14]
+    type_count.index.name = 'Response Type'
+    return total_calls, loc_count, type_count
+
+def sidebar_table(counts):
+    return dbc.Table.from_dataframe(counts,
+                                    striped=True,
+                                    bordered=True,
+                                    hover=True,
+                                    index=True)
+
+# Bar colors that stay with a location or response type across filters: the
+# ramp runs in the order of the unfiltered graphs (locations by total count,
+# over the ones with 20 or more responses, types in order of appearance)
+def category_colors(store):
+    locations = store.cube.location_counts()
+    return {'location':palettes.CategoryColors('dark_blue',locations.index,(locations>=20).sum()),
+            'type':palettes.CategoryColors('green',store.cube.type_counts(sort=False).index)}
+
+# sidebar counts, location dropdown label -> location codes and bar colors
+# of the current store, filled by load_data() and on every reload
+tables = {}
+loc_count_dict = {}
+bar_colors = {}
+color_salts = {}
+data_ready = threading.Event()
+data_lock = threading.Lock()
 
-dfu = IncidentData('','','').unit_df()
-dfu.index.name = 'Incident Date & Time'
+@on_reload
+def update_tables(store):
+    total_calls, loc_count, type_count = sidebar_counts(store)
+    tables.update(total_calls=total_calls,loc_count=loc_count,type_count=type_count)
+    # new incidents can add locations (or location codes) to the dropdown
+    loc_count_dict.update({k:store.locations.lookup(k) for k in loc_count.index})
+    bar_colors.update(category_colors(store))
+    # the location and type bar colors rank every month's incidents, so the
+    # precomputed figures drawn with them are fingerprinted with their order
+    color_salts.update(incidentlocation=bar_colors['location'].fingerprint(),
+                       incidenttype=bar_colors['type'].fingerprint())
 
-total_calls = pd.Series([dfu[x].sum() for x in dfu.columns],index=dfu.columns)
-total_calls.index.name = 'Unit'
+# precomputed figure salt of a graph, the order of its bar colors
+def graph_salt(graph):
+    return color_salts.get(graph,'')
 
-loc_count = df1.iloc[:,1].value_counts()[df1.iloc[:,1].value_counts()>14]
-loc_count.index.name = 'Location'
-loc_count_dict = {k:v for k,v in zip(loc_count.index,range(len(loc_count.index)))}
-type_count = df1.iloc[:,2].value_counts()[df1.iloc[:,2].value_counts()>14]
-type_count.index.name = 'Response Type'
+# the store, after loading it and its tables on first use
+def load_data():
+    if not data_ready.is_set():
+        with data_lock:
+            if not data_ready.is_set():
+                update_tables(get_store())
+                data_ready.set()
+    return get_store()
 
+# sidebar tables, location dropdown options, date range limits and data version
+def sidebar_outputs(store):
+    loc_count = tables['loc_count']
+    return (sidebar_table(tables['total_calls']),
+            sidebar_table(loc_count.head(7)),
+            sidebar_table(tables['type_count'].head(7)),
+            list(loc_count.index),
+            store.times(0).date(),
+            store.times(-1).date(),
+            store.version)
 
+# Figure cache for the dropdown graphs, dropped whenever the data reloads.
+# Its keys carry the version of the store a figure is drawn from, so a figure
+# still being drawn from a replaced store is never served after the reload.
+figure_cache = FigureCache(maxsize=int(os.environ.get('DFD_FIGURE_CACHE_SIZE',512)))
+on_reload(figure_cache.clear)
 
+# (start, end) 'YYYY-MM-DD' dates of the date range picker, None without a range
+def date_range_value(start_date,end_date):
+    if not start_date and not end_date:
+        return None
+    return (start_date[:10] if start_date else None,end_date[:10] if end_date else None)
+
+# normalized (time1, time2, month, company, dates) key for the dropdown callbacks
+def figure_key(time1_value,time2_value,month_value,company_value,dates=None):
+    unit = company_value if company_value in companies[1:] else companies[0]
+    return (time1_value,time2_value,month_value,unit,dates)
+
+def location_key(freqloc):
+    return (freqloc,load_data().version)
+
+# Figures rendered ahead of time by precompute.py, looked up for the data this
+# process serves when they are not in the figure cache. Their fingerprints
+# hash every module the figures are counted, filtered and drawn with, so a
+# fix to any of them renders the figures again.
+figure_modules = [aggregates,figure_payload,incident_store,palettes,response_times,spatial_grid,time_bins,unit_mask]
+figure_salt = precompute.code_salt(__file__,*[module.__file__ for module in figure_modules],
+                                   *filter(None,[os.environ.get('DFD_DISTRICTS_GEOJSON')]))
+precomputed = precompute.Precomputed(precompute.FigureStore(),figure_salt,get_store,graph_salt)
+on_reload(precomputed.refresh)
+
+# radius of the nearby incidents count around the selected location
+nearby_meters = float(os.environ.get('DFD_NEARBY_METERS',250))
 
 # ~~~~~~~~ Application Layout ~~~~~~~~~
+unit_table, location_table, type_table, locations, first_date, last_date, data_version = (
+    ([],[],[],[],None,None,None) if lazy else sidebar_outputs(load_data()))
+
 app.layout = dbc.Container([
     html.Div([
         dbc.Row([
@@ -147,6 +241,19 @@ app.layout = dbc.Container([
                         class_name='text-dark'),
                     ],class_name='bg-primary border-rounded'),
                 lg=2),
+            dbc.Col(
+                dbc.Card([
+                    dbc.CardHeader(
+                        html.H5("Select a Date Range"),
+                        style={'textAlign':'center'}),
+                    dbc.CardBody(
+                        dcc.DatePickerRange(min_date_allowed=first_date,
+                                            max_date_allowed=last_date,
+                                            clearable=True,
+                                            id='dates'),
+                        class_name='text-dark'),
+                    ],class_name='bg-primary border-rounded'),
+                lg=2),
             dbc.Col(
                 dbc.Card([
                     dbc.CardHeader(
@@ -172,11 +279,8 @@ app.layout = dbc.Container([
                             class_name='text-body'
                                 ), 
                         dbc.CardBody(
-                            dbc.Table.from_dataframe(total_calls,
-                                                     striped=True,
-                                                     bordered=True,
-                                                     hover=True,
-                                                     index=True),
+                            unit_table,
+                            id='unit_table',
                             class_name='bg-light'),
                         ], class_name= 'card-text-body bg-primary card-header'),
                     dbc.Card([
@@ -184,11 +288,8 @@ app.layout = dbc.Container([
                             html.H5("Top 7 Response Locations"),
                             class_name='text-body'),
                         dbc.CardBody(
-                            dbc.Table.from_dataframe(loc_count.head(7),
-                                                     striped=True,
-                                                     bordered=True,
-                                                     hover=True,
-                                                     index=True),
+                            location_table,
+                            id='location_table',
                             class_name='bg-light'),
                         ],class_name= 'card-text-body bg-primary card-header'),
                     dbc.Card([
@@ -197,19 +298,20 @@ app.layout = dbc.Container([
                             class_name='text-bdoy'
                             ),
                         dbc.CardBody(
-                            dbc.Table.from_dataframe(type_count.head(7),
-                                                     striped=True,
-                                                     bordered=True,
-                                                     hover=True,
-                                                     index=True),
+                            type_table,
+                            id='type_table',
                             class_name='bg-light'),
                         ],class_name= 'card-text-body bg-primary card-header'),
                     ],gap=2),
                 lg = 2),
-        dbc.Col( # main panel
+        dbc.Col([ # main panel
             dbc.Row([ 
                 dbc.Col(# Graphs
                     dbc.Stack([
+                        # progress of the background callback drawing the map and location graph
+                        html.Div(id='background_status',
+                            className='text-warning',
+                            style={'minHeight':'1.5em'}),
                         dcc.Graph(id="densitymap"),
                         dcc.Graph(id='incidentlocation'),
                         dbc.Row(
@@ -220,8 +322,8 @@ app.layout = dbc.Container([
                                                 style={'textAlign':'center'}),
                                         class_name='card-text-body bg-primary'),
                                     dbc.CardBody([
-                                        dcc.Dropdown(options=loc_count.index,
-                                                    value=loc_count.index[0],
+                                        dcc.Dropdown(options=locations,
+                                                    value=locations[0] if locations else None,
                                                     clearable=False,
                                                     maxHeight=105,
                                                     id='freq_loc'),
@@ -257,6 +359,17 @@ app.layout = dbc.Container([
                                                         'textAlign':'center'}),
                                             ],class_name='m-3 bg-dark'),
                                         class_name='bg-primary text-body border-primary'),
+                                    dbc.Card(
+                                        dbc.CardBody([
+                                            html.P(f"Incidents within {nearby_meters:g} m",
+                                                    style={'textAlign':'center',
+                                                        'fontSize': 20}),
+                                            html.P(id='nearby_incidents',
+                                                style={'fontSize':40,
+                                                        'fontWeight':'bold',
+                                                        'textAlign':'center'}),
+                                            ],class_name='m-3 card-text-body bg-dark'),
+                                        class_name='bg-primary border-primary'),
                                     ],class_name='border-primary'),
                                 ],lg=10,width={'offset':1}),
                             class_name='pt-2 border-primary'),
@@ -273,25 +386,63 @@ app.layout = dbc.Container([
                     width={'offset':1},
                     lg = 5,),
                 ]),
-            ),
+            # response time graphs, same dropdown selection
+            dbc.Row([
+                dbc.Col(
+                    dbc.Stack([
+                        dcc.Graph(id='responsehour'),
+                        dcc.Graph(id='responsedistrict'),
+                        ]),
+                    class_name='p-1 d-flex justify-content-start',
+                    lg = 5),
+                dbc.Col(
+                    dbc.Stack([
+                        dcc.Graph(id='responsehistogram'),
+                        dcc.Graph(id='districtincidents'),
+                        ]),
+                    class_name='p-1 d-flex justify-content-start',
+                    width={'offset':1},
+                    lg = 5),
+                ]),
+            ]),
         ]),
     ]),
+    # sidebar refresh for incidents ingested while the page is open
+    dcc.Interval(id='data_refresh',interval=int(1000*float(os.environ.get('DFD_REFRESH_SECONDS',60)))),
+    dcc.Store(id='data_version',data=data_version),
+    # selection the background callback is asked to draw
+    dcc.Store(id='background_request'),
+    # what the heat map last sent shows: 'cells' or 'incidents' (detail_view())
+    dcc.Store(id='map_mode'),
+    # count cubes the client side graphs are drawn from
+    dcc.Store(id='aggregate'),
 ],fluid=True)
 
 # ##### FIRST GRAPH STACK #####
 #~~~~~ Heat Density Map ~~~~~
-def incident_heat_map(df_dhm,unit): 
-    district = {'HQ':(41.393510,-73.455480),
-                'E23':(41.407951,-73.436729),
-                'E24':(41.413050,-73.422240),
-                'E25':(41.427157,-73.504407),
-                'E26':(41.373615,-73.487025)}
+# Below map_detail_zoom the map gets one weighted point per grid cell of the
+# store's spatial grid, past it the individual incidents inside the viewport
+map_detail_zoom = float(os.environ.get('DFD_MAP_DETAIL_ZOOM',15))
+
+# (zoom, (lon min, lat min, lon max, lat max)) of a zoomed in map, else None
+def detail_view(relayout_data):
+    if not relayout_data or relayout_data.get('mapbox.zoom',0) < map_detail_zoom:
+        return None
+    corners = relayout_data.get('mapbox._derived',{}).get('coordinates')
+    if not corners:
+        return (round(relayout_data['mapbox.zoom'],1),None)
+    lons, lats = zip(*corners)
+    return (round(relayout_data['mapbox.zoom'],1),
+            (round(min(lons),3),round(min(lats),3),round(max(lons),3),round(max(lats),3)))
+
+def incident_heat_map(df_dhm,unit,view=None): 
+    district = spatial_grid.DISTRICTS
 
     if unit not in companies[1:]:
-        df_dhm = df_dhm.all()
+        rows = df_dhm.rows
         t = "Incident Concentrations for the City of Danbury"    
     else:
-        df_dhm = df_dhm.company(unit)
+        rows = df_dhm.unit_rows(unit)
         t = f'Incident Concentration for {unit}'
     
     if unit not in ['E23','E24','E25','E26']:
@@ -304,71 +455,75 @@ def incident_heat_map(df_dhm,unit):
         long=district[unit][1]
         z=12
         r=8
+
+    # plotly.express is only imported once the first map is drawn
+    import plotly.express as px
+    # rows index the store the selection was filtered from
+    store = df_dhm.store
+    if view is None:
+        # pre-binned incident counts per grid cell, the cell centers to about
+        # 10 m (cells are 170 m) to keep the coordinate arrays short
+        df_dhm = store.grid.aggregate(rows).round({'LATITUDE':4,'LONGITUDE':4})
+        weights = 'INCIDENTS'
+        hover = None
+    else:
+        # individual incidents, limited to the visible part of the map
+        df_dhm = store.take(rows)
+        if view[1] is not None:
+            lon_min, lat_min, lon_max, lat_max = view[1]
+            df_dhm = df_dhm[df_dhm.LONGITUDE.between(lon_min,lon_max) & df_dhm.LATITUDE.between(lat_min,lat_max)]
+        weights = None
+        hover = ['TYPE','ADDRESS']
         
     map = px.density_mapbox(data_frame=df_dhm,
                             lat='LATITUDE',
                             lon='LONGITUDE',
-                            hover_data=['TYPE','ADDRESS'],
+                            z=weights,
+                            hover_data=hover,
                             center={'lat':latt,'lon':long},
-                            color_continuous_scale=px.colors.sequential.ice,
+                            color_continuous_scale=sequential.ice,
                             zoom=z,
                             mapbox_style='open-street-map',
                             radius=r,
                             title=t,
+                            template=figure_payload.lean_template(),
                             height=600,
                             width=800,) 
     map.update_layout(coloraxis_showscale=False,
                       title={'x':.5,'xref':'paper','xanchor':'auto'},
                       font={'color':'rgb(255,255,255)'},
-                      paper_bgcolor='#0f2537')
+                      paper_bgcolor='#0f2537',
+                      # keep the user's pan/zoom when switching between cells and points
+                      uirevision=f'{unit}')
+    if app.logger.isEnabledFor(logging.DEBUG):
+        app.logger.debug('heat map payload: %d bytes, %s, %d points',
+                         len(map.to_json()),'cells' if view is None else 'incidents',len(df_dhm))
     return map
 
 
-@app.callback(
-    Output(component_id='densitymap',component_property='figure'),
-    Input(component_id='time1',component_property='value'),
-    Input(component_id='time2',component_property='value'),
-    Input(component_id='month',component_property='value'),
-    Input(component_id='company',component_property='value'))
-def density_map(time1_value,time2_value,month_value,company_value):
-    d_map = incident_heat_map(IncidentData(hours_dict[time1_value],
-                                            hours_dict[time2_value],
-                                            months[month_value]),
-                                            company_value)
-
-    return d_map
-
 # ~~~~~ Incident Location Totals ~~~~~
 
 def incident_locations(df_lbar,unit,t1,t2,mon):
         
-    if t1 not in times[1:] and t2 not in times[1:] and mon not in monthname[1:]:
+    if t1 not in times[1:] and t2 not in times[1:] and mon not in monthname[1:] and df_lbar.dates is None:
         if unit not in companies[1:]:
-            df_lbar = df_lbar.all()
-            v_c = df_lbar['LOCATION'].value_counts()[df_lbar['LOCATION'].value_counts()>=20]
+            v_c = df_lbar.location_counts()
+            v_c = v_c[v_c>=20]
             t='Total Number of Incidents per Location with 20 or more Responses'
         else:
-            df_lbar= df_lbar.company(unit)
-            v_c = df_lbar['LOCATION'].value_counts()[df_lbar['LOCATION'].value_counts()>=5]
+            v_c = df_lbar.location_counts(unit)
+            v_c = v_c[v_c>=5]
             t = f'Total Number of Responses per Location by {unit} with 5 or more Responses'
     else:
         if unit not in companies[1:]:
-            df_lbar = df_lbar.all()
-            v_c = df_lbar['LOCATION'].value_counts()
+            v_c = df_lbar.location_counts()
             t = 'Total Number of Responses per Location'
         else:
-            df_lbar = df_lbar.company(unit)
-            v_c = df_lbar['LOCATION'].value_counts()
+            v_c = df_lbar.location_counts(unit)
             t = f'Total Number of Responses per Location by {unit}'
         
-    bargraph = px.bar(data_frame=v_c,
-                      x=v_c.index,
-                      y=v_c,
-                      color=v_c.index,
-                      color_discrete_map=graph_colors(v_c.index,len(v_c.index),color='dark_blue'),
-                      title=t,
-                      height=600,
-                      width=800)
+    # one trace with a color per location
+    bargraph = figure_payload.bar(v_c,bar_colors['location'](v_c.index),'LOCATION','count',t)
     bargraph.update_xaxes(tickangle=45,
                           tickfont=dict(size=10))
     bargraph.update_layout(yaxis_title='Total Incidents to Location',
@@ -382,53 +537,73 @@ def incident_locations(df_lbar,unit,t1,t2,mon):
 
 
 
-@app.callback(
-    Output(component_id='incidentlocation',component_property='figure'),
-    Input(component_id='time1',component_property='value'),
-    Input(component_id='time2',component_property='value'),
-    Input(component_id='month',component_property='value'),
-    Input(component_id='company',component_property='value'))
-def location_bargraph(time1_value,time2_value,month_value,company_value):
-    l_bar = incident_locations(IncidentData(hours_dict[time1_value],
-                                            hours_dict[time2_value],
-                                            months[month_value]),
-                                            company_value,
-                                            time1_value,
-                                            time2_value,
-                                            month_value)
-
-    return l_bar
 
 @app.callback(
     Output(component_id='total_calls_loc',component_property='children'),
     Input(component_id='freq_loc',component_property='value'))
-def total_calls(freqloc):
+def total_calls_loc(freqloc):
     return freqloc
 
 @app.callback(
     Output(component_id='total_incidents',component_property='children'),
     Input(component_id='freq_loc',component_property='value'))
 def number_total_loc(freqloc):
-    return loc_count.iloc[loc_count_dict[freqloc]]
+    store = load_data()
+    if freqloc is None:
+        raise dash.exceptions.PreventUpdate
+    return store.locations.count(loc_count_dict[freqloc])
+
+
+# incidents within nearby_meters of the location, a radius query on the
+# store's spatial grid
+@app.callback(
+    Output(component_id='nearby_incidents',component_property='children'),
+    Input(component_id='freq_loc',component_property='value'))
+def nearby_incidents(freqloc):
+    store = load_data()
+    if freqloc is None:
+        raise dash.exceptions.PreventUpdate
+    row = store.locations.rows(loc_count_dict[freqloc])[0]
+    latitude, longitude = store.grid.latitude[row], store.grid.longitude[row]
+    if not (np.isfinite(latitude) and np.isfinite(longitude)):
+        return '--'
+    return len(store.rows_within(latitude,longitude,nearby_meters))
+
+
+@app.callback(
+    Output(component_id='unit_table',component_property='children'),
+    Output(component_id='location_table',component_property='children'),
+    Output(component_id='type_table',component_property='children'),
+    Output(component_id='freq_loc',component_property='options'),
+    Output(component_id='dates',component_property='min_date_allowed'),
+    Output(component_id='dates',component_property='max_date_allowed'),
+    Output(component_id='data_version',component_property='data'),
+    Output(component_id='freq_loc',component_property='value'),
+    Input(component_id='data_refresh',component_property='n_intervals'),
+    State(component_id='data_version',component_property='data'),
+    State(component_id='freq_loc',component_property='value'))
+def refresh_sidebar(n_intervals,version,freqloc):
+    store = load_data()
+    if store.version == version:
+        return (dash.no_update,)*8
+    outputs = sidebar_outputs(store)
+    # a page served before the data was loaded gets its first location
+    if freqloc is None and outputs[3]:
+        return outputs + (outputs[3][0],)
+    return outputs + (dash.no_update,)
 
 
 # ##### SECOND GRAPH STACK #####
 # ~~~~~~ Incident Type Totals ~~~~~~
 def incident_type_total(df_tth,unit):
     if unit in companies[1:]:
-        df_tth = df_tth.company(unit)
+        v_c = df_tth.type_counts(unit,sort=False)
         t = f"{unit} Incident Count by Type"   
     else:
-        df_tth = df_tth.all()
+        v_c = df_tth.type_counts(sort=False)
         t = "Total Incidents for the Danbury Fire Department"
         
-    histograph = px.histogram(data_frame=df_tth,
-                              x='TYPE',
-                              color='TYPE',
-                              color_discrete_map=graph_colors(df_tth.TYPE.unique(),len(df_tth.TYPE.unique()),'green'),
-                              title=t,
-                              height=600,
-                              width=800)
+    histograph = figure_payload.bar(v_c,bar_colors['type'](v_c.index),'TYPE','count',t)
     histograph.update_layout(yaxis_title='Number of Incidents',
                             xaxis_title='Incident Type',
                             showlegend=False,
@@ -441,28 +616,15 @@ def incident_type_total(df_tth,unit):
     return histograph
 
 
-@app.callback(
-    Output(component_id='incidenttype',component_property='figure'),
-    Input(component_id='time1',component_property='value'),
-    Input(component_id='time2',component_property='value'),
-    Input(component_id='month',component_property='value'),
-    Input(component_id='company',component_property='value'))
-def type_histograph(time1_value, time2_value,month_value,company_value):
-    t_histo = incident_type_total(IncidentData(hours_dict[time1_value],
-                                                hours_dict[time2_value],
-                                                months[month_value]),
-                                                company_value)
-
-    return t_histo
 
 # ~~~~~ Time Period Incident Totals ~~~~~
 
 def time_period_totals(df_tpt,unit,t1,t2,mon):
-    # set IncidentData()
+    # set incident selection
     if unit in companies[1:]:
-        df_tpt = df_tpt.company(unit)
+        hour_counts = df_tpt.hour_counts(unit)
     else:
-        df_tpt = df_tpt.all()
+        hour_counts = df_tpt.hour_counts()
 
     if mon in monthname[1:] and t1 not in times[1:] and t2 not in times[1:]:
         if unit not in companies[1:]:
@@ -480,30 +642,10 @@ def time_period_totals(df_tpt,unit,t1,t2,mon):
         else:
             t = f"Total Number of Incidents per Hourly Period from {t1} to {t2} for {unit}"
 
-    # hourly time periods and ranges
-    daytimes = [f'0{x}:00' if x < 10 else f'{x}:00' for x in range(24)]
-    hourly = [f'{daytimes[t-1]}-{daytimes[t]}' for t in range(1,len(daytimes))]
-    hourly.append('23:00-00:00')
-
-    # Total calls per hourly period
-    periodtotalincidents = []
-    for x in range(len(daytimes)):
-        if x != 23:
-            total_inc = df_tpt.iloc[df_tpt.index.indexer_between_time(daytimes[x],daytimes[x+1],include_end=False)].TYPE.count()
-            periodtotalincidents.append(total_inc)
-        else:
-            total_inc = df_tpt.iloc[df_tpt.index.indexer_between_time(daytimes[x],'00:00:00',include_end=False)].TYPE.count()
-            periodtotalincidents.append(total_inc)            
-    periodtotalincidents = pd.Series(periodtotalincidents,index=hourly,name='Total')
-
-    timegraph = px.bar(data_frame=periodtotalincidents,
-                       x=periodtotalincidents.index,
-                       y=periodtotalincidents,
-                       color=periodtotalincidents.index,
-                       color_discrete_map={i:'#cc0000' for i in periodtotalincidents.index},
-                       title=t,
-                       height=600,
-                       width=800,)
+    # Total calls per hourly period, read from the hour axis of the count cube
+    periodtotalincidents = pd.Series(hour_counts,index=hourly_labels(),name='Total')
+
+    timegraph = figure_payload.bar(periodtotalincidents,'#cc0000','Time Period','Total',t)
     timegraph.update_layout(xaxis_title='Time Period',
                             yaxis_title='Total Incidents per Period',
                             showlegend=False,
@@ -516,52 +658,449 @@ def time_period_totals(df_tpt,unit,t1,t2,mon):
     return timegraph
 
 
+
+# ~~~~~ District Incident Totals ~~~~~
+# incidents per response district (spatial_grid.py), the district polygons
+# of DFD_DISTRICTS_GEOJSON or the nearest station
+def district_totals(df_dist,unit):
+    if unit in companies[1:]:
+        counts = df_dist.district_counts(unit)
+        t = f'Total Incidents per District for {unit}'
+    else:
+        counts = df_dist.district_counts()
+        t = 'Total Incidents per District'
+    counts.index.name = 'District'
+
+    districtgraph = figure_payload.bar(counts,list(palettes.ramp('rd_bl',len(counts))),'District','Total',t)
+    districtgraph.update_layout(xaxis_title='District',
+                                yaxis_title='Total Incidents',
+                                showlegend=False,
+                                title={'x':.5,'xref':'paper','xanchor':'auto'},
+                                font={'color':'rgb(255,255,255)'},
+                                paper_bgcolor='#0f2537',
+                                plot_bgcolor='#abb6c2')
+    return districtgraph
+
+
+
+# ##### RESPONSE TIMES #####
+# Turnout, travel and response (dispatch to on scene) times of the dropdown
+# selection, read from the store's response time summaries (response_times.py)
+response_graphs = ['responsehour','responsedistrict','responsehistogram']
+percentile_colors = ['#2c7fb8','#df6919']
+
+def response_layout(figure):
+    figure.update_layout(showlegend=True,
+                         legend_title_text='',
+                         title={'x':.5,'xref':'paper','xanchor':'auto'},
+                         font={'color':'rgb(255,255,255)'},
+                         paper_bgcolor='#0f2537',
+                         plot_bgcolor='#abb6c2')
+    figure.update_xaxes(tickangle=45,
+                        tickfont=dict(size=10))
+    return figure
+
+# the incident data has no unit times, the graph only says so
+def no_response_times(t):
+    figure = figure_payload.bar(pd.Series([],dtype=float),'#cc0000','','',t)
+    figure.add_annotation(text='Dispatch, en route and on scene times are not in the incident data',
+                          xref='paper',yref='paper',x=.5,y=.5,showarrow=False)
+    return response_layout(figure)
+
+# summary of the selection for the unit (or every unit), None without unit times
+def response_summary(df_rt,unit):
+    if not df_rt.store.response_times.available:
+        return None
+    return df_rt.response_summary(unit if unit in companies[1:] else None)
+
+def response_title(t,summary,interval='Response'):
+    if summary.incidents[interval] == 0:
+        return f'{t}<br>no incidents with {interval.lower()} times'
+    p50, p90 = summary.overall.loc[interval]/60
+    return f'{t}<br>median {p50:.1f} min, 90th percentile {p90:.1f} min'
+
+def response_hourly(df_rt,unit):
+    t = 'Response Time per Hourly Period' + (f' for {unit}' if unit in companies[1:] else '')
+    summary = response_summary(df_rt,unit)
+    if summary is None:
+        return no_response_times(t)
+    percentiles = (summary.hour['Response']/60).round(2)
+    graph = figure_payload.grouped_bar(percentiles,percentile_colors,'Time Period','Minutes',
+                                       response_title(t,summary))
+    return response_layout(graph)
+
+def response_districts(df_rt,unit):
+    t = 'Response Time per District' + (f' for {unit}' if unit in companies[1:] else '')
+    summary = response_summary(df_rt,unit)
+    if summary is None:
+        return no_response_times(t)
+    percentiles = (summary.district['Response']/60).round(2)
+    graph = figure_payload.grouped_bar(percentiles,percentile_colors,'District','Minutes',
+                                       response_title(t,summary))
+    return response_layout(graph)
+
+def response_histogram(df_rt,unit):
+    t = 'Turnout and Travel Times' + (f' for {unit}' if unit in companies[1:] else '')
+    summary = response_summary(df_rt,unit)
+    if summary is None:
+        return no_response_times(t)
+    graph = figure_payload.grouped_bar(summary.histogram[['Turnout','Travel']],['#cc0000','#2c7fb8'],
+                                       'Minutes','Incidents',response_title(t,summary,'Turnout'))
+    graph.update_layout(barmode='overlay')
+    graph.update_traces(opacity=.7)
+    return response_layout(graph)
+
+
+
+# ~~~~~ Dropdown Graphs ~~~~~
+# The dropdown graphs and the response time graphs share one callback: the
+# dropdown selection is filtered once and handed to every figure builder that
+# misses the figure cache, the response times are counted from its rows.
+# Filter and builder times go to the figure cache stats and, with debug on, to
+# the Server-Timing header shown in the Dash dev tools.
+dropdown_graphs = ['densitymap','incidentlocation','incidenttype','timeperiod','districtincidents']
+# redrawn in the browser, the server only draws them for date ranges (clientside.py)
+clientside_graphs = ['incidentlocation','incidenttype','timeperiod'] if clientside.enabled else []
+# drawn by a background callback when no cache has them (background.py)
+background_graphs = [graph for graph in ['densitymap','incidentlocation']
+                     if background.enabled and graph not in clientside_graphs]
+
+def date_range_title(dates):
+    start, end = dates
+    if start and end:
+        return f'<br>{start} to {end}'
+    return f'<br>from {start}' if start else f'<br>through {end}'
+
+# one dropdown graph drawn from a filtered selection (store.query())
+def build_figure(graph,selection,time1_value,time2_value,month_value,company_value,view=None):
+    if graph == 'densitymap':
+        return incident_heat_map(selection,company_value,view)
+    elif graph == 'incidentlocation':
+        return incident_locations(selection,company_value,time1_value,time2_value,month_value)
+    elif graph == 'incidenttype':
+        return incident_type_total(selection,company_value)
+    elif graph == 'timeperiod':
+        return time_period_totals(selection,company_value,time1_value,time2_value,month_value)
+    elif graph == 'districtincidents':
+        return district_totals(selection,company_value)
+    elif graph == 'responsehour':
+        return response_hourly(selection,company_value)
+    elif graph == 'responsedistrict':
+        return response_districts(selection,company_value)
+    return response_histogram(selection,company_value)
+
+# filter and figure times of a callback to the Server-Timing header and /metrics
+def record_timings(callback,timings):
+    for name, seconds in timings.items():
+        dash.ctx.record_timing(name,seconds)
+        if name == 'filter':
+            metrics.phase(callback,'filter',seconds)
+        else:
+            metrics.phase(callback,'figure',seconds,figure=name)
+
+# the dropdown selection every graph of a callback is drawn from
+def query_selection(time1_value,time2_value,month_value,dates=None,store=None):
+    return (store or get_store()).query(hours_dict[time1_value],
+                                        hours_dict[time2_value],
+                                        months[month_value],
+                                        dates)
+
+# one dropdown graph as sent to the browser
+def render_figure(graph,selection,time1_value,time2_value,month_value,company_value,dates=None,view=None):
+    figure = build_figure(graph,selection,time1_value,time2_value,month_value,company_value,view)
+    if dates is not None:
+        figure.update_layout(title_text=f'{figure.layout.title.text}{date_range_title(dates)}')
+    # cached and sent as a plain dict with typed arrays
+    return figure_payload.compact(figure)
+
+# graphs in deferred are only looked up, they are None when no cache has them
+def dropdown_figures(time1_value,time2_value,month_value,company_value,dates=None,relayout_data=None,
+                     graphs=dropdown_graphs,deferred=()):
+    store = load_data()
+    key = figure_key(time1_value,time2_value,month_value,company_value,dates)
+    view = detail_view(relayout_data)
+    selection = None
+    figures = []
+    timings = {}
+    for graph in graphs:
+        graph_key = key + (store.version,) + ((view,) if graph == 'densitymap' else ())
+        figure = figure_cache.get(graph,graph_key)
+        if figure is None and (graph != 'densitymap' or view is None):
+            figure = precomputed.get(graph,key,months[month_value],store)
+            if figure is not None:
+                figure_cache.put(graph,graph_key,figure)
+        if figure is None and graph not in deferred:
+            if selection is None:
+                start = time.perf_counter()
+                selection = query_selection(time1_value,time2_value,month_value,dates,store)
+                timings['filter'] = time.perf_counter() - start
+            start = time.perf_counter()
+            figure = render_figure(graph,selection,time1_value,time2_value,month_value,company_value,dates,view)
+            timings[graph] = time.perf_counter() - start
+            figure_cache.put(graph,graph_key,figure,timings[graph])
+        figures.append(figure)
+    return figures, timings
+
 @app.callback(
+    Output(component_id='densitymap',component_property='figure'),
+    Output(component_id='incidentlocation',component_property='figure'),
+    Output(component_id='incidenttype',component_property='figure'),
     Output(component_id='timeperiod',component_property='figure'),
+    Output(component_id='districtincidents',component_property='figure'),
+    Output(component_id='responsehour',component_property='figure'),
+    Output(component_id='responsedistrict',component_property='figure'),
+    Output(component_id='responsehistogram',component_property='figure'),
+    Output(component_id='background_request',component_property='data'),
+    Output(component_id='map_mode',component_property='data'),
     Input(component_id='time1',component_property='value'),
     Input(component_id='time2',component_property='value'),
     Input(component_id='month',component_property='value'),
-    Input(component_id='company',component_property='value'))
-def timeperiod_bargraph(time1_value,time2_value,month_value,company_value):
-    tp_bar = time_period_totals(IncidentData(hours_dict[time1_value],
-                                            hours_dict[time2_value],
-                                            months[month_value]),
-                                            company_value,
-                                            time1_value,
-                                            time2_value,
-                                            month_value)
-
-    return tp_bar
+    Input(component_id='company',component_property='value'),
+    Input(component_id='dates',component_property='start_date'),
+    Input(component_id='dates',component_property='end_date'),
+    Input(component_id='densitymap',component_property='relayoutData'),
+    State(component_id='map_mode',component_property='data'))
+def dropdown_graphs_update(time1_value,time2_value,month_value,company_value,start_date,end_date,relayout_data,
+                           map_mode):
+    metrics.callback('dropdown_graphs')
+    dates = date_range_value(start_date,end_date)
+    mode = 'cells' if detail_view(relayout_data) is None else 'incidents'
+    # panning or zooming the map only redraws the map, and only when it shows
+    # incidents: the grid cells of the whole selection do not change with the view
+    if dash.ctx.triggered_id == 'densitymap':
+        if mode == 'cells' and map_mode == 'cells':
+            raise dash.exceptions.PreventUpdate
+        graphs = ['densitymap']
+    else:
+        graphs = [graph for graph in dropdown_graphs + response_graphs
+                  if dates is not None or graph not in clientside_graphs]
+    figures, timings = dropdown_figures(time1_value,time2_value,month_value,company_value,dates,
+                                        relayout_data,graphs=graphs,deferred=background_graphs)
+    record_timings('dropdown_graphs',timings)
+    drawn = dict(zip(graphs,figures))
+    # graphs no cache has are drawn by the background callback
+    missing = [graph for graph in graphs if drawn[graph] is None]
+    request = dash.no_update
+    if missing:
+        request = {'inputs':[time1_value,time2_value,month_value,company_value,start_date,end_date],
+                   'relayout':relayout_data,
+                   'graphs':missing}
+    return [dash.no_update if drawn.get(graph) is None else drawn[graph]
+            for graph in dropdown_graphs + response_graphs] + [request,mode]
+
+# ~~~~~ Background Graphs ~~~~~
+# With DFD_BACKGROUND=1 (background.py) the map and location graphs missing
+# from the caches are drawn in a background job process (only the map with
+# DFD_CLIENTSIDE=1, the browser draws the location graph). A dropdown change
+# cancels the running job, a pan or zoom replaces it. Jobs wait for one of the
+# DFD_BACKGROUND_WORKERS slots and report their progress under the dropdowns.
+# Finished figures without a zoomed map view or date range go to the
+# precomputed store, where every worker finds them.
+if background.enabled:
+    background_names = {'densitymap':'heat map','incidentlocation':'location graph'}
+
+    @app.callback(
+        [Output(component_id=graph,component_property='figure',allow_duplicate=True)
+         for graph in background_graphs],
+        Input(component_id='background_request',component_property='data'),
+        background=True,
+        manager=background.manager(),
+        interval=500,
+        progress=Output(component_id='background_status',component_property='children'),
+        progress_default='',
+        running=[(Output(component_id=graph,component_property='style'),{'opacity':.5},{'opacity':1})
+                 for graph in background_graphs],
+        cancel=[Input(component_id=c,component_property='value') for c in ('time1','time2','month','company')] +
+               [Input(component_id='dates',component_property=p) for p in ('start_date','end_date')],
+        prevent_initial_call=True)
+    def background_graphs_update(set_progress,request):
+        time1_value,time2_value,month_value,company_value,start_date,end_date = request['inputs']
+        dates = date_range_value(start_date,end_date)
+        view = detail_view(request['relayout'])
+        figures = {}
+        with background.slot(lambda: set_progress('Waiting for a free worker...')):
+            set_progress(f"Drawing the {' and '.join(background_names[g] for g in request['graphs'])}...")
+            selection = query_selection(time1_value,time2_value,month_value,dates)
+            for graph in request['graphs']:
+                figures[graph] = render_figure(graph,selection,time1_value,time2_value,month_value,
+                                               company_value,dates,view)
+                if dates is None and (graph != 'densitymap' or view is None):
+                    precomputed.put(graph,figure_key(time1_value,time2_value,month_value,company_value),
+                                    months[month_value],figures[graph],selection.store)
+        return [figures.get(graph,dash.no_update) for graph in background_graphs]
+
+# ~~~~~ Client Side Graphs ~~~~~
+# With DFD_CLIENTSIDE=1 (clientside.py) the page gets the store's count cubes
+# once per data version and assets/clientside.js redraws the location, type
+# and hourly graphs from them on every dropdown change without the server.
+# the count cubes and figure styles the client side graphs are drawn from
+def client_aggregate_data(store):
+    selection = store.query()
+    figures = {'incidentlocation':incident_locations(selection,companies[0],'--','--','--'),
+               'incidenttype':incident_type_total(selection,companies[0]),
+               'timeperiod':time_period_totals(selection,companies[0],'--','--','--')}
+    return clientside.aggregate(store,bar_colors,figures,
+                                companies=companies,
+                                times=times,
+                                hours=hours_dict,
+                                monthname=monthname,
+                                hourly_labels=hourly_labels())
+
+if clientside.enabled:
+    @app.callback(
+        Output(component_id='aggregate',component_property='data'),
+        Input(component_id='data_version',component_property='data'))
+    @figure_cache.cached('aggregate',lambda version: load_data().version)
+    def client_aggregate(version):
+        metrics.callback('client_aggregate')
+        return client_aggregate_data(load_data())
+
+    app.clientside_callback(
+        ClientsideFunction(namespace='dfd',function_name='dropdownGraphs'),
+        Output(component_id='incidentlocation',component_property='figure',allow_duplicate=True),
+        Output(component_id='incidenttype',component_property='figure',allow_duplicate=True),
+        Output(component_id='timeperiod',component_property='figure',allow_duplicate=True),
+        Input(component_id='time1',component_property='value'),
+        Input(component_id='time2',component_property='value'),
+        Input(component_id='month',component_property='value'),
+        Input(component_id='company',component_property='value'),
+        Input(component_id='dates',component_property='start_date'),
+        Input(component_id='dates',component_property='end_date'),
+        Input(component_id='aggregate',component_property='data'),
+        prevent_initial_call=True)
 
 # ~~~~~ Pie Chart ~~~~~
 
-def pie_location(i): 
-    df_pie1 = IncidentData('','','').all()
-    locations = df_pie1['LOCATION'].value_counts()[df_pie1['LOCATION'].value_counts()>14]
-    loc_type = df_pie1[df_pie1['LOCATION'].str.contains(locations.index[i])]
-    # those locations response types
-    loc_pie = px.pie(loc_type,
-                 names='TYPE',
-                 color='TYPE',
-                 color_discrete_sequence=px.colors.sequential.YlOrRd,
-                 title=f'Types of Incident Responses to {locations.index[i]}',
-                 height=600,
-                 width=800)
-    loc_pie.update_traces(textinfo='value')
-    loc_pie.update_layout(legend_font=dict(size=10),
-                          legend_y=.5,
-                          font={'color':'rgb(255,255,255)'},
-                          paper_bgcolor='#0f2537')
+def pie_location(loc_codes,label,rows=None): 
+    store = get_store()
+    # exact rows for the location codes (every code of the dropdown label),
+    # read from the location index, or the rows of a selection (rows) at
+    # those locations
+    with metrics.time('pie_freq_loc_type','filter'):
+        if rows is None:
+            codes = store.type_codes[store.locations.rows(loc_codes)]
+        else:
+            codes = store.type_codes[rows[np.isin(store.location_codes[rows],loc_codes)]]
+        # incidents without a type are left out, like the type graph does
+        codes = codes[store.type_names.notna()[codes]]
+    # those locations response types, counted in order of first appearance
+    with metrics.time('pie_freq_loc_type','figure'):
+        types, first = np.unique(codes,return_index=True)
+        types = types[np.argsort(first)]
+        type_counts = pd.Series(np.bincount(codes,minlength=len(store.type_names))[types],
+                                index=store.type_names[types])
+        loc_pie = figure_payload.pie(type_counts,
+                                     sequential.YlOrRd,
+                                     'TYPE',
+                                     f'Types of Incident Responses to {label}')
+        loc_pie.update_traces(textinfo='value')
+        loc_pie.update_layout(legend_font=dict(size=10),
+                              legend_y=.5,
+                              font={'color':'rgb(255,255,255)'},
+                              paper_bgcolor='#0f2537')
     
-    return loc_pie
+    return figure_payload.compact(loc_pie)
 
 @app.callback(
     Output(component_id='pie_freq_loc_type',component_property='figure'),
     Input(component_id='freq_loc',component_property='value'))
+@figure_cache.cached('pie_freq_loc_type',location_key)
 def freq_loc_type(freqloc):
-    loc_type_pie = pie_location(loc_count_dict[freqloc])
+    metrics.callback('pie_freq_loc_type')
+    load_data()
+    if freqloc is None:
+        raise dash.exceptions.PreventUpdate
+    loc_type_pie = precomputed.get('pie_freq_loc_type',(freqloc,),0)
+    if loc_type_pie is None:
+        loc_type_pie = pie_location(loc_count_dict[freqloc],freqloc)
 
     return loc_type_pie
 
+# WSGI entry point for production servers, e.g. gunicorn responses:server
+server = app.server
+
+# callback timings, payload sizes and figure cache counters on /metrics
+metrics.init_app(server)
+
+# new incidents POSTed to /ingest or dropped into DFD_INGEST_DIR; a lazy start
+# reads the drop directory in the warm-up thread
+ingest_watcher = ingest.init_app(server,poll=not lazy)
+
+# gzip / brotli callback responses, registered after the metrics so
+# dfd_response_bytes counts the compressed bytes
+compression.init_app(server)
+
+# Ready as soon as the app is imported, with the state of the data load
+@server.route('/healthz')
+def healthz():
+    if not data_ready.is_set():
+        return flask.jsonify(status='ok',data='loading')
+    store = get_store()
+    return flask.jsonify(status='ok',data='ready',incidents=len(store),version=store.version)
+
+# Pre-warm the most requested dropdown selections (the default view and each
+# unit) so the first page loads come straight from the cache. DFD_WARM_FIGURES
+# is '1' for a background thread, 'sync' to render them before the server
+# starts (gunicorn.conf.py, so every forked worker inherits them) or '0'.
+# A lazy start loads the data and then warms the figures in one thread.
+popular_inputs = [(hours[0],hours[0],monthname[0],unit) for unit in companies]
+warm_figures = os.environ.get('DFD_WARM_FIGURES','1')
+
+def warm_up():
+    load_data()
+    if ingest_watcher:
+        ingest_watcher.poll()
+    if warm_figures != '0':
+        figure_cache.warm(dropdown_figures,popular_inputs)
+
+if lazy:
+    threading.Thread(target=warm_up,daemon=True).start()
+elif warm_figures == 'sync':
+    figure_cache.warm(dropdown_figures,popular_inputs)
+elif warm_figures == '1':
+    threading.Thread(target=figure_cache.warm,
+                     args=(dropdown_figures,popular_inputs),
+                     daemon=True).start()
+
+# Precompute jobs (graphs, key, month) for precompute.py: every month and unit
+# without a time selection ('popular') or every dropdown combination ('all'),
+# plus the pie of every frequently responded location
+def precompute_jobs(scope):
+    periods = hours if scope == 'all' else hours[:1]
+    jobs = [(dropdown_graphs,figure_key(t1,t2,m,c),months[m])
+            for m in monthname for c in companies for t1 in periods for t2 in periods]
+    load_data()
+    jobs += [(['pie_freq_loc_type'],(loc,),0) for loc in tables['loc_count'].index]
+    return jobs
+
+def precompute_figures(key):
+    if len(key) == 1:
+        return {'pie_freq_loc_type':pie_location(loc_count_dict[key[0]],key[0])}
+    return dict(zip(dropdown_graphs,dropdown_figures(*key)[0]))
+
+# DFD_PRECOMPUTE=popular or all rebuilds the precomputed figures in the
+# background after every data load
+if os.environ.get('DFD_PRECOMPUTE','0') in ('popular','all'):
+    precomputer = precompute.Precomputer(os.environ['DFD_PRECOMPUTE'])
+    on_reload(precomputer.trigger)
+    precomputer.trigger()
+
+@metrics.collector
+def figure_cache_metrics():
+    stats = figure_cache.stats()
+    lines = []
+    for counter in ['hits','misses']:
+        lines.append(f'# TYPE dfd_figure_cache_{counter}_total counter')
+        lines.extend(f'dfd_figure_cache_{counter}_total{{figure="{figure}"}} {s[counter]}'
+                     for figure, s in stats.items())
+    lines.append('# TYPE dfd_figure_cache_entries gauge')
+    lines.append(f'dfd_figure_cache_entries {len(figure_cache)}')
+    status = precomputed.figure_store.status()
+    for name in ['done','total','seconds','bytes']:
+        if name in status:
+            lines.append(f'# TYPE dfd_precompute_{name} gauge')
+            lines.append(f'dfd_precompute_{name} {status[name]}')
+    return lines
+
 if __name__ == '__main__':
     app.run(debug=True)
@@ -0,0 +1,217 @@
+import functools, json, os
+import numpy as np
+import pandas as pd
+
+# Uniform grid over the incident coordinates for the heat map and the
+# spatial queries.
+# Every incident gets the code of the grid cell it falls in once per data
+# load, so a selection is sent to the browser as one weighted point per
+# occupied cell instead of one point (with its hover strings) per incident.
+#
+# The grid doubles as the spatial index: the rows sorted by cell, with the
+# offsets of every occupied cell (CSR), are built on the first query. A radius
+# or polygon query only reads the rows of the cells overlapping its bounding
+# box and tests those exactly (haversine distance, even-odd rule).
+#
+# Incidents are assigned to response districts: the district polygon they
+# fall in (a GeoJSON file of first-due districts, DFD_DISTRICTS_GEOJSON) or,
+# outside every polygon or without the file, the district of the nearest
+# station.
+
+# cell height in degrees of latitude, about 170 m; the width is scaled by
+# the latitude so the cells are roughly square on the map
+CELL_DEGREES = 0.0015
+
+# mean earth radius and the meters in a degree of latitude
+EARTH_RADIUS = 6371008.8
+DEGREE_METERS = EARTH_RADIUS*np.pi/180
+
+# fire station of each response district (the heat map centers on them)
+DISTRICTS = {'HQ': (41.393510, -73.455480),
+             'E23': (41.407951, -73.436729),
+             'E24': (41.413050, -73.422240),
+             'E25': (41.427157, -73.504407),
+             'E26': (41.373615, -73.487025)}
+
+
+# great circle distance in meters
+def haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = (np.radians(v) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1)/2)**2 + np.cos(lat1)*np.cos(lat2)*np.sin((lon2 - lon1)/2)**2
+    return 2*EARTH_RADIUS*np.arcsin(np.sqrt(a))
+
+
+# code (position in DISTRICTS) of the nearest station for every point, -1
+# without coordinates; distances are compared on a plane scaled by the
+# latitude, which ranks them like haversine across one city
+def nearest_district(latitude, longitude):
+    latitude = np.asarray(latitude, dtype=np.float64)
+    longitude = np.asarray(longitude, dtype=np.float64)
+    centers = np.array(list(DISTRICTS.values()))
+    scale = np.cos(np.radians(centers[:, 0].mean()))
+    codes = np.full(len(latitude), -1, dtype=np.int8)
+    best = np.full(len(latitude), np.inf)
+    for code, (lat, lon) in enumerate(centers):
+        distance = (latitude - lat)**2 + ((longitude - lon)*scale)**2
+        closer = distance < best
+        codes[closer] = code
+        best[closer] = distance[closer]
+    return codes
+
+
+# True for the points inside a polygon given as rings of (lat, lon) vertices;
+# by the even-odd rule the rings after the outline cut holes. Only the points
+# inside the bounding box are tested against the edges.
+def points_in_polygon(latitude, longitude, rings):
+    latitude = np.asarray(latitude, dtype=np.float64)
+    longitude = np.asarray(longitude, dtype=np.float64)
+    vertices = np.concatenate([np.asarray(ring, dtype=np.float64) for ring in rings])
+    (lat_min, lon_min), (lat_max, lon_max) = vertices.min(axis=0), vertices.max(axis=0)
+    candidates = np.flatnonzero((latitude >= lat_min) & (latitude <= lat_max) &
+                                (longitude >= lon_min) & (longitude <= lon_max))
+    lat, lon = latitude[candidates], longitude[candidates]
+    odd = np.zeros(len(candidates), dtype=bool)
+    for ring in rings:
+        ring = np.asarray(ring, dtype=np.float64)
+        for (lat1, lon1), (lat2, lon2) in zip(ring, np.roll(ring, -1, axis=0)):
+            crosses = (lat1 > lat) != (lat2 > lat)
+            if crosses.any():
+                # longitude where the edge crosses each point's latitude
+                at = lon1 + (lat[crosses] - lat1)*(lon2 - lon1)/(lat2 - lat1)
+                odd[crosses] ^= lon[crosses] < at
+    inside = np.zeros(len(latitude), dtype=bool)
+    inside[candidates[odd]] = True
+    return inside
+
+
+# {district: [polygon rings, ...]} of a GeoJSON file of (Multi)Polygon
+# features named after their station ('name' property, a DISTRICTS key)
+@functools.lru_cache(maxsize=None)
+def district_polygons(path=None):
+    path = path or os.environ.get('DFD_DISTRICTS_GEOJSON')
+    if not path:
+        return {}
+    with open(path) as f:
+        features = json.load(f)['features']
+    polygons = {}
+    for feature in features:
+        name = feature['properties']['name']
+        if name not in DISTRICTS:
+            raise ValueError(f'{path}: district {name!r} is not one of {list(DISTRICTS)}')
+        geometry = feature['geometry']
+        parts = [geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates']
+        # GeoJSON positions are (lon, lat)
+        polygons.setdefault(name, []).extend([[(lat, lon) for lon, lat, *_ in ring] for ring in part]
+                                             for part in parts)
+    return polygons
+
+
+# district code of every point: the district polygon it is in, else the
+# nearest station's
+def assign_districts(latitude, longitude, polygons=None):
+    polygons = district_polygons() if polygons is None else polygons
+    codes = nearest_district(latitude, longitude)
+    for code, name in enumerate(DISTRICTS):
+        for rings in polygons.get(name, []):
+            codes[points_in_polygon(latitude, longitude, rings)] = code
+    return codes
+
+
+class SpatialGrid:
+
+    def __init__(self, latitude, longitude, cell_degrees=CELL_DEGREES):
+        self.latitude = np.asarray(latitude, dtype=np.float64)
+        self.longitude = np.asarray(longitude, dtype=np.float64)
+        valid = np.isfinite(self.latitude) & np.isfinite(self.longitude)
+        if valid.any():
+            self.lat0 = self.latitude[valid].min()
+            self.lon0 = self.longitude[valid].min()
+            mid = np.radians(self.latitude[valid].mean())
+        else:
+            self.lat0 = self.lon0 = mid = 0.0
+        self.dlat = cell_degrees
+        self.dlon = cell_degrees / np.cos(mid)
+        self.n_cols = 1
+        self.cells = np.full(len(self.latitude), -1, dtype=np.int64)
+        self._index = None
+        self.add(np.flatnonzero(valid))
+
+    # place new rows on the grid (rows outside the current extent grow it)
+    def add(self, rows):
+        rows = rows[np.isfinite(self.latitude[rows]) & np.isfinite(self.longitude[rows])]
+        if len(rows) == 0:
+            return
+        self._index = None
+        cols = np.floor((self.longitude[rows] - self.lon0) / self.dlon).astype(np.int64)
+        lines = np.floor((self.latitude[rows] - self.lat0) / self.dlat).astype(np.int64)
+        if (cols < 0).any() or (lines < 0).any() or cols.max() >= self.n_cols:
+            # extent changed, recompute every code against the new origin
+            valid = np.isfinite(self.latitude) & np.isfinite(self.longitude)
+            self.lat0 = min(self.lat0, self.latitude[rows].min())
+            self.lon0 = min(self.lon0, self.longitude[rows].min())
+            self.n_cols = int(np.floor((self.longitude[valid].max() - self.lon0) / self.dlon)) + 1
+            rows = np.flatnonzero(valid)
+            cols = np.floor((self.longitude[rows] - self.lon0) / self.dlon).astype(np.int64)
+            lines = np.floor((self.latitude[rows] - self.lat0) / self.dlat).astype(np.int64)
+        self.cells[rows] = lines*self.n_cols + cols
+
+    def extend(self, latitude, longitude):
+        start = len(self.latitude)
+        self.latitude = np.concatenate([self.latitude, np.asarray(latitude, dtype=np.float64)])
+        self.longitude = np.concatenate([self.longitude, np.asarray(longitude, dtype=np.float64)])
+        self.cells = np.concatenate([self.cells, np.full(len(latitude), -1, dtype=np.int64)])
+        self.add(np.arange(start, len(self.latitude)))
+
+    def cell_centers(self, cells):
+        lines, cols = np.divmod(cells, self.n_cols)
+        return self.lat0 + (lines + .5)*self.dlat, self.lon0 + (cols + .5)*self.dlon
+
+    # incident count per occupied cell for a row selection
+    def aggregate(self, rows):
+        cells = self.cells[rows]
+        cells, weights = np.unique(cells[cells >= 0], return_counts=True)
+        latitude, longitude = self.cell_centers(cells)
+        return pd.DataFrame({'LATITUDE': latitude.round(6),
+                             'LONGITUDE': longitude.round(6),
+                             'INCIDENTS': weights})
+
+    # (occupied cell ids, line and column of each, offsets, rows sorted by
+    # cell); a cell's rows are order[offsets[k]:offsets[k+1]]
+    def index(self):
+        index = self._index
+        if index is None:
+            valid = np.flatnonzero(self.cells >= 0)
+            order = valid[np.argsort(self.cells[valid], kind='stable')]
+            cells = self.cells[order]
+            starts = np.flatnonzero(np.diff(cells, prepend=-1))
+            ids = cells[starts]
+            lines, cols = np.divmod(ids, self.n_cols)
+            index = self._index = (ids, lines, cols, np.append(starts, len(order)), order)
+        return index
+
+    # rows of the cells overlapping a latitude / longitude box, sorted
+    def box_rows(self, lat_min, lat_max, lon_min, lon_max):
+        ids, lines, cols, offsets, order = self.index()
+        pick = np.flatnonzero((lines >= np.floor((lat_min - self.lat0) / self.dlat)) &
+                              (lines <= np.floor((lat_max - self.lat0) / self.dlat)) &
+                              (cols >= np.floor((lon_min - self.lon0) / self.dlon)) &
+                              (cols <= np.floor((lon_max - self.lon0) / self.dlon)))
+        starts, lengths = offsets[pick], offsets[pick + 1] - offsets[pick]
+        # the picked cells' slices of order in one gather
+        positions = np.arange(lengths.sum()) + np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return np.sort(order[positions])
+
+    # rows within meters of a point, sorted
+    def within(self, latitude, longitude, meters):
+        dlat = meters / DEGREE_METERS
+        dlon = dlat / max(np.cos(np.radians(latitude)), 1e-6)
+        rows = self.box_rows(latitude - dlat, latitude + dlat, longitude - dlon, longitude + dlon)
+        distance = haversine(latitude, longitude, self.latitude[rows], self.longitude[rows])
+        return rows[distance <= meters]
+
+    # rows inside a polygon of (lat, lon) rings (see points_in_polygon), sorted
+    def in_polygon(self, rings):
+        vertices = np.concatenate([np.asarray(ring, dtype=np.float64) for ring in rings])
+        (lat_min, lon_min), (lat_max, lon_max) = vertices.min(axis=0), vertices.max(axis=0)
+        rows = self.box_rows(lat_min, lat_max, lon_min, lon_max)
+        return rows[points_in_polygon(self.latitude[rows], self.longitude[rows], rings)]
@@ -0,0 +1,5 @@
+import os, sys
+
+# the modules are top level scripts; the synthetic incidents come from the benchmarks
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'benchmarks')]
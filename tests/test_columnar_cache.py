@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+import columnar_cache
+import synthetic_data
+
+
+def memory_mapped(array):
+    while array is not None and not isinstance(array, np.memmap):
+        array = array.base
+    return array is not None
+
+
+# the text columns load as categoricals over the memory-mapped codes, not copies
+def test_category_codes_stay_memory_mapped(tmp_path):
+    frame, units = synthetic_data.incidents(2000, seed=1)
+    columnar_cache.save(frame, units, str(tmp_path), {'sha1': '0' * 40})
+    loaded, _ = columnar_cache.load(str(tmp_path))
+    categories = [name for name in loaded if loaded[name].dtype == 'category']
+    assert categories
+    for name in categories:
+        codes = loaded[name].cat.codes.values
+        assert memory_mapped(codes), name
+        assert (loaded[name].astype(object).fillna('') == frame[name].astype(object).fillna('')).all()
+
+
+# the same integer type Categorical keeps the codes in
+def test_code_dtype_matches_pandas():
+    for n in (1, 126, 127, 128, 32766, 32767, 40000):
+        codes = pd.Categorical.from_codes(np.zeros(1, dtype=np.int64), categories=range(n)).codes
+        assert columnar_cache.code_dtype(n) == codes.dtype, n
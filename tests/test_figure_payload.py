@@ -0,0 +1,23 @@
+import os
+import dash
+import plotly
+from dash import dcc
+import figure_payload
+
+
+# the bundle the typed arrays are gated on is the one the Dash app lists
+def test_served_plotlyjs_is_the_one_dash_serves():
+    dash.Dash(__name__)
+    packages = {'dash': os.path.dirname(dash.__file__), 'plotly': os.path.dirname(plotly.__file__)}
+    served = [os.path.join(packages[script['namespace']], script['relative_package_path'])
+              for script in dcc._js_dist if script['relative_package_path'].endswith('plotly.min.js')]
+    assert served and os.path.samefile(served[0], figure_payload.served_plotlyjs_path())
+
+
+def test_plotlyjs_version_from_the_bundle_header(tmp_path):
+    path = tmp_path / 'plotly.min.js'
+    path.write_text('/**\n* plotly.js v2.35.2\n* Copyright 2012-2024, Plotly, Inc.\n*/\n')
+    assert figure_payload.plotlyjs_version(path) == (2, 35)
+    path.write_text('!function(){}')
+    assert figure_payload.plotlyjs_version(path) == (0, 0)
+    assert figure_payload.plotlyjs_version(tmp_path / 'missing.js') == (0, 0)
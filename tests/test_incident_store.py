@@ -0,0 +1,167 @@
+import json
+import numpy as np
+import pandas as pd
+import pytest
+import columnar_cache
+import incident_store
+import synthetic_data
+from incident_store import CategoryIndex, IncidentStore, get_store, set_store
+from ingest import DropDirectory
+from unit_mask import UnitMask
+
+SELECTIONS = [('', '', 0), ('08:00:00', '17:00:00', 5), ('22:00:00', '03:00:00', 0), ('08:30:00', '', 7)]
+
+
+@pytest.fixture(scope='module')
+def incidents():
+    frame, units = synthetic_data.incidents(4000, seed=1)
+    # the last rows bring a unit, a type and a location the first ones do not have
+    units = units.copy()
+    units.iloc[:3000, -1] = 0
+    frame = frame.copy()
+    frame.iloc[3500:, frame.columns.get_loc('TYPE')] = 'NEW TYPE'
+    frame.iloc[3600:, frame.columns.get_loc('LOCATION')] = '1 NEW ST Danbury, CT'
+    return frame, units
+
+
+def test_category_index_extended():
+    rng = np.random.default_rng(0)
+    # the new rows bring two more codes
+    codes = np.concatenate([rng.integers(0, 5, 300), rng.integers(0, 7, 200)])
+    index = CategoryIndex(codes[:300], 5).extended(codes[300:], 300, 7)
+    full = CategoryIndex(codes, 7)
+    assert np.array_equal(index.offsets, full.offsets)
+    assert np.array_equal(index.order, full.order)
+    for code in range(7):
+        assert np.array_equal(index.rows(code), np.flatnonzero(codes == code))
+
+
+def assert_same_store(store, full):
+    pd.testing.assert_frame_equal(store.frame, full.frame)
+    assert store.unit_names == full.unit_names
+    assert np.array_equal(store.unit_mask.matrix(), full.unit_mask.matrix())
+    assert store.type_names.equals(full.type_names)
+    assert store.location_names.equals(full.location_names)
+    assert np.array_equal(store.type_codes, full.type_codes)
+    assert np.array_equal(store.location_codes, full.location_codes)
+    assert np.array_equal(store.partition_periods, full.partition_periods)
+    assert np.array_equal(store.partition_bounds, full.partition_bounds)
+    assert np.array_equal(store.district_codes, full.district_codes)
+    for month in range(12):
+        assert np.array_equal(store.month_index.rows(month), full.month_index.rows(month))
+    for code in range(len(full.location_names)):
+        assert np.array_equal(store.locations.rows(code), full.locations.rows(code))
+    for unit in [None] + full.unit_names:
+        for time1, time2, month in SELECTIONS:
+            assert np.array_equal(store.select(time1, time2, month, unit), full.select(time1, time2, month, unit))
+            pd.testing.assert_series_equal(store.cube.location_counts(time1, time2, month, unit),
+                                           full.cube.location_counts(time1, time2, month, unit))
+            pd.testing.assert_series_equal(store.cube.type_counts(time1, time2, month, unit, sort=False),
+                                           full.cube.type_counts(time1, time2, month, unit, sort=False))
+            assert np.array_equal(store.cube.hour_counts(time1, time2, month, unit),
+                                  full.cube.hour_counts(time1, time2, month, unit))
+    pd.testing.assert_series_equal(store.cube.unit_totals(), full.cube.unit_totals())
+    for hour in range(24):
+        assert np.array_equal(store.cube.on_hour[hour], full.cube.on_hour[hour])
+    rows = np.arange(len(full))
+    pd.testing.assert_frame_equal(store.grid.aggregate(rows), full.grid.aggregate(rows))
+    assert np.array_equal(store.response_times.seconds, full.response_times.seconds)
+    assert np.array_equal(store.response_times.cells, full.response_times.cells)
+
+
+@pytest.mark.parametrize('cut', [[3000], [3000, 3001, 3600]])
+def test_append_matches_a_new_store(incidents, cut):
+    frame, units = incidents
+    store = IncidentStore(frame.iloc[:cut[0]], units.iloc[:cut[0], :-1])
+    for start, end in zip(cut, cut[1:] + [len(frame)]):
+        appended = store.append(frame.iloc[start:end], units.iloc[start:end])
+        assert appended.version != store.version
+        store = appended
+    assert_same_store(store, IncidentStore(frame, units))
+
+
+def test_append_older_batch_rebuilds(incidents):
+    frame, units = incidents
+    old = np.arange(len(frame)) % 10 == 3
+    store = IncidentStore(frame[~old], units[~old]).append(frame[old], units[old])
+    assert_same_store(store, IncidentStore(pd.concat([frame[~old], frame[old]]),
+                                           pd.concat([units[~old], units[old]])))
+
+
+def test_append_leaves_the_store_unchanged(incidents):
+    frame, units = incidents
+    store = IncidentStore(frame.iloc[:3000], units.iloc[:3000])
+    counts = store.cube.location_counts()
+    store.append(frame.iloc[3000:], units.iloc[3000:])
+    assert len(store) == 3000
+    pd.testing.assert_series_equal(store.cube.location_counts(), counts)
+
+
+# multi-unit queries against matching the units in each incident's UNITS list
+@pytest.mark.parametrize('units_query', [['E22', 'T1'], ['TAC1', 'C30', 'E26'], ['SQ21']])
+def test_unit_mask_multi_unit_queries(incidents, units_query):
+    frame, units = incidents
+    mask = UnitMask.from_frame(units)
+    listed = pd.Series([','.join(units.columns[row > 0]) for row in units.to_numpy()])
+    responded = [listed.str.contains(rf'(?:^|,){unit}(?:,|$)') for unit in units_query]
+    assert np.array_equal(mask.has_all(units_query), np.logical_and.reduce(responded))
+    assert np.array_equal(mask.has_any(units_query), np.logical_or.reduce(responded))
+    rows = np.arange(100, 3900, 7)
+    assert np.array_equal(mask.has_all(units_query, rows), np.logical_and.reduce(responded)[rows])
+    assert np.array_equal(mask.has_any(units_query, rows), np.logical_or.reduce(responded)[rows])
+
+
+def memory_mapped(array):
+    while array is not None and not isinstance(array, np.memmap):
+        array = array.base
+    return array is not None
+
+
+@pytest.mark.parametrize('fold_rows', [1 << 16, 700])
+def test_append_to_a_cached_store_keeps_its_columns(incidents, tmp_path, monkeypatch, fold_rows):
+    monkeypatch.setattr(incident_store, 'FOLD_ROWS', fold_rows)
+    frame, units = incidents
+    columnar_cache.save(frame.iloc[:3000], units.iloc[:3000], str(tmp_path), {'sha1': '0' * 40})
+    cached = IncidentStore(*columnar_cache.load(str(tmp_path)))
+    store = cached
+    for start, end in [(3000, 3500), (3500, 4000)]:
+        store = store.append(frame.iloc[start:end], units.iloc[start:end])
+    categorical = [name for name in frame if isinstance(cached.frame[name].dtype, pd.CategoricalDtype)]
+    assert 'TYPE' in categorical and 'LOCATION' in categorical
+    # the loaded rows stay shared until the appended ones are folded in
+    assert (store.base_frame is cached.base_frame) == (fold_rows > 1000)
+    assert memory_mapped(cached.base_frame['TYPE'].cat.codes.values)
+    rows = np.arange(2900, 3700, 3)
+    for part in (store.frame, store.take(rows)):
+        for name in categorical:
+            assert isinstance(part[name].dtype, pd.CategoricalDtype), name
+    pd.testing.assert_frame_equal(store.take(rows), store.frame.iloc[rows])
+    assert store.times(rows).equals(store.frame.index[rows])
+    expected = frame.astype({name: object for name in categorical})
+    pd.testing.assert_frame_equal(store.frame.astype({name: object for name in categorical}), expected,
+                                  check_dtype=False)
+
+
+def records(frame, units):
+    batch = frame[['INCIDENT', 'LOCATION', 'ADDRESS', 'TYPE', 'LATITUDE', 'LONGITUDE']].copy()
+    batch.insert(0, 'TIME', frame.index.strftime('%Y-%m-%d %H:%M:%S'))
+    batch['UNITS'] = [','.join(units.columns[row > 0]) for row in units.to_numpy()]
+    return json.dumps(batch.to_dict('records')).encode()
+
+
+def test_drop_directory_retries_a_half_written_batch(incidents, tmp_path):
+    frame, units = incidents
+    set_store(IncidentStore(frame.iloc[:3000], units.iloc[:3000]))
+    data = records(frame.iloc[3000:3100], units.iloc[3000:3100])
+    path = tmp_path / '1-batch.json'
+    path.write_bytes(data[:len(data) // 2])
+
+    drop = DropDirectory(str(tmp_path))
+    assert drop.poll() == 0
+    assert '1-batch.json' not in drop.seen and '1-batch.json' in drop.failed
+    assert drop.poll() == 0
+
+    path.write_bytes(data)
+    assert drop.poll() == 100
+    assert len(get_store()) == 3100 and '1-batch.json' in drop.seen
+    assert drop.poll() == 0
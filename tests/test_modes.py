@@ -0,0 +1,50 @@
+import json, os, subprocess, sys
+import pytest
+from conftest import ROOT
+
+# responses.py reads its modes at import, so every mode gets its own process
+# serving synthetic incidents
+
+SCRIPT = """
+import json, sys
+sys.path[:0] = [{root!r}, {benchmarks!r}]
+import synthetic_data
+from incident_store import IncidentStore, set_store
+set_store(IncidentStore(*synthetic_data.incidents(2000)))
+import responses
+client = responses.server.test_client()
+pages = {{url: client.get(url).status_code for url in ('/', '/_dash-layout', '/_dash-dependencies')}}
+callbacks = json.loads(client.get('/_dash-dependencies').data)
+background = [c for c in callbacks if c['inputs'] == [{{'id': 'background_request', 'property': 'data'}}]]
+request = {{'inputs': ['--', '--', '--', 'ALL', None, None], 'relayout': None,
+            'graphs': responses.background_graphs}}
+figures = responses.background_graphs_update(lambda status: None, request)
+print(json.dumps({{'pages': pages,
+                  'graphs': responses.background_graphs,
+                  'outputs': background[0]['output'].strip('.').split('...'),
+                  'running': sorted(background[0]['running']['running']),
+                  'figures': len(figures)}}))
+"""
+
+
+def run_app(tmp_path, **env):
+    env = dict(os.environ, DFD_WARM_FIGURES='0', DFD_PRECOMPUTE='0',
+               DFD_PRECOMPUTE_DB=str(tmp_path / 'figures.sqlite'),
+               DFD_BACKGROUND_DIR=str(tmp_path / 'background'), **env)
+    script = SCRIPT.format(root=ROOT, benchmarks=os.path.join(ROOT, 'benchmarks'))
+    result = subprocess.run([sys.executable, '-c', script], env=env, cwd=tmp_path,
+                            capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+@pytest.mark.parametrize('clientside', ['0', '1'])
+def test_background_outputs_follow_background_graphs(tmp_path, clientside):
+    pytest.importorskip('diskcache')
+    app = run_app(tmp_path, DFD_BACKGROUND='1', DFD_CLIENTSIDE=clientside)
+    assert app['pages'] == {'/': 200, '/_dash-layout': 200, '/_dash-dependencies': 200}
+    graphs = ['densitymap'] if clientside == '1' else ['densitymap', 'incidentlocation']
+    assert app['graphs'] == graphs
+    assert [output.split('.')[0] for output in app['outputs']] == graphs
+    assert app['running'] == [f'{graph}.style' for graph in graphs]
+    assert app['figures'] == len(graphs)
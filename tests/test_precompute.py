@@ -0,0 +1,56 @@
+import json, os, subprocess, sys
+from conftest import ROOT
+
+# responses.py builds its precomputed figure store at import, so the app runs
+# in its own process with the figure store in a temporary directory
+
+SCRIPT = """
+import json, sys
+sys.path[:0] = [{root!r}, {benchmarks!r}]
+import figure_payload, precompute, synthetic_data
+from incident_store import IncidentStore, append_incidents, get_store, set_store
+set_store(IncidentStore(*synthetic_data.incidents(3000, seed=1)))
+import responses
+
+key = responses.figure_key('--', '--', 'May', 'ALL')
+jobs = [job for job in responses.precompute_jobs('popular') if job[1] == key]
+
+def build():
+    return precompute.build(responses.precomputed.figure_store, jobs, responses.precompute_figures,
+                            responses.precomputed.fingerprint, processes=1)
+
+def colors(figure):
+    return json.loads(figure_payload.to_json(figure))['data'][0]['marker']['color']
+
+def stored():
+    figure = responses.precomputed.get('incidentlocation', key, 5)
+    return None if figure is None else colors(figure)
+
+built = build()
+before = stored()
+may = precompute.month_fingerprints(get_store(), responses.figure_salt)[5]
+
+# October incidents at a new location, which becomes the busiest one
+frame, units = synthetic_data.incidents(400, seed=2, start='2023-10-02', days=3)
+frame['LOCATION'] = '1 NEW ST Danbury, CT'
+append_incidents(frame, units)
+stale = stored()
+rebuilt = build()
+live = responses.render_figure('incidentlocation', responses.query_selection('--', '--', 'May'),
+                               '--', '--', 'May', 'ALL', None, None)
+print(json.dumps({{'built': built, 'rebuilt': rebuilt, 'stale': stale,
+                  'may_unchanged': may == precompute.month_fingerprints(get_store(), responses.figure_salt)[5],
+                  'changed': before != stored(), 'matches_live': stored() == colors(live)}}))
+"""
+
+
+def test_new_incidents_in_another_month_recolor_precomputed_figures(tmp_path):
+    env = dict(os.environ, DFD_WARM_FIGURES='0', DFD_PRECOMPUTE='0',
+               DFD_PRECOMPUTE_DB=str(tmp_path / 'figures.sqlite'))
+    script = SCRIPT.format(root=ROOT, benchmarks=os.path.join(ROOT, 'benchmarks'))
+    result = subprocess.run([sys.executable, '-c', script], env=env, cwd=tmp_path,
+                            capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stderr
+    app = json.loads(result.stdout.splitlines()[-1])
+    assert app == {'built': 1, 'rebuilt': 1, 'stale': None, 'may_unchanged': True,
+                   'changed': True, 'matches_live': True}
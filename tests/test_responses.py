@@ -0,0 +1,48 @@
+import json, os, subprocess, sys
+from conftest import ROOT
+
+# the location pie of a dropdown label, drawn by the app in its own process
+
+SCRIPT = """
+import base64, json, sys
+import numpy as np
+sys.path[:0] = [{root!r}, {benchmarks!r}]
+import synthetic_data
+from incident_store import IncidentStore, set_store
+frame, units = synthetic_data.incidents(2000, seed=1)
+# two spellings of one address share the dropdown label, and some of its
+# incidents have no type
+location = frame.columns.get_loc('LOCATION')
+frame.iloc[:50, location] = '1 TEST RD Danbury, CT'
+frame.iloc[50:100, location] = '1 TEST RD DANBURY, CT'
+frame.iloc[:10, frame.columns.get_loc('TYPE')] = None
+set_store(IncidentStore(frame, units))
+import responses
+
+def values(array):
+    if isinstance(array, dict):
+        return np.frombuffer(base64.b64decode(array['bdata']), dtype=array['dtype']).tolist()
+    return list(array)
+
+label = '1 TEST RD '
+figure = responses.freq_loc_type(label)
+trace = figure['data'][0]
+print(json.dumps({{'options': label in responses.loc_count_dict,
+                  'title': figure['layout']['title']['text'],
+                  'labels': [str(name) for name in values(trace['labels'])],
+                  'total': int(sum(values(trace['values'])))}}))
+"""
+
+
+def test_location_pie_of_a_dropdown_label(tmp_path):
+    env = dict(os.environ, DFD_WARM_FIGURES='0', DFD_PRECOMPUTE='0',
+               DFD_PRECOMPUTE_DB=str(tmp_path / 'figures.sqlite'))
+    script = SCRIPT.format(root=ROOT, benchmarks=os.path.join(ROOT, 'benchmarks'))
+    result = subprocess.run([sys.executable, '-c', script], env=env, cwd=tmp_path,
+                            capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stderr
+    pie = json.loads(result.stdout.splitlines()[-1])
+    assert pie['options']
+    assert pie['title'] == 'Types of Incident Responses to 1 TEST RD '
+    assert 'nan' not in pie['labels'] and 'None' not in pie['labels']
+    assert pie['total'] == 90
@@ -0,0 +1,109 @@
+import json
+import numpy as np
+import pytest
+import synthetic_data
+from incident_store import IncidentStore
+from spatial_grid import (DISTRICTS, SpatialGrid, assign_districts, district_polygons, haversine,
+                          nearest_district)
+
+# the grid queries checked against testing every incident
+
+
+@pytest.fixture(scope='module')
+def store():
+    frame, units = synthetic_data.incidents(6000, seed=3)
+    store = IncidentStore(frame.iloc[:5000], units.iloc[:5000])
+    # appended rows extend the grid
+    return store.append(frame.iloc[5000:], units.iloc[5000:])
+
+
+# even-odd rule, one point at a time
+def inside(lat, lon, rings):
+    odd = False
+    for ring in rings:
+        for (lat1, lon1), (lat2, lon2) in zip(ring, ring[1:] + ring[:1]):
+            if (lat1 > lat) != (lat2 > lat) and lon < lon1 + (lat - lat1)*(lon2 - lon1)/(lat2 - lat1):
+                odd = not odd
+    return odd
+
+
+def test_within_matches_every_incident(store):
+    grid = store.grid
+    # a cell corner, so the circle spans the cells on every side of it
+    corner = (grid.lat0 + 20*grid.dlat, grid.lon0 + 30*grid.dlon)
+    centers = [corner, (41.3935, -73.4555), (41.44, -73.40), (41.34, -73.52)]
+    for lat, lon in centers:
+        distance = haversine(lat, lon, grid.latitude, grid.longitude)
+        for meters in (50, 170, 250, 1000):
+            expected = np.flatnonzero(distance <= meters)
+            assert np.array_equal(store.rows_within(lat, lon, meters), expected)
+        # a radius just past an incident's distance takes it in, just short leaves it out
+        meters = np.sort(distance)[25]
+        longer, shorter = (store.rows_within(lat, lon, meters*(1 + e)) for e in (1e-9, -1e-9))
+        assert np.array_equal(longer, np.flatnonzero(distance <= meters*(1 + 1e-9)))
+        assert np.array_equal(shorter, np.flatnonzero(distance <= meters*(1 - 1e-9)))
+        assert len(longer) > len(shorter)
+
+
+# an L shape (the concave corner cuts the middle out of its bounding box)
+# and a square with a square hole
+POLYGONS = [
+    [[(41.35, -73.52), (41.35, -73.42), (41.38, -73.42), (41.38, -73.48), (41.44, -73.48), (41.44, -73.52)]],
+    [[(41.36, -73.50), (41.36, -73.40), (41.45, -73.40), (41.45, -73.50)],
+     [(41.39, -73.47), (41.39, -73.43), (41.42, -73.43), (41.42, -73.47)]],
+]
+
+
+@pytest.mark.parametrize('rings', POLYGONS)
+def test_in_polygon_matches_every_incident(store, rings):
+    grid = store.grid
+    expected = np.flatnonzero([inside(lat, lon, rings) for lat, lon in zip(grid.latitude, grid.longitude)])
+    rows = store.rows_in_polygon(rings)
+    assert np.array_equal(rows, expected)
+    assert 0 < len(rows) < len(store)
+
+
+def test_in_polygon_concave_corner():
+    # points inside the bounding box of the L but outside the L
+    latitude = np.array([41.36, 41.40, 41.40, 41.43])
+    longitude = np.array([-73.45, -73.45, -73.50, -73.43])
+    grid = SpatialGrid(latitude, longitude)
+    assert list(grid.in_polygon(POLYGONS[0])) == [0, 2]
+
+
+def test_district_polygons_assign_districts(tmp_path):
+    lat, lon = DISTRICTS['E25']
+    # an E24 square around the E25 station, and an E26 multipolygon of two squares
+    features = [
+        {'type': 'Feature', 'properties': {'name': 'E24'},
+         'geometry': {'type': 'Polygon', 'coordinates': [[[lon - .01, lat - .01], [lon + .01, lat - .01],
+                                                          [lon + .01, lat + .01], [lon - .01, lat + .01]]]}},
+        {'type': 'Feature', 'properties': {'name': 'E26'},
+         'geometry': {'type': 'MultiPolygon', 'coordinates': [
+             [[[-73.40, 41.44], [-73.39, 41.44], [-73.39, 41.45], [-73.40, 41.45]]],
+             [[[-73.45, 41.33], [-73.44, 41.33], [-73.44, 41.34], [-73.45, 41.34]]]]}},
+    ]
+    path = tmp_path / 'districts.geojson'
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': features}))
+    polygons = district_polygons(str(path))
+    assert sorted(polygons) == ['E24', 'E26'] and len(polygons['E26']) == 2
+    # GeoJSON positions are (lon, lat)
+    assert polygons['E24'][0][0][0] == (lat - .01, lon - .01)
+
+    frame, _ = synthetic_data.incidents(3000, seed=4)
+    latitude, longitude = frame['LATITUDE'].to_numpy(), frame['LONGITUDE'].to_numpy()
+    codes = assign_districts(latitude, longitude, polygons)
+    expected = nearest_district(latitude, longitude)
+    names = list(DISTRICTS)
+    for name, parts in polygons.items():
+        for rings in parts:
+            expected[[inside(a, b, rings) for a, b in zip(latitude, longitude)]] = names.index(name)
+    assert np.array_equal(codes, expected)
+    assert (codes == names.index('E24')).any() and (codes == names.index('E26')).any()
+    assert assign_districts([lat], [lon], polygons)[0] == names.index('E24')
+
+    features[0]['properties']['name'] = 'E99'
+    path = tmp_path / 'unknown.geojson'
+    path.write_text(json.dumps({'type': 'FeatureCollection', 'features': features}))
+    with pytest.raises(ValueError):
+        district_polygons(str(path))
@@ -0,0 +1,17 @@
+# Time-of-day helpers for the dashboard graphs. The hourly counts themselves
+# are read from the hour axis of the count cubes (aggregates.py).
+
+# values the dropdowns use for "no selection"
+NO_SELECTION = ('', '--', 0, None)
+
+
+# convert 'HH:MM:SS' into seconds past midnight
+def seconds_of_day(hms):
+    h, m, s = (int(x) for x in hms.split(':'))
+    return h*3600 + m*60 + s
+
+
+# '00:00-01:00' ... '22:00-23:00', '23:00-00:00'
+def hourly_labels():
+    daytimes = [f'{x:02d}:00' for x in range(24)]
+    return [f'{daytimes[x]}-{daytimes[(x+1) % 24]}' for x in range(24)]
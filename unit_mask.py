@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+# Incident x unit assignments as a bitmask.
+# The units that responded to an incident are packed into ceil(units / 8)
+# bytes (bit k of a row is unit k), instead of one byte per unit in a boolean
+# matrix or one row number per assignment in per-unit row lists. Testing a
+# unit reads one byte of each selected row; a multi-unit query compares each
+# row's bytes with the query mask. More units only add a byte per incident
+# every eighth unit.
+
+
+class UnitMask:
+
+    def __init__(self, bits, names):
+        self.bits = bits
+        self.names = list(names)
+        self._codes = {name: k for k, name in enumerate(self.names)}
+
+    @classmethod
+    def from_frame(cls, units):
+        matrix = units.to_numpy() > 0
+        return cls(np.packbits(matrix, axis=1, bitorder='little'), units.columns)
+
+    def __len__(self):
+        return len(self.bits)
+
+    def _mask(self, units):
+        mask = np.zeros(self.bits.shape[1], dtype=np.uint8)
+        for unit in units:
+            code = self._codes[unit]
+            mask[code >> 3] |= 1 << (code & 7)
+        return mask
+
+    # True for the rows (all rows without rows) the unit responded to
+    def has(self, unit, rows=None):
+        code = self._codes[unit]
+        column = self.bits[:, code >> 3] if rows is None else self.bits[rows, code >> 3]
+        return column & (1 << (code & 7)) != 0
+
+    # True for the rows every one of the units responded to
+    def has_all(self, units, rows=None):
+        mask = self._mask(units)
+        bits = self.bits if rows is None else self.bits[rows]
+        return ((bits & mask) == mask).all(axis=1)
+
+    # True for the rows at least one of the units responded to
+    def has_any(self, units, rows=None):
+        mask = self._mask(units)
+        bits = self.bits if rows is None else self.bits[rows]
+        return (bits & mask).any(axis=1)
+
+    # the rows a unit responded to
+    def filter(self, rows, unit):
+        return rows[self.has(unit, rows)]
+
+    # incident x unit booleans
+    def matrix(self, rows=None):
+        bits = self.bits if rows is None else self.bits[rows]
+        return np.unpackbits(bits, axis=1, count=len(self.names), bitorder='little').astype(bool)
+
+    # incidents each unit responded to, for all rows or a selection
+    def totals(self, rows=None, chunk=1 << 20):
+        bits = self.bits if rows is None else self.bits[rows]
+        totals = np.zeros(len(self.names), dtype=np.int64)
+        for start in range(0, len(bits), chunk):
+            totals += np.unpackbits(bits[start:start + chunk], axis=1, count=len(self.names),
+                                    bitorder='little').sum(axis=0, dtype=np.int64)
+        return pd.Series(totals, index=self.names)
+
+    # 0/1 frame of the selected rows like IncidentData.unit_df()
+    def frame(self, rows, index):
+        return pd.DataFrame(self.matrix(rows).astype(np.uint8), index=index, columns=self.names)
+
+    def take(self, rows):
+        return UnitMask(self.bits[rows], self.names)
+
+    # a copy with the rows of a 0/1 unit frame appended, units not seen before
+    # get the next bits
+    def extended(self, units):
+        names = self.names + [u for u in units.columns if u not in self._codes]
+        new = np.packbits(units.reindex(columns=names, fill_value=0).to_numpy() > 0, axis=1, bitorder='little')
+        bits = self.bits
+        if bits.shape[1] < new.shape[1]:
+            bits = np.pad(bits, ((0, 0), (0, new.shape[1] - bits.shape[1])))
+        return UnitMask(np.concatenate([bits, new]), names)
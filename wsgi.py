@@ -0,0 +1,72 @@
+import json, os, threading, time
+
+# Fast starting WSGI entry point.
+# Importing responses.py (Dash, pandas, plotly and the layout) takes a second
+# or more, and a server only binds its port once the app it serves is
+# imported. This module imports nothing heavy: it binds at once, imports the
+# dashboard in a background thread with DFD_LAZY=1 (so the incident data is
+# loaded after the import, in the app's warm-up thread) and answers /healthz
+# while that runs. Other requests wait for the import.
+# The import thread is started in the process that serves: by gunicorn's
+# post_worker_init hook (gunicorn.conf.py) or else on the first request. A
+# thread started at import would run in the master of a preloading server
+# and not survive the fork, and forking in the middle of an import can leave
+# the workers with a held import lock.
+#   gunicorn -c gunicorn.conf.py wsgi:application      (with DFD_LAZY=1)
+#   python wsgi.py
+
+os.environ.setdefault('DFD_LAZY', '1')
+
+started = time.time()
+_imported = threading.Event()
+_server = None
+_error = None
+_pid = None
+_start_lock = threading.Lock()
+
+
+def _import_app():
+    global _server, _error
+    try:
+        import responses
+        _server = responses.server
+    except BaseException as error:
+        _error = error
+        raise
+    finally:
+        _imported.set()
+
+
+# import the dashboard in a thread of this process, once per process
+def start_import():
+    global _pid, started
+    with _start_lock:
+        if _pid != os.getpid():
+            _pid = os.getpid()
+            started = time.time()
+            threading.Thread(target=_import_app, daemon=True).start()
+
+
+def _json(start_response, http_status, **body):
+    data = json.dumps(body).encode()
+    start_response(http_status, [('Content-Type', 'application/json'), ('Content-Length', str(len(data)))])
+    return [data]
+
+
+def application(environ, start_response):
+    if _pid != os.getpid():
+        start_import()
+    if not _imported.is_set() and environ.get('PATH_INFO') == '/healthz':
+        return _json(start_response, '503 Service Unavailable', status='starting',
+                     seconds=round(time.time() - started, 3))
+    _imported.wait()
+    if _error is not None:
+        return _json(start_response, '500 Internal Server Error', status='error', error=repr(_error))
+    return _server(environ, start_response)
+
+
+if __name__ == '__main__':
+    from werkzeug.serving import run_simple
+    host, port = os.environ.get('DFD_BIND', '0.0.0.0:8050').rsplit(':', 1)
+    start_import()
+    run_simple(host, int(port), application, threaded=True)